@@ -0,0 +1,394 @@
+import os
+import math
+import tempfile
+from xml.dom.minidom import Document
+
+from . import Schema
+
+
+def bool2str(boolean):
+    if boolean:
+        return "true"
+    else:
+        return "false"
+
+
+def cage_file(settings, mesh = None):
+    """ The cage a low poly mesh file bakes with, '' for none. The cage the
+        user exported wins over the auto cage written from ray distances. """
+    if mesh is not None:
+        cage_path, auto_cage_path = mesh.cage_path, mesh.auto_cage_path
+    else:
+        cage_path, auto_cage_path = settings.cage_path if settings.use_cage else '', settings.auto_cage_path
+    return cage_path or (auto_cage_path if settings.use_auto_cage else '')
+
+
+def build_config(settings):
+    """ Build the xNormal settings document for the given BakeXNormalSettings """
+    
+    config = Document()
+    xml_settings = config.createElement("Settings") 
+    config.appendChild(xml_settings)
+    
+    #
+    # High Poly Mesh
+    #
+    
+    xml_highpoly = config.createElement("HighPolyModel")
+    xml_settings.appendChild(xml_highpoly)
+    
+    # One mesh per exported object, or the single high mesh file
+    high_paths = [mesh.path for mesh in settings.high_meshes] or [settings.high_path]
+    for high_path in high_paths:
+        xml_highpolymesh = config.createElement("Mesh")
+        xml_highpoly.appendChild(xml_highpolymesh)
+        
+        # Variables
+        xml_highpolymesh.setAttribute("IgnorePerVertexColor", bool2str(settings.high_ignore_per_vertex_color))
+        xml_highpolymesh.setAttribute("AverageNormals", str(settings.high_normals))
+        xml_highpolymesh.setAttribute("File", str(high_path))
+        xml_highpolymesh.setAttribute("Scale", str(settings.high_scale))
+    
+    #
+    # Low Poly Mesh
+    #
+    
+    xml_lowpoly = config.createElement("LowPolyModel")
+    xml_settings.appendChild(xml_lowpoly)
+    
+    # One mesh per separately exported object, or the single low mesh file
+    if settings.low_meshes:
+        low_meshes = [(mesh.path, mesh.normals, mesh.scale, cage_file(settings, mesh)) for mesh in settings.low_meshes]
+    else:
+        low_meshes = [(settings.low_path, settings.low_normals, settings.low_scale, cage_file(settings))]
+    for low_path, low_normals, low_scale, cage_path in low_meshes:
+        xml_lowpolymesh = config.createElement("Mesh")
+        xml_lowpoly.appendChild(xml_lowpolymesh)
+        
+        # Variables
+        xml_lowpolymesh.setAttribute("File", str(low_path))
+        xml_lowpolymesh.setAttribute("AverageNormals", str(low_normals))
+        xml_lowpolymesh.setAttribute("MatchUVs", bool2str(settings.low_match_uvs))
+        xml_lowpolymesh.setAttribute("UOffset", str(settings.low_offset_u))
+        xml_lowpolymesh.setAttribute("VOffset", str(settings.low_offset_v))
+        xml_lowpolymesh.setAttribute("Scale", str(low_scale))
+        
+        # Ray distances, unlimited if 0
+        if settings.ray_distance_front > 0:
+            xml_lowpolymesh.setAttribute("MaxRayDistanceFront", str(settings.ray_distance_front))
+        if settings.ray_distance_rear > 0:
+            xml_lowpolymesh.setAttribute("MaxRayDistanceBack", str(settings.ray_distance_rear))
+        
+        # If cagefile
+        if cage_path:
+            xml_lowpolymesh.setAttribute("CageFile", cage_path)
+            xml_lowpolymesh.setAttribute("UseCage", bool2str(True))
+        
+    #
+    # The Maps
+    #
+    
+    xml_genmaps = config.createElement("GenerateMaps")
+    xml_settings.appendChild(xml_genmaps)
+    
+    #common settings
+    xml_genmaps.setAttribute("Width", str(settings.width))
+    xml_genmaps.setAttribute("Height", str(settings.height))
+    xml_genmaps.setAttribute("EdgePadding", str(settings.padding))
+    xml_genmaps.setAttribute("BucketSize", str(settings.bucket_size))
+    xml_genmaps.setAttribute("AA", str(settings.anti_aliasing))
+    xml_genmaps.setAttribute("ClosestIfFails", bool2str(settings.use_closest_hit))
+    xml_genmaps.setAttribute("DiscardRayBackFacesHits", bool2str(settings.discard_back_faces))
+    xml_genmaps.setAttribute("File", str(settings.output))
+    
+    def denormalize(float):
+        return math.ceil(float * 255.0)
+    
+    def generateColorXML(name, vector):
+        xml_col = config.createElement(name)
+        xml_col.setAttribute("R", str(denormalize(vector[0])))
+        xml_col.setAttribute("G", str(denormalize(vector[1])))
+        xml_col.setAttribute("B", str(denormalize(vector[2])))
+        return xml_col
+    
+    # Set GenNormals false or else xNormal will assume it's true
+    xml_genmaps.setAttribute("GenNormals", "false")
+    
+    # Which map do we bake?
+    if settings.maptype == 'NORMAL':
+        s = settings.NORMAL_settings
+        xml_genmaps.setAttribute("GenNormals", "true")
+        xml_genmaps.setAttribute("SwizzleX", str(s.swizzle_x))
+        xml_genmaps.setAttribute("SwizzleY", str(s.swizzle_y))
+        xml_genmaps.setAttribute("SwizzleZ", str(s.swizzle_z))
+        xml_genmaps.setAttribute("TangentSpace", bool2str(s.tangentspace))
+        
+        xml_genmaps.appendChild(generateColorXML(name = 'NMBackgroundColor', vector = s.bgcolor)) 
+        
+    elif settings.maptype == 'HEIGHT':
+        s = settings.HEIGHT_settings
+        xml_genmaps.setAttribute("GenHeights", "true")
+        xml_genmaps.setAttribute("HeightTonemap", str(s.normalization))
+        xml_genmaps.setAttribute("HeightMinVal", str(s.min))
+        xml_genmaps.setAttribute("HeightMaxVal", str(s.max))
+        
+        xml_genmaps.appendChild(generateColorXML(name = 'HMBackgroundColor', vector = s.bgcolor))
+        
+    elif settings.maptype == 'AMBIENT_OCCLUSION':
+        s = settings.AMBIENT_OCCLUSION_settings
+        xml_genmaps.setAttribute("GenAO", "true")
+        xml_genmaps.setAttribute("AORaysPerSample", str(s.rays))
+        xml_genmaps.setAttribute("AODistribution", str(s.distribution))
+        xml_genmaps.setAttribute("AOConeAngle", str(s.spread_angle))
+        xml_genmaps.setAttribute("AOBias", str(s.bias))
+        xml_genmaps.setAttribute("AOAllowPureOccluded", bool2str(s.allow_full_occlusion))
+        xml_genmaps.setAttribute("AOLimitRayDistance", bool2str(s.limit_ray_distance))
+        xml_genmaps.setAttribute("AOAttenConstant", str(s.atten1))
+        xml_genmaps.setAttribute("AOAttenLinear", str(s.atten2))
+        xml_genmaps.setAttribute("AOAttenCuadratic", str(s.atten3))
+        xml_genmaps.setAttribute("AOJitter", bool2str(s.jitter))
+        xml_genmaps.setAttribute("AOIgnoreBackfaceHits", bool2str(s.ignore_backfaces))
+        
+        xml_genmaps.appendChild(generateColorXML(name = 'AOBackgroundColor', vector = s.bgcolor))
+        xml_genmaps.appendChild(generateColorXML(name = 'AOOccludedColor', vector = s.color_occluded))
+        xml_genmaps.appendChild(generateColorXML(name = 'AOUnoccludedColor', vector = s.color_unoccluded))
+     
+    elif settings.maptype == 'BENT_NORMAL':
+        s = settings.BENT_NORMAL_settings
+        xml_genmaps.setAttribute("GenBent", "true")
+        xml_genmaps.setAttribute("BentRaysPerSample", str(s.rays))
+        xml_genmaps.setAttribute("BentConeAngle", str(s.spread_angle))
+        xml_genmaps.setAttribute("BentBias", str(s.bias))
+        xml_genmaps.setAttribute("BentTangentSpace", bool2str(s.tangentspace))
+        xml_genmaps.setAttribute("BentLimitRayDistance", bool2str(s.limit_ray_distance))
+        xml_genmaps.setAttribute("BentJitter", bool2str(s.jitter))
+        xml_genmaps.setAttribute("BentDistribution", str(s.distribution))
+        xml_genmaps.setAttribute("BentSwizzleX", str(s.swizzle_x))
+        xml_genmaps.setAttribute("BentSwizzleY", str(s.swizzle_y))
+        xml_genmaps.setAttribute("BentSwizzleZ", str(s.swizzle_z))
+        
+        xml_genmaps.appendChild(generateColorXML(name = 'BentBackgroundColor', vector = s.bgcolor))
+    
+    elif settings.maptype == 'PRTPN':
+        s = settings.PRTPN_settings
+        xml_genmaps.setAttribute("GenPRT", "true")
+        xml_genmaps.setAttribute("PRTRaysPerSample", str(s.rays))
+        xml_genmaps.setAttribute("PRTConeAngle", str(s.spread_angle))
+        xml_genmaps.setAttribute("PRTBias", str(s.bias))
+        xml_genmaps.setAttribute("PRTLimitRayDistance", bool2str(s.limit_ray_distance))
+        xml_genmaps.setAttribute("PRTJitter", bool2str(s.jitter))
+        xml_genmaps.setAttribute("PRTNormalize", bool2str(s.prt_color_normalize))
+        xml_genmaps.setAttribute("PRTThreshold", str(s.threshold))
+    
+        xml_genmaps.appendChild(generateColorXML(name = 'PRTBackgroundColor', vector = s.bgcolor))
+    
+    elif settings.maptype == 'CONVEXITY':
+        s = settings.CONVEXITY_settings
+        xml_genmaps.setAttribute("GenConvexity", "true")
+        xml_genmaps.setAttribute("ConvexityScale", str(s.convexity_scale))
+        
+        xml_genmaps.appendChild(generateColorXML(name = 'ConvexityBackgroundColor', vector = s.bgcolor))
+    
+    elif settings.maptype == 'THICKNESS':
+        # Has no properties
+        xml_genmaps.setAttribute("GenThickness", "true")
+       
+    elif settings.maptype == 'PROXIMITY':
+        s = settings.PROXIMITY_settings
+        xml_genmaps.setAttribute("GenProximity", "true")
+        xml_genmaps.setAttribute("ProximityRaysPerSample", str(s.rays))
+        xml_genmaps.setAttribute("ProximityConeAngle", str(s.spread_angle))
+        xml_genmaps.setAttribute("ProximityLimitRayDistance", bool2str(s.limit_ray_distance))
+        
+        xml_genmaps.appendChild(generateColorXML(name = 'ProximityBackgroundColor', vector = s.bgcolor))
+    
+    elif settings.maptype == 'CAVITY':
+        s = settings.CAVITY_settings
+        xml_genmaps.setAttribute("GenCavity", "true")
+        xml_genmaps.setAttribute("CavityRaysPerSample", str(s.rays))
+        xml_genmaps.setAttribute("CavityJitter", bool2str(s.jitter))
+        xml_genmaps.setAttribute("CavitySearchRadius", str(s.radius))
+        xml_genmaps.setAttribute("CavityContrast", str(s.contrast))
+        xml_genmaps.setAttribute("CavitySteps", str(s.steps))
+    
+        xml_genmaps.appendChild(generateColorXML(name = 'CavityBackgroundColor', vector = s.bgcolor))
+    
+    elif settings.maptype == 'WIREFRAME_RAY_FAILS':
+        s = settings.WIREFRAME_RAY_FAILS_settings
+        xml_genmaps.setAttribute("GenWireRays", "true")
+        xml_genmaps.setAttribute("RenderRayFails", bool2str(s.render_ray_fails))
+        xml_genmaps.setAttribute("RenderWireframe", bool2str(s.render_wireframe))
+        
+        xml_genmaps.appendChild(generateColorXML(name = 'RenderWireframeCol', vector = s.color_wire))
+        xml_genmaps.appendChild(generateColorXML(name = 'RenderCWCol', vector = s.color_cw))
+        xml_genmaps.appendChild(generateColorXML(name = 'RenderSeamCol', vector = s.color_seam))
+        xml_genmaps.appendChild(generateColorXML(name = 'RenderRayFailsCol', vector = s.color_rayfail))
+        xml_genmaps.appendChild(generateColorXML(name = 'RenderWireframeBackgroundColor', vector = s.bgcolor))
+    
+    elif settings.maptype == 'DIRECTION':
+        s = settings.DIRECTION_settings
+        xml_genmaps.setAttribute("GenDirections", "true")
+        xml_genmaps.setAttribute("DirectionsTS", bool2str(s.tangentspace))
+        xml_genmaps.setAttribute("DirectionsSwizzleX", str(s.swizzle_x))
+        xml_genmaps.setAttribute("DirectionsSwizzleY", str(s.swizzle_y))
+        xml_genmaps.setAttribute("DirectionsSwizzleZ", str(s.swizzle_z))
+        xml_genmaps.setAttribute("DirectionsTonemap", str(s.normalization))
+        xml_genmaps.setAttribute("DirectionsMinVal", str(s.min))
+        xml_genmaps.setAttribute("DirectionsMaxVal", str(s.max))
+        
+        xml_genmaps.appendChild(generateColorXML(name = 'VDMBackgroundColor', vector = s.bgcolor))
+    
+    elif settings.maptype == 'RADIOSITY_NORMAL':
+        s = settings.RADIOSITY_NORMAL_settings
+        xml_genmaps.setAttribute("GenRadiosityNormals", "true")
+        xml_genmaps.setAttribute("RadiosityNormalsRaysPerSample", str(s.rays))
+        xml_genmaps.setAttribute("RadiosityNormalsDistribution", str(s.distribution))
+        xml_genmaps.setAttribute("RadiosityNormalsConeAngle", str(s.spread_angle))
+        xml_genmaps.setAttribute("RadiosityNormalsBias", str(s.bias))
+        xml_genmaps.setAttribute("RadiosityNormalsLimitRayDistance", bool2str(s.limit_ray_distance))
+        xml_genmaps.setAttribute("RadiosityNormalsAttenConstant", str(s.atten1))
+        xml_genmaps.setAttribute("RadiosityNormalsAttenLinear", str(s.atten2))
+        xml_genmaps.setAttribute("RadiosityNormalsAttenCuadratic", str(s.atten3))
+        xml_genmaps.setAttribute("RadiosityNormalsJitter", bool2str(s.jitter))
+        xml_genmaps.setAttribute("RadiosityNormalsContrast", str(s.contrast))
+        xml_genmaps.setAttribute("RadiosityNormalsEncodeAO", bool2str(s.encode_occlusion))
+        xml_genmaps.setAttribute("RadiosityNormalsCoordSys", str(s.coordinate_system))
+        xml_genmaps.setAttribute("RadiosityNormalsAllowPureOcclusion", bool2str(s.allow_full_occlusion))
+        
+        xml_genmaps.appendChild(generateColorXML(name = 'RadNMBackgroundColor', vector = s.bgcolor))
+        
+    elif settings.maptype == 'VERTEX_COLOR':
+        s = settings.VERTEX_COLOR_settings
+        # Has no further properties
+        xml_genmaps.setAttribute("BakeHighpolyVCols", "true")
+        
+        xml_genmaps.appendChild(generateColorXML(name = 'BakeHighpolyVColsBackgroundCol', vector = s.bgcolor))
+    
+    elif settings.maptype == 'CURVATURE':
+        s = settings.CURVATURE_settings
+        xml_genmaps.setAttribute("GenCurv", "true")
+        xml_genmaps.setAttribute("CurvRaysPerSample", str(s.rays))
+        xml_genmaps.setAttribute("CurvBias", str(s.bias))
+        xml_genmaps.setAttribute("CurvConeAngle", str(s.spread_angle))
+        xml_genmaps.setAttribute("CurvJitter", bool2str(s.jitter))
+        xml_genmaps.setAttribute("CurvSearchDistance", str(s.search_distance))
+        xml_genmaps.setAttribute("CurvTonemap", str(s.tone_mapping))
+        xml_genmaps.setAttribute("CurvDistribution", str(s.distribution))
+        xml_genmaps.setAttribute("CurvAlgorithm", str(s.algorithm))
+        xml_genmaps.setAttribute("CurvSmoothing", bool2str(s.smoothing))
+        
+        xml_genmaps.appendChild(generateColorXML(name = 'CurvBackgroundColor', vector = s.bgcolor))
+        
+    elif settings.maptype == 'DERIVATIVE':
+        s = settings.DERIVATIVE_settings
+        # Has no further properties
+        xml_genmaps.setAttribute("GenDerivNM", "true")
+        
+        xml_genmaps.appendChild(generateColorXML(name = 'DerivNMBackgroundColor', vector = s.bgcolor))
+    
+    return config
+
+
+def limit_rays(config, rays):
+    """ Cast at most `rays` rays per sample """
+    
+    xml_genmaps = config.getElementsByTagName("GenerateMaps")[0]
+    for name in list(xml_genmaps.attributes.keys()):
+        if name.endswith("RaysPerSample"):
+            xml_genmaps.setAttribute(name, str(min(int(xml_genmaps.getAttribute(name)), rays)))
+
+
+def apply_preview(config, size, rays):
+    """ Lower the quality of a config for quick previews """
+    
+    xml_genmaps = config.getElementsByTagName("GenerateMaps")[0]
+    for name in ("Width", "Height"):
+        xml_genmaps.setAttribute(name, str(min(int(xml_genmaps.getAttribute(name)), size)))
+    xml_genmaps.setAttribute("AA", "1")
+    limit_rays(config, rays)
+
+
+def guide_config(config):
+    """ A copy of `config` that bakes an object space normal map next to
+        the output, as cheaply as possible """
+    
+    guide = config.cloneNode(True)
+    xml_genmaps = guide.getElementsByTagName("GenerateMaps")[0]
+    base, extension = os.path.splitext(xml_genmaps.getAttribute("File"))
+    for name in list(xml_genmaps.attributes.keys()):
+        if name not in Schema.common_attributes:
+            xml_genmaps.removeAttribute(name)
+    for child in list(xml_genmaps.childNodes):
+        xml_genmaps.removeChild(child)
+    
+    xml_genmaps.setAttribute("GenNormals", "true")
+    xml_genmaps.setAttribute("TangentSpace", "false")
+    xml_genmaps.setAttribute("AA", "1")
+    xml_genmaps.setAttribute("File", base + "_denoise_guide" + extension)
+    return guide
+
+
+def tile_output(output, number):
+    """ The output path xNormal bakes a UDIM tile to, replacing the <UDIM>
+        token. xNormal adds the map suffix after it, tile_image() is where
+        the map ends up. """
+    if '<UDIM>' not in output:
+        base, extension = os.path.splitext(output)
+        output = base + '.<UDIM>' + extension
+    return output.replace('<UDIM>', str(number))
+
+
+def tile_image(output, maptype, number):
+    """ The map of a UDIM tile, with the <UDIM> token replaced in the map's
+        file name. A token ending the name, or the '.<UDIM>' added without
+        one, stays at the end after the map suffix: out_normals.1001.tga """
+    base, extension = os.path.splitext(output)
+    if '<UDIM>' not in base:
+        base += '.<UDIM>'
+    if not base.endswith('<UDIM>'):
+        return Schema.output_path(output, maptype).replace('<UDIM>', str(number))
+    
+    stem = base[:-len('<UDIM>')].rstrip('._-')
+    separator = base[len(stem):-len('<UDIM>')]
+    image_base, image_extension = os.path.splitext(Schema.output_path(stem + extension, maptype))
+    return image_base + separator + str(number) + image_extension
+
+
+def apply_tile(config, u, v, output):
+    """ Bake the UV tile (u, v) into `output`. The tile is counted after
+        the UV offset of the low poly meshes. """
+    
+    xml_lowpoly = config.getElementsByTagName("LowPolyModel")[0]
+    for xml_lowpolymesh in xml_lowpoly.getElementsByTagName("Mesh"):
+        xml_lowpolymesh.setAttribute("UOffset", str(int(xml_lowpolymesh.getAttribute("UOffset") or 0) - u))
+        xml_lowpolymesh.setAttribute("VOffset", str(int(xml_lowpolymesh.getAttribute("VOffset") or 0) - v))
+    config.getElementsByTagName("GenerateMaps")[0].setAttribute("File", output)
+
+
+def apply_halves(config, halves):
+    """ Bake the halves in the {low poly file: half file} mapping instead of
+        the whole low poly files """
+    
+    xml_lowpoly = config.getElementsByTagName("LowPolyModel")[0]
+    for xml_lowpolymesh in xml_lowpoly.getElementsByTagName("Mesh"):
+        path = xml_lowpolymesh.getAttribute("File")
+        xml_lowpolymesh.setAttribute("File", halves.get(path, path))
+
+
+def output_file(config, maptype):
+    """ The image xNormal writes when baking `config` """
+    return Schema.output_path(config.getElementsByTagName("GenerateMaps")[0].getAttribute("File"), maptype)
+
+
+def write_config(config):
+    """ Save the config to a temporary file and return its path """
+    
+    tempdir = tempfile.gettempdir()
+    if not os.path.exists(tempdir):
+        os.makedirs(tempdir)
+    temporary_xml_file = tempfile.NamedTemporaryFile(mode = 'w', suffix = '.xml', dir = tempdir, delete = False)
+    try:
+        config.writexml(temporary_xml_file, addindent = "\t", newl = "\n")
+    finally:
+        temporary_xml_file.close()
+    return temporary_xml_file.name
@@ -0,0 +1,169 @@
+import os
+import threading
+import traceback
+
+from . import ImageIO
+from . import Denoise
+from . import RawCache
+from . import RayFails
+from . import Lod
+from . import Symmetry
+
+
+# Converting runs in threads; NumPy and zlib release the interpreter lock
+# for the heavy lifting and Blender's own Python can't spawn processes.
+_executor = None
+_lock = threading.Lock()
+
+# Conversions that haven't finished and messages about the finished ones
+pending = []
+messages = []
+
+extensions = {'PNG': '.png', 'EXR': '.exr', 'DDS': '.dds'}
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _executor = ThreadPoolExecutor(max_workers = max(1, (os.cpu_count() or 2) // 2))
+    return _executor
+
+
+def options(settings):
+    """ The conversion settings as a plain dict, bpy properties must not be
+        touched from other threads. Denoising is added per bake. """
+    return {'formats': sorted(settings.convert_formats),
+            'bits': int(settings.convert_bits),
+            'mipmaps': settings.convert_mipmaps,
+            'compress': settings.convert_compress,
+            'keep_original': settings.convert_keep_original,
+            }
+
+
+def targets(path, options):
+    """ The files `path` is converted to """
+    base = os.path.splitext(path)[0]
+    return [base + extensions[format] for format in options['formats']]
+
+
+def denoise(path, image, options, mirror = None):
+    """ Filter the image, guided by the normal map baked next to it. The
+        guide is mirrored like the image if only half of it was baked. """
+    
+    guide = options.get('guide')
+    normals = None
+    if guide is not None:
+        options['guide_finished'].wait()
+        if os.path.isfile(guide):
+            normals = ImageIO.read(guide)
+            os.remove(guide)
+            if mirror:
+                normals = Symmetry.mirror(normals, mirror, mirror['guide_flip'])
+    
+    image = Denoise.denoise(image, options, normals)
+    ImageIO.write(path, image)
+    return image
+
+
+def write_formats(path, image, options):
+    """ Write `image` in every configured format next to `path`, removing
+        `path` unless it's kept. Returns the written files. """
+    written = []
+    for format, target in zip(options['formats'], targets(path, options)):
+        # Never write over the image while it's still needed
+        temporary = target + '.part'
+        if format == 'PNG':
+            ImageIO.write_png(temporary, image, min(options['bits'], 16))
+        elif format == 'EXR':
+            ImageIO.write_exr(temporary, image, 16 if options['bits'] <= 16 else 32)
+        elif format == 'DDS':
+            ImageIO.write_dds(temporary, image, options['mipmaps'], options['compress'])
+        os.replace(temporary, target)
+        written.append(target)
+
+    if not options['keep_original'] and options['formats'] and path not in targets(path, options):
+        os.remove(path)
+    return written
+
+
+def convert(path, options):
+    """ Move a UDIM tile to its name, read it once, mirror a half bake,
+        analyze its ray fails, denoise it, recolor a raw bake and derive
+        LODs if asked to and write every configured format. Returns the
+        written files. """
+
+    # UDIM tiles are renamed to end with the tile number
+    if options.get('rename'):
+        os.replace(path, options['rename'])
+        path = options['rename']
+
+    image = ImageIO.read(path)
+    written = []
+    mirror = options.get('mirror')
+    if mirror:
+        image = Symmetry.mirror(image, mirror, mirror['flip'], mirror['background'])
+        ImageIO.write(path, image)
+        written.append(path)
+    if options.get('analyze'):
+        RayFails.store(RayFails.analyze(image, options['analyze']))
+    if options.get('denoise'):
+        image = denoise(path, image, options['denoise'], mirror)
+        written.append(path)
+    if options.get('remap'):
+        path = options['remap']['output']
+        image = RawCache.remap(image, options['remap'])
+        ImageIO.write(path, image)
+        written.append(path)
+
+    images = [(path, image)]
+    if options.get('lod'):
+        for lod in Lod.levels(image, options['lod']):
+            lod_path = Lod.lod_path(path, lod.shape[1])
+            ImageIO.write(lod_path, lod)
+            written.append(lod_path)
+            images.append((lod_path, lod))
+
+    for path, image in images:
+        written.extend(write_formats(path, image, options))
+    return written
+
+
+def _done(future):
+    with _lock:
+        pending.remove(future)
+        try:
+            written = future.result()
+            if written:
+                messages.append(('INFO', 'Wrote %s' % ', '.join(os.path.basename(path) for path in written)))
+        except Exception as error:
+            traceback.print_exc()
+            messages.append(('ERROR', 'Conversion failed: %s' % error))
+
+
+def submit(path, options):
+    """ Convert `path` in the background, without waiting for it """
+    if not any(options.get(name) for name in ('rename', 'formats', 'mirror', 'denoise', 'remap', 'analyze', 'lod')):
+        return None
+    future = executor().submit(convert, path, options)
+    with _lock:
+        pending.append(future)
+    future.add_done_callback(_done)
+    return future
+
+
+def status():
+    """ A short description of running conversions or the last result """
+    with _lock:
+        if pending:
+            return 'INFO', 'Processing %d image(s)' % len(pending)
+        if messages:
+            return messages[-1]
+    return None
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait = False)
+        _executor = None
@@ -0,0 +1,109 @@
+import numpy
+
+from . import ImageIO
+from . import UVRaster
+
+# Ray traced maps are baked with few rays and filtered afterwards. The
+# filter averages neighbouring pixels of the same UV island that face the
+# same way, according to a cheaply baked object space normal map.
+
+# Maps that are noisy at low ray counts
+maptypes = ('AMBIENT_OCCLUSION', 'BENT_NORMAL', 'RADIOSITY_NORMAL', 'PRTPN')
+
+# Maps that hold unit vectors and need to be renormalized after filtering
+directions = ('BENT_NORMAL',)
+
+# Preset: (rays, filter radius in pixels, normal sigma, value sigma)
+presets = {'FAST': (32, 4, 0.3, 0.35),
+           'BALANCED': (64, 3, 0.25, 0.25),
+           'QUALITY': (128, 2, 0.2, 0.15),
+           }
+
+# Rows filtered at once, to bound memory use
+band_size = 256
+
+
+def options(settings, uvs, islands):
+    """ The denoise settings as a plain dict for the background pipeline.
+        `uvs` and `islands` are the low poly UV triangles, shifted into the
+        0-1 range, and the island of each. """
+    rays, radius, sigma_normal, sigma_value = presets[settings.denoise]
+    return {'radius': radius,
+            'sigma_normal': sigma_normal,
+            'sigma_value': sigma_value,
+            'renormalize': settings.maptype in directions,
+            'uvs': uvs,
+            'islands': islands,
+            }
+
+
+def _shifted(array, dy, dx, fill):
+    """ `array` moved by (dy, dx), filling the uncovered border """
+    result = numpy.full_like(array, fill)
+    height, width = array.shape[:2]
+    result[max(dy, 0):height + min(dy, 0), max(dx, 0):width + min(dx, 0)] = \
+        array[max(-dy, 0):height + min(-dy, 0), max(-dx, 0):width + min(-dx, 0)]
+    return result
+
+
+def bilateral(image, normals, islands, radius, sigma_normal, sigma_value):
+    """ Cross bilateral filter of a (height, width, channels) float image.
+        Pixels only mix with pixels of the same island (-1 is none) and
+        weigh less the more their normals or values differ. `normals` may
+        be None. """
+
+    result = image.copy()
+    height = image.shape[0]
+    spatial_sigma = max(radius / 2.0, 0.5)
+
+    for top in range(0, height, band_size):
+        # Every band brings `radius` rows of its neighbours along
+        first, last = max(top - radius, 0), min(top + band_size + radius, height)
+        rows = slice(top - first, top - first + min(band_size, height - top))
+        band = image[first:last]
+        band_islands = islands[first:last]
+        band_normals = normals[first:last] if normals is not None else None
+
+        total = numpy.zeros(band.shape, numpy.float32)
+        weights = numpy.zeros(band.shape[:2], numpy.float32)
+        for dy in range(-radius, radius + 1):
+            for dx in range(-radius, radius + 1):
+                weight = numpy.exp(-(dx * dx + dy * dy) / (2 * spatial_sigma ** 2)).astype(numpy.float32)
+                weight = weight * (_shifted(band_islands, dy, dx, -1) == band_islands)
+
+                neighbour = _shifted(band, dy, dx, 0)
+                difference = ((neighbour - band) ** 2).sum(axis = 2)
+                weight = weight * numpy.exp(-difference / (2 * sigma_value ** 2))
+                if band_normals is not None:
+                    difference = ((_shifted(band_normals, dy, dx, 0) - band_normals) ** 2).sum(axis = 2)
+                    weight = weight * numpy.exp(-difference / (2 * sigma_normal ** 2))
+
+                total += neighbour * weight[:, :, None]
+                weights += weight
+
+        covered = band_islands >= 0
+        filtered = total / numpy.maximum(weights, 1e-8)[:, :, None]
+        result[first:last][rows] = numpy.where(covered[:, :, None], filtered, band)[rows]
+
+    return result
+
+
+def denoise(image, options, normals = None):
+    """ Filter a baked map, returning a float image """
+
+    height, width = image.shape[:2]
+    islands = UVRaster.island_map(options['uvs'], options['islands'], width, height)
+    if normals is not None:
+        normals = ImageIO.to_float(normals)[:, :, :3] * 2 - 1
+        if normals.shape[:2] != (height, width):
+            normals = None
+
+    result = bilateral(ImageIO.to_float(image), normals, islands,
+                       options['radius'], options['sigma_normal'], options['sigma_value'])
+
+    if options['renormalize']:
+        vectors = result[:, :, :3] * 2 - 1
+        length = numpy.sqrt((vectors ** 2).sum(axis = 2, keepdims = True))
+        result[:, :, :3] = numpy.where(length > 1e-6, vectors / numpy.maximum(length, 1e-6), vectors) * 0.5 + 0.5
+
+    return result
@@ -0,0 +1,362 @@
+import bpy
+import os
+import hashlib
+
+
+def ensure_dir(directory):
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+            return True
+        except:
+            return False
+
+
+def export_obj(filepath, objects = None, triangulate = False):
+    """ Export to an obj file for xNormal. If `objects` is given, exactly
+        those objects are exported instead of the current selection. """
+
+    # Make sure the target directory exists
+    directory, filename = os.path.split(filepath)
+    ensure_dir(directory)
+
+    if triangulate:
+        write_triangulated_obj(filepath, objects, bpy.context.scene)
+        return
+
+    scene = bpy.context.scene
+    selection = [obj for obj in scene.objects if obj.select]
+    if objects is not None:
+        for obj in selection:
+            obj.select = False
+        for obj in objects:
+            obj.select = True
+
+    try:
+        bpy.ops.export_scene.obj(
+                                 filepath = filepath,
+                                 use_selection = True,
+                                 use_mesh_modifiers = True,
+                                 use_edges = True,
+                                 use_normals = True,
+                                 use_uvs = True,
+                                 use_materials = False,
+                                 use_triangles = False,
+                                 use_nurbs = False,
+                                 use_vertex_groups = False,
+                                 group_by_object = True,
+                                 keep_vertex_order = True,
+                                 )
+    finally:
+        if objects is not None:
+            for obj in objects:
+                obj.select = False
+            for obj in selection:
+                obj.select = True
+
+
+# The obj exporter writes Blender's Z up coordinates Y up, looking down -Z
+obj_axes = (0, 2, 1)
+obj_signs = (1, 1, -1)
+
+
+def to_obj_axes(vectors):
+    """ Blender coordinates as the obj exporter writes them, (x, z, -y) """
+    return vectors[:, obj_axes] * obj_signs
+
+
+def write_triangulated_obj(filepath, objects, scene):
+    """ Write the objects triangulated, with Blender's split normals, to an
+        obj file in the same axes as export_obj() """
+    import bmesh
+    import numpy
+
+    with open(filepath, 'wb') as obj_file:
+        obj_file.write(b'# Triangulated for xNormal\n')
+        vertex_offset = 1
+        uv_offset = 1
+        normal_offset = 1
+
+        for obj in objects:
+            mesh = obj.to_mesh(scene, True, 'PREVIEW')
+            try:
+                # Triangulate the way Blender does before computing anything
+                bm = bmesh.new()
+                bm.from_mesh(mesh)
+                bmesh.ops.triangulate(bm, faces = bm.faces)
+                if obj.matrix_world.determinant() < 0:
+                    bmesh.ops.reverse_faces(bm, faces = bm.faces)
+                bm.to_mesh(mesh)
+                bm.free()
+                mesh.transform(obj.matrix_world)
+
+                def get(collection, attribute, width, dtype = numpy.float32):
+                    data = numpy.empty(len(collection) * width, dtype = dtype)
+                    collection.foreach_get(attribute, data)
+                    return data.reshape(-1, width) if width > 1 else data
+
+                positions = get(mesh.vertices, 'co', 3)
+                loop_vertices = get(mesh.loops, 'vertex_index', 1, numpy.int64)
+                loop_start = get(mesh.polygons, 'loop_start', 1, numpy.int64)
+                loops = loop_start[:, None] + numpy.arange(3)
+
+                if hasattr(mesh, 'calc_normals_split'):
+                    mesh.calc_normals_split()
+                    loop_normals = get(mesh.loops, 'normal', 3)
+                else:
+                    # Before 2.70 smooth faces use the vertex normals, flat
+                    # ones their face normal
+                    mesh.calc_normals()
+                    smooth = get(mesh.polygons, 'use_smooth', 1, numpy.bool_)
+                    face_normals = numpy.repeat(get(mesh.polygons, 'normal', 3), 3, axis = 0)
+                    loop_normals = numpy.where(numpy.repeat(smooth, 3)[:, None],
+                                               get(mesh.vertices, 'normal', 3)[loop_vertices], face_normals)
+
+                if mesh.uv_layers.active is not None:
+                    loop_uvs = get(mesh.uv_layers.active.data, 'uv', 2)
+                else:
+                    loop_uvs = numpy.zeros((len(mesh.loops), 2), dtype = numpy.float32)
+
+                # Shared UVs and normals are written once
+                uvs, uv_index = numpy.unique(loop_uvs, axis = 0, return_inverse = True)
+                normals, normal_index = numpy.unique(loop_normals, axis = 0, return_inverse = True)
+
+                faces = numpy.empty((len(loop_start), 3, 3), dtype = numpy.int64)
+                faces[:, :, 0] = loop_vertices[loops] + vertex_offset
+                faces[:, :, 1] = uv_index.ravel()[loops] + uv_offset
+                faces[:, :, 2] = normal_index.ravel()[loops] + normal_offset
+
+                obj_file.write(('o %s\n' % obj.name).encode('utf-8'))
+                numpy.savetxt(obj_file, to_obj_axes(positions), fmt = 'v %.6f %.6f %.6f')
+                numpy.savetxt(obj_file, uvs, fmt = 'vt %.6f %.6f')
+                numpy.savetxt(obj_file, to_obj_axes(normals), fmt = 'vn %.6f %.6f %.6f')
+                numpy.savetxt(obj_file, faces.reshape(-1, 9), fmt = 'f %d/%d/%d %d/%d/%d %d/%d/%d')
+
+                vertex_offset += len(positions)
+                uv_offset += len(uvs)
+                normal_offset += len(normals)
+            finally:
+                bpy.data.meshes.remove(mesh)
+
+
+def exportable(objects):
+    """ The objects that have geometry to export """
+    return [obj for obj in objects if obj.type in ('MESH', 'CURVE', 'SURFACE', 'FONT')]
+
+
+def find_objects(entries):
+    """ The objects a collection of XNormalMesh was exported from """
+    return [bpy.data.objects[entry.name] for entry in entries if entry.name in bpy.data.objects]
+
+
+def low_poly_objects(settings):
+    """ The low poly objects of the last export, exported separately or merged """
+    return find_objects(settings.low_meshes) or find_objects(settings.low_objects)
+
+
+def object_path(directory, obj):
+    """ The file an object is exported to when exporting per object """
+    return os.path.join(directory, bpy.path.clean_name(obj.name) + '.obj')
+
+
+def fingerprint(obj, scene, triangulate = False):
+    """ Hash everything about an object that ends up in its exported file.
+        Returns (hexdigest, triangle count). """
+    import numpy
+
+    # Hash the mesh as the exporter sees it, with modifiers applied
+    mesh = obj.to_mesh(scene, True, 'PREVIEW')
+    try:
+        digest = hashlib.sha1(b'triangulated' if triangulate else b'')
+
+        def add(collection, attribute, count, dtype):
+            data = numpy.empty(count, dtype = dtype)
+            collection.foreach_get(attribute, data)
+            digest.update(data)
+            return data
+
+        add(mesh.vertices, 'co', len(mesh.vertices) * 3, numpy.float32)
+        add(mesh.loops, 'vertex_index', len(mesh.loops), numpy.int32)
+        add(mesh.edges, 'use_edge_sharp', len(mesh.edges), numpy.bool_)
+        add(mesh.polygons, 'use_smooth', len(mesh.polygons), numpy.bool_)
+        totals = add(mesh.polygons, 'loop_total', len(mesh.polygons), numpy.int32)
+        if mesh.uv_layers.active is not None:
+            add(mesh.uv_layers.active.data, 'uv', len(mesh.loops) * 2, numpy.float32)
+
+        matrix = numpy.array([list(row) for row in obj.matrix_world], dtype = numpy.float32)
+        digest.update(matrix)
+
+        triangles = int((totals - 2).sum())
+    finally:
+        bpy.data.meshes.remove(mesh)
+
+    return digest.hexdigest(), triangles
+
+
+def export_per_object(entries, directory, objects, scene, triangulate = False):
+    """ Export each object to its own file in `directory`, keeping `entries`
+        (a collection of XNormalMesh) in sync with `objects`. Objects whose
+        fingerprint didn't change since the last export are skipped.
+        Returns the number of objects written. """
+
+    names = [obj.name for obj in objects]
+    for index in reversed(range(len(entries))):
+        if entries[index].name not in names:
+            entries.remove(index)
+
+    written = 0
+    for obj in objects:
+        entry = entries.get(obj.name)
+        if entry is None:
+            entry = entries.add()
+            entry.name = obj.name
+
+        path = object_path(directory, obj)
+        digest, triangles = fingerprint(obj, scene, triangulate)
+        if entry.path == path and entry.fingerprint == digest and os.path.isfile(path):
+            continue
+
+        export_obj(path, [obj], triangulate)
+        entry.path = path
+        entry.fingerprint = digest
+        entry.triangles = triangles
+        entry.offset = (0, 0, 0)
+        written += 1
+
+    return written
+
+
+def export_cages(entries, directory, scene, triangulate = False):
+    """ Export the cage object of every entry of a collection of
+        XNormalLowMesh to its own file in `directory`, skipping cages that
+        didn't change. Entries without a cage object are left alone.
+        Returns the number of cages written. """
+
+    written = 0
+    for entry in entries:
+        cage = bpy.data.objects.get(entry.cage) if entry.cage else None
+        if cage is None:
+            continue
+
+        path = object_path(directory, cage)
+        digest, triangles = fingerprint(cage, scene, triangulate)
+        if entry.cage_path == path and entry.cage_fingerprint == digest and os.path.isfile(path):
+            continue
+
+        export_obj(path, [cage], triangulate)
+        entry.cage_path = path
+        entry.cage_fingerprint = digest
+        written += 1
+
+    return written
+
+
+def export_part(filepath, objects, polygons, scene, triangulate = False):
+    """ Export only some polygons of the objects, given as an array of
+        polygon indices per object, the way export_obj() exports them """
+    import bmesh
+
+    parts = []
+    try:
+        for obj, keep in zip(objects, polygons):
+            mesh = obj.to_mesh(scene, True, 'PREVIEW')
+            bm = bmesh.new()
+            bm.from_mesh(mesh)
+            kept = set(int(index) for index in keep)
+            bmesh.ops.delete(bm, geom = [face for face in bm.faces if face.index not in kept], context = 5)
+            bm.to_mesh(mesh)
+            bm.free()
+
+            part = bpy.data.objects.new(obj.name + '_part', mesh)
+            part.matrix_world = obj.matrix_world
+            scene.objects.link(part)
+            parts.append(part)
+        scene.update()
+        export_obj(filepath, parts, triangulate)
+    finally:
+        for part in parts:
+            mesh = part.data
+            scene.objects.unlink(part)
+            bpy.data.objects.remove(part)
+            bpy.data.meshes.remove(mesh)
+
+
+def export_merged(entries, filepath, objects, scene, triangulate = False):
+    """ Export all objects into a single file, keeping `entries` in sync with
+        `objects`. The export is skipped if none of the objects changed.
+        Returns True if the file was written. """
+
+    fingerprints = [fingerprint(obj, scene, triangulate) for obj in objects]
+    unchanged = (len(entries) == len(objects) and os.path.isfile(filepath) and
+                 all(entry.name == obj.name and entry.path == filepath and entry.fingerprint == digest
+                     for entry, obj, (digest, triangles) in zip(entries, objects, fingerprints)))
+    if unchanged:
+        return False
+
+    export_obj(filepath, objects, triangulate)
+
+    entries.clear()
+    for obj, (digest, triangles) in zip(objects, fingerprints):
+        entry = entries.add()
+        entry.name = obj.name
+        entry.path = filepath
+        entry.fingerprint = digest
+        entry.triangles = triangles
+    return True
+
+
+class MeshData():
+    """ The topology, world space positions and UV arrays of an object's
+        evaluated mesh """
+
+    def __init__(self, obj, scene):
+        import numpy
+        
+        mesh = obj.to_mesh(scene, True, 'PREVIEW')
+        try:
+            mesh.transform(obj.matrix_world)
+            self.vertex_count = len(mesh.vertices)
+            self.positions = numpy.empty(len(mesh.vertices) * 3, dtype = numpy.float32)
+            mesh.vertices.foreach_get('co', self.positions)
+            self.positions.shape = (-1, 3)
+            self.loop_vertices = numpy.empty(len(mesh.loops), dtype = numpy.int32)
+            mesh.loops.foreach_get('vertex_index', self.loop_vertices)
+            self.loop_start = numpy.empty(len(mesh.polygons), dtype = numpy.int32)
+            mesh.polygons.foreach_get('loop_start', self.loop_start)
+            self.loop_total = numpy.empty(len(mesh.polygons), dtype = numpy.int32)
+            mesh.polygons.foreach_get('loop_total', self.loop_total)
+
+            self.uvs = None
+            if mesh.uv_layers.active is not None:
+                self.uvs = numpy.empty(len(mesh.loops) * 2, dtype = numpy.float32)
+                mesh.uv_layers.active.data.foreach_get('uv', self.uvs)
+                self.uvs.shape = (-1, 2)
+        finally:
+            bpy.data.meshes.remove(mesh)
+
+    def uv_triangles(self):
+        from . import UVRaster
+        triangles, polygons = UVRaster.triangulate(self.loop_start, self.loop_total)
+        return self.uvs[triangles]
+
+    def triangle_polygons(self):
+        """ The polygon of each triangle of uv_triangles() """
+        from . import UVRaster
+        triangles, polygons = UVRaster.triangulate(self.loop_start, self.loop_total)
+        return polygons
+
+    def polygon_centers(self):
+        """ The average corner position and UV of each polygon """
+        import numpy
+        loop_polygons = numpy.repeat(numpy.arange(len(self.loop_start)), self.loop_total)
+        counts = numpy.maximum(self.loop_total, 1)[:, None]
+        def average(values):
+            return numpy.column_stack([numpy.bincount(loop_polygons, values[:, axis], len(self.loop_start))
+                                       for axis in range(values.shape[1])]) / counts
+        return average(self.positions[self.loop_vertices]), average(self.uvs)
+
+    def uv_islands(self):
+        """ The UV island of each triangle of uv_triangles() """
+        from . import UVRaster
+        triangles, polygons = UVRaster.triangulate(self.loop_start, self.loop_total)
+        return UVRaster.islands(self.loop_vertices, self.uvs, triangles)
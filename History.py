@@ -0,0 +1,184 @@
+import os
+import math
+import sqlite3
+import threading
+
+
+# The job properties we learn from, in table order
+features = ('width', 'height', 'anti_aliasing', 'bucket_size', 'rays', 'low_triangles', 'high_triangles')
+
+# Use per map type models once there are enough bakes of that type
+min_samples = 3
+
+_lock = threading.Lock()
+_revision = 0
+_models = {}
+_triangle_cache = {}
+
+
+def connect(path):
+    connection = sqlite3.connect(path, timeout = 10)
+    connection.execute('CREATE TABLE IF NOT EXISTS bakes ('
+                       'id INTEGER PRIMARY KEY, '
+                       'time REAL, '
+                       'maptype TEXT, '
+                       'width INTEGER, '
+                       'height INTEGER, '
+                       'anti_aliasing INTEGER, '
+                       'bucket_size INTEGER, '
+                       'rays INTEGER, '
+                       'low_triangles INTEGER, '
+                       'high_triangles INTEGER, '
+                       'duration REAL, '
+                       'peak_memory INTEGER, '
+                       'returncode INTEGER)')
+    return connection
+
+
+def record(path, job):
+    """ Store a finished BakeJob. Safe to call from the job's watcher thread. """
+    global _revision
+
+    info = job.info
+    with _lock:
+        connection = connect(path)
+        try:
+            with connection:
+                connection.execute('INSERT INTO bakes (time, maptype, %s, duration, peak_memory, returncode) '
+                                   'VALUES (?, ?, %s, ?, ?, ?)' % (', '.join(features), ', '.join('?' * len(features))),
+                                   [job.start_time, info['maptype']] + [info[name] for name in features] +
+                                   [job.duration, job.peak_memory, job.returncode])
+        finally:
+            connection.close()
+        _revision += 1
+
+
+def count_triangles(path):
+    """ Count the triangles in an obj file, cached until the file changes """
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 0
+
+    key = (path, stat.st_mtime, stat.st_size)
+    if key not in _triangle_cache:
+        triangles = 0
+        with open(path, 'rb') as obj:
+            for line in obj:
+                if line.startswith(b'f '):
+                    triangles += len(line.split()) - 3
+        _triangle_cache[key] = triangles
+    return _triangle_cache[key]
+
+
+def job_info(settings, count = True):
+    """ Collect the properties of the bake `settings` describe. Without
+        `count` no files are read, the triangles of mesh files are given by
+        their path until count_info() counts them. """
+
+    maptype_settings = getattr(settings, settings.maptype + '_settings', None)
+
+    if settings.high_meshes:
+        high_triangles = sum(mesh.triangles for mesh in settings.high_meshes)
+    else:
+        high_triangles = count_triangles(settings.high_path) if count else settings.high_path
+
+    if settings.low_meshes:
+        low_triangles = sum(mesh.triangles for mesh in settings.low_meshes)
+    else:
+        low_triangles = count_triangles(settings.low_path) if count else settings.low_path
+
+    return {'maptype': settings.maptype,
+            'width': int(settings.width),
+            'height': int(settings.height),
+            'anti_aliasing': int(settings.anti_aliasing),
+            'bucket_size': int(settings.bucket_size),
+            'rays': getattr(maptype_settings, 'rays', 0),
+            'low_triangles': low_triangles,
+            'high_triangles': high_triangles,
+            }
+
+
+def count_info(info):
+    """ A job_info() with the triangles of mesh files counted """
+    return dict(info, **dict((name, count_triangles(info[name])) for name in ('low_triangles', 'high_triangles')
+                             if isinstance(info[name], str)))
+
+
+def _time_features(width, height, anti_aliasing, bucket_size, rays, low_triangles, high_triangles):
+    # Bake time grows with the number of samples, rays and triangles
+    samples = width * height * anti_aliasing * anti_aliasing
+    return [1.0, math.log(samples), math.log1p(rays), math.log1p(high_triangles), math.log1p(low_triangles)]
+
+
+def _memory_features(width, height, anti_aliasing, bucket_size, rays, low_triangles, high_triangles):
+    # Memory grows with the geometry and the size of the output
+    return [1.0, high_triangles / 1e6, low_triangles / 1e6, width * height / 1e6]
+
+
+def _fit(x, y, regularization = 1e-3):
+    """ Ridge regression, leaving the intercept unregularized """
+    import numpy
+
+    x = numpy.array(x, dtype = numpy.float64)
+    y = numpy.array(y, dtype = numpy.float64)
+    penalty = numpy.eye(x.shape[1]) * regularization
+    penalty[0, 0] = 0
+    return numpy.linalg.solve(x.T.dot(x) + penalty, x.T.dot(y))
+
+
+def _model(path, maptype):
+    key = (path, maptype)
+    if key in _models and _models[key][0] == _revision:
+        return _models[key][1]
+
+    model = None
+    if os.path.isfile(path):
+        with _lock:
+            connection = connect(path)
+            try:
+                query = 'SELECT %s, duration, peak_memory FROM bakes WHERE returncode = 0' % ', '.join(features)
+                rows = connection.execute(query + ' AND maptype = ?', (maptype,)).fetchall()
+                if len(rows) < min_samples:
+                    rows = connection.execute(query).fetchall()
+            finally:
+                connection.close()
+
+        if len(rows) >= min_samples:
+            time_weights = _fit([_time_features(*row[:-2]) for row in rows],
+                                [math.log(max(row[-2], 0.1)) for row in rows])
+            memory_weights = _fit([_memory_features(*row[:-2]) for row in rows],
+                                  [row[-1] for row in rows])
+            model = (time_weights, memory_weights, min(row[-1] for row in rows))
+
+    _models[key] = (_revision, model)
+    return model
+
+
+def estimate(path, info):
+    """ Predict (seconds, bytes) for a bake, or None without enough history """
+
+    model = _model(path, info['maptype'])
+    if model is None:
+        return None
+
+    time_weights, memory_weights, min_memory = model
+    values = [info[name] for name in features]
+    seconds = math.exp(sum(w * f for w, f in zip(time_weights, _time_features(*values))))
+    memory = sum(w * f for w, f in zip(memory_weights, _memory_features(*values)))
+    return seconds, max(memory, min_memory)
+
+
+def format_duration(seconds):
+    if seconds < 60:
+        return '%ds' % seconds
+    if seconds < 3600:
+        return '%dm %ds' % divmod(seconds, 60)
+    return '%dh %dm' % (seconds // 3600, (seconds % 3600) // 60)
+
+
+def format_memory(size):
+    if size < 1024 ** 3:
+        return '%d MB' % (size / 1024 ** 2)
+    return '%.1f GB' % (size / 1024.0 ** 3)
@@ -0,0 +1,466 @@
+import os
+import zlib
+import struct
+import numpy
+
+# Reading and writing the images xNormal produces and the formats they are
+# converted to, using nothing but NumPy. Images are (height, width, channels)
+# arrays with the top row first. This module must not depend on Blender, it
+# runs in background threads.
+
+
+class UnsupportedImage(Exception):
+    pass
+
+
+#
+# Reading
+#
+
+def read_tga(data):
+    (id_length, colormap_type, image_type, _, _, _, _, _, width, height,
+     bits, descriptor) = struct.unpack('<BBBHHBHHHHBB', data[:18])
+    if colormap_type or image_type not in (2, 3, 10, 11):
+        raise UnsupportedImage('Only true color and grayscale TGAs are supported')
+
+    channels = bits // 8
+    start = 18 + id_length
+    size = width * height * channels
+
+    if image_type in (2, 3):
+        pixels = numpy.frombuffer(data, numpy.uint8, size, start)
+    else:
+        # Run length encoded packets
+        chunks, offset, done = [], start, 0
+        while done < size:
+            header = data[offset]
+            count = (header & 0x7f) + 1
+            if header & 0x80:
+                chunks.append(data[offset + 1:offset + 1 + channels] * count)
+                offset += 1 + channels
+            else:
+                chunks.append(data[offset + 1:offset + 1 + count * channels])
+                offset += 1 + count * channels
+            done += count * channels
+        pixels = numpy.frombuffer(b''.join(chunks), numpy.uint8, size)
+
+    image = pixels.reshape(height, width, channels)
+    if channels >= 3:
+        image = image[:, :, [2, 1, 0] + list(range(3, channels))]
+    if not descriptor & 0x20:
+        image = image[::-1]
+    return numpy.ascontiguousarray(image)
+
+
+def read_bmp(data):
+    offset, = struct.unpack('<I', data[10:14])
+    width, height, _, bits, compression = struct.unpack('<iiHHI', data[18:34])
+    if bits not in (24, 32) or compression not in (0, 3):
+        raise UnsupportedImage('Only uncompressed 24 and 32 bit BMPs are supported')
+
+    channels = bits // 8
+    stride = (width * channels + 3) & ~3
+    rows = numpy.frombuffer(data, numpy.uint8, stride * abs(height), offset).reshape(abs(height), stride)
+    image = rows[:, :width * channels].reshape(abs(height), width, channels)[:, :, [2, 1, 0] + list(range(3, channels))]
+    if height > 0:
+        image = image[::-1]
+    return numpy.ascontiguousarray(image)
+
+
+# Consecutive rows with Average or Paeth filters undone at once, at most
+wavefront_rows = 512
+
+
+def unfilter_png(raw, height, stride, pixel_bytes):
+    rows = numpy.frombuffer(raw, numpy.uint8).reshape(height, stride + 1)
+    filters, rows = rows[:, 0], rows[:, 1:]
+    result = numpy.zeros((height, stride), numpy.uint8)
+    previous = numpy.zeros(stride, numpy.int32)
+
+    y = 0
+    while y < height:
+        if filters[y] in (3, 4):
+            # Average and Paeth depend on the pixel to the left
+            end = y + 1
+            while end < height and end - y < wavefront_rows and filters[end] in (3, 4):
+                end += 1
+            block = _unfilter_wavefront(rows[y:end].reshape(end - y, -1, pixel_bytes), filters[y:end] == 3,
+                                        previous.reshape(-1, pixel_bytes))
+            result[y:end] = block.reshape(end - y, stride)
+            previous = result[end - 1].astype(numpy.int32)
+            y = end
+            continue
+
+        row = rows[y].astype(numpy.int32)
+        if filters[y] == 1:
+            # Sub, a running sum per channel
+            lanes = row.reshape(-1, pixel_bytes)
+            row = numpy.cumsum(lanes, axis = 0).reshape(-1)
+        elif filters[y] == 2:
+            row = row + previous
+        row &= 0xff
+        result[y] = row
+        previous = row
+        y += 1
+    return result
+
+
+def _unfilter_wavefront(rows, average, previous):
+    """ Undo the Average (where `average`) or Paeth filter of (height,
+        width, lanes) rows below the unfiltered `previous` row. A pixel
+        depends on its left, upper and upper left neighbours, so all rows
+        are done as a wavefront: step t handles pixel t - y of every row y. """
+
+    height, width, lanes = rows.shape
+    steps = width + height - 1
+
+    # Pixel (y, x) is at skewed[x + y + 2, y + 1]. Row 0 holds the previous
+    # row, cells left of the image stay zero.
+    skewed = numpy.zeros((steps + 2, height + 1, lanes), numpy.int16)
+    skewed[numpy.arange(width) + 1, 0] = previous
+    ys = numpy.arange(height)[:, None]
+    source = numpy.zeros((steps, height, lanes), numpy.int16)
+    source[ys + numpy.arange(width), ys] = rows
+    averages, paeths = average.any(), not average.all()
+    average = average[:, None]
+
+    for step in range(steps):
+        first, last = max(0, step - width + 1), min(height, step + 1)
+        left = skewed[step + 1, first + 1:last + 1]
+        up = skewed[step + 1, first:last]
+        corner = skewed[step, first:last]
+
+        # Paeth picks whichever neighbour is closest to left + up - corner
+        if paeths:
+            from_left, from_up = left - corner, up - corner
+            distance_left, distance_up = numpy.abs(from_up), numpy.abs(from_left)
+            distance_corner = numpy.abs(from_left + from_up)
+            predictor = numpy.where((distance_left <= distance_up) & (distance_left <= distance_corner), left,
+                                    numpy.where(distance_up <= distance_corner, up, corner))
+        if averages:
+            mean = (left + up) >> 1
+            predictor = numpy.where(average[first:last], mean, predictor) if paeths else mean
+        skewed[step + 2, first + 1:last + 1] = (source[step, first:last] + predictor) & 0xff
+
+    return skewed[ys + numpy.arange(width) + 2, ys + 1].astype(numpy.uint8)
+
+
+def read_png(data):
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        raise UnsupportedImage('Not a PNG file')
+
+    offset, idat = 8, []
+    while offset < len(data):
+        length, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        body = data[offset + 8:offset + 8 + length]
+        if kind == b'IHDR':
+            width, height, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', body)
+        elif kind == b'IDAT':
+            idat.append(body)
+        elif kind == b'IEND':
+            break
+        offset += 12 + length
+
+    channels = {0: 1, 2: 3, 4: 2, 6: 4}.get(color_type)
+    if channels is None or depth not in (8, 16) or interlace:
+        raise UnsupportedImage('Only non-interlaced 8 and 16 bit PNGs without a palette are supported')
+
+    pixel_bytes = channels * depth // 8
+    rows = unfilter_png(zlib.decompress(b''.join(idat)), height, width * pixel_bytes, pixel_bytes)
+    if depth == 16:
+        return rows.view('>u2').astype(numpy.uint16).reshape(height, width, channels)
+    return rows.reshape(height, width, channels)
+
+
+def read_exr(data):
+    """ Scanline OpenEXR files without compression or with (RLE-less) ZIP """
+    if data[:4] != b'\x76\x2f\x31\x01':
+        raise UnsupportedImage('Not an OpenEXR file')
+    if struct.unpack('<i', data[4:8])[0] & 0x200:
+        raise UnsupportedImage('Tiled OpenEXR files are not supported')
+
+    offset, attributes = 8, {}
+    while data[offset] != 0:
+        name_end = data.index(b'\0', offset)
+        kind_end = data.index(b'\0', name_end + 1)
+        size, = struct.unpack('<i', data[kind_end + 1:kind_end + 5])
+        attributes[data[offset:name_end].decode()] = data[kind_end + 5:kind_end + 5 + size]
+        offset = kind_end + 5 + size
+    offset += 1
+
+    compression = attributes['compression'][0]
+    lines = {0: 1, 2: 1, 3: 16}.get(compression)
+    if lines is None:
+        raise UnsupportedImage('Only uncompressed and ZIP compressed OpenEXR files are supported')
+
+    channels, position, channel_list = [], 0, attributes['channels']
+    while channel_list[position] != 0:
+        name_end = channel_list.index(b'\0', position)
+        pixel_type, = struct.unpack('<i', channel_list[name_end + 1:name_end + 5])
+        channels.append((channel_list[position:name_end].decode(), {0: '<u4', 1: '<f2', 2: '<f4'}[pixel_type]))
+        position = name_end + 17
+
+    x_min, y_min, x_max, y_max = struct.unpack('<iiii', attributes['dataWindow'])
+    width, height = x_max - x_min + 1, y_max - y_min + 1
+    line_type = numpy.dtype([(name, dtype, (width,)) for name, dtype in channels])
+
+    blocks = (height + lines - 1) // lines
+    rows = []
+    for block_offset in struct.unpack('<%dQ' % blocks, data[offset:offset + 8 * blocks]):
+        y, size = struct.unpack('<ii', data[block_offset:block_offset + 8])
+        count = min(lines, y_max + 1 - y)
+        block = data[block_offset + 8:block_offset + 8 + size]
+        if compression and size < count * line_type.itemsize:
+            predicted = numpy.frombuffer(zlib.decompress(block), numpy.uint8)
+            interleaved = numpy.empty_like(predicted)
+            interleaved[0] = predicted[0]
+            interleaved[1:] = predicted[0] + numpy.cumsum(predicted[1:] - numpy.uint8(128), dtype = numpy.uint8)
+            block = numpy.empty_like(interleaved)
+            half = (len(block) + 1) // 2
+            block[0::2], block[1::2] = interleaved[:half], interleaved[half:]
+        rows.append(numpy.frombuffer(bytes(block), line_type, count))
+
+    rows = numpy.concatenate(rows)
+    names = [name for name, dtype in channels]
+    order = [name for name in ('R', 'G', 'B', 'A') if name in names] or [name for name in ('Y', 'A') if name in names]
+    return numpy.stack([rows[name].astype(numpy.float32) for name in order], axis = 2)
+
+
+readers = {'.tga': read_tga,
+           '.bmp': read_bmp,
+           '.png': read_png,
+           '.exr': read_exr,
+           }
+
+
+def read(path):
+    """ Read an image into a (height, width, channels) array """
+    reader = readers.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        raise UnsupportedImage('Cannot read %s' % path)
+    with open(path, 'rb') as image:
+        return reader(image.read())
+
+
+def to_float(image):
+    """ Values in 0-1 as float32, whatever the integer depth """
+    if image.dtype == numpy.uint8:
+        return image.astype(numpy.float32) / 255
+    if image.dtype == numpy.uint16:
+        return image.astype(numpy.float32) / 65535
+    return image.astype(numpy.float32)
+
+
+def quantize(image, bits):
+    image = numpy.clip(to_float(image), 0, 1)
+    if bits == 16:
+        return (image * 65535 + 0.5).astype(numpy.uint16)
+    return (image * 255 + 0.5).astype(numpy.uint8)
+
+
+#
+# Writing
+#
+
+def write_png(path, image, bits = 8):
+    height, width, channels = image.shape
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+
+    pixels = quantize(image, bits)
+    if bits == 16:
+        pixels = pixels.astype('>u2').view(numpy.uint8)
+    rows = pixels.reshape(height, -1)
+
+    # The Up filter compresses smooth maps well and can be done at once
+    filtered = numpy.empty((height, rows.shape[1] + 1), numpy.uint8)
+    filtered[:, 0] = 2
+    filtered[0, 1:] = rows[0]
+    filtered[1:, 1:] = rows[1:] - rows[:-1]
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    with open(path, 'wb') as png:
+        png.write(b'\x89PNG\r\n\x1a\n')
+        png.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, bits, color_type, 0, 0, 0)))
+        png.write(chunk(b'IDAT', zlib.compress(filtered.tobytes(), 6)))
+        png.write(chunk(b'IEND', b''))
+
+
+def write_tga(path, image):
+    height, width, channels = image.shape
+    pixels = quantize(image, 8)
+    if channels >= 3:
+        pixels = pixels[:, :, [2, 1, 0] + list(range(3, channels))]
+    image_type = 3 if channels == 1 else 2
+    with open(path, 'wb') as tga:
+        tga.write(struct.pack('<BBBHHBHHHHBB', 0, 0, image_type, 0, 0, 0, 0, 0, width, height,
+                              channels * 8, 0x20 | (8 if channels == 4 else 0)))
+        tga.write(pixels.tobytes())
+
+
+def write_bmp(path, image):
+    height, width, channels = image.shape
+    pixels = quantize(image, 8)
+    if channels == 1:
+        pixels = numpy.repeat(pixels, 3, axis = 2)
+    pixels = pixels[::-1, :, [2, 1, 0]]
+    stride = (width * 3 + 3) & ~3
+    rows = numpy.zeros((height, stride), numpy.uint8)
+    rows[:, :width * 3] = pixels.reshape(height, -1)
+    with open(path, 'wb') as bmp:
+        bmp.write(struct.pack('<2sIHHI', b'BM', 54 + rows.size, 0, 0, 54))
+        bmp.write(struct.pack('<IiiHHIIiiII', 40, width, height, 1, 24, 0, rows.size, 2835, 2835, 0, 0))
+        bmp.write(rows.tobytes())
+
+
+def write_exr(path, image, bits = 32):
+    """ A scanline OpenEXR file with ZIP compression, half or full floats """
+    height, width, channels = image.shape
+    names = {1: 'Y', 2: 'YA', 3: 'RGB', 4: 'RGBA'}[channels]
+    dtype, pixel_type = (numpy.float16, 1) if bits == 16 else (numpy.float32, 2)
+
+    pixels = to_float(image).astype(dtype)
+    order = sorted(range(channels), key = lambda channel: names[channel])
+
+    def attribute(name, kind, value):
+        return name.encode() + b'\0' + kind.encode() + b'\0' + struct.pack('<i', len(value)) + value
+
+    channel_list = b''.join(names[channel].encode() + b'\0' + struct.pack('<iBBBBii', pixel_type, 0, 0, 0, 0, 1, 1)
+                            for channel in order) + b'\0'
+    window = struct.pack('<iiii', 0, 0, width - 1, height - 1)
+    header = (b'\x76\x2f\x31\x01' + struct.pack('<i', 2) +
+              attribute('channels', 'chlist', channel_list) +
+              attribute('compression', 'compression', b'\x03') +
+              attribute('dataWindow', 'box2i', window) +
+              attribute('displayWindow', 'box2i', window) +
+              attribute('lineOrder', 'lineOrder', b'\x00') +
+              attribute('pixelAspectRatio', 'float', struct.pack('<f', 1)) +
+              attribute('screenWindowCenter', 'v2f', struct.pack('<ff', 0, 0)) +
+              attribute('screenWindowWidth', 'float', struct.pack('<f', 1)) +
+              b'\0')
+
+    # ZIP compression works on blocks of 16 scanlines, channels stored one after another per line
+    lines = 16
+    blocks = []
+    for y in range(0, height, lines):
+        block = pixels[y:y + lines][:, :, order].transpose(0, 2, 1)
+        raw = numpy.frombuffer(block.tobytes(), numpy.uint8)
+
+        # Split even and odd bytes, then store differences between neighbours
+        interleaved = numpy.concatenate((raw[0::2], raw[1::2]))
+        predicted = interleaved.copy()
+        predicted[1:] = interleaved[1:] - interleaved[:-1] + 128
+        compressed = zlib.compress(predicted.tobytes(), 6)
+        data = compressed if len(compressed) < len(raw) else raw.tobytes()
+        blocks.append(struct.pack('<ii', y, len(data)) + data)
+
+    with open(path, 'wb') as exr:
+        exr.write(header)
+        offset = len(header) + 8 * len(blocks)
+        for block in blocks:
+            exr.write(struct.pack('<Q', offset))
+            offset += len(block)
+        for block in blocks:
+            exr.write(block)
+
+
+writers = {'.tga': write_tga,
+           '.bmp': write_bmp,
+           '.png': write_png,
+           '.exr': write_exr,
+           }
+
+
+def write(path, image):
+    """ Write an image in the format its extension names, with default settings """
+    writer = writers.get(os.path.splitext(path)[1].lower())
+    if writer is None:
+        raise UnsupportedImage('Cannot write %s' % path)
+    writer(path, image)
+
+
+def downsample(image):
+    """ Half the size with a box filter, for mipmaps """
+    image = to_float(image)
+    image = numpy.pad(image, ((0, image.shape[0] % 2 if image.shape[0] > 1 else 0),
+                              (0, image.shape[1] % 2 if image.shape[1] > 1 else 0), (0, 0)), mode = 'edge')
+    if image.shape[0] > 1:
+        image = (image[0::2] + image[1::2]) / 2
+    if image.shape[1] > 1:
+        image = (image[:, 0::2] + image[:, 1::2]) / 2
+    return image
+
+
+def mip_chain(image):
+    chain = [image]
+    while chain[-1].shape[0] > 1 or chain[-1].shape[1] > 1:
+        chain.append(downsample(chain[-1]))
+    return chain
+
+
+def compress_bc1(image):
+    """ DXT1 blocks with end points at the corners of each block's color range """
+    height, width = image.shape[:2]
+    rgb = quantize(image[:, :, :3], 8).astype(numpy.int32)
+
+    # Pad to whole blocks by repeating the last row and column
+    padded = numpy.pad(rgb, ((0, -height % 4), (0, -width % 4), (0, 0)), mode = 'edge')
+    rows, columns = padded.shape[0] // 4, padded.shape[1] // 4
+    blocks = padded.reshape(rows, 4, columns, 4, 3).transpose(0, 2, 1, 3, 4).reshape(-1, 16, 3)
+
+    def to_565(color):
+        return (color[:, 0] >> 3) << 11 | (color[:, 1] >> 2) << 5 | color[:, 2] >> 3
+
+    def from_565(value):
+        color = numpy.stack((value >> 11 & 31, value >> 5 & 63, value & 31), axis = 1)
+        return color * (255.0 / numpy.array((31, 63, 31)))
+
+    high, low = to_565(blocks.max(axis = 1)), to_565(blocks.min(axis = 1))
+
+    # Four color mode needs the first end point to be larger
+    flat = high == low
+    low = numpy.where(flat & (low > 0), low - 1, low)
+    high = numpy.where(flat & (low == high), high + 1, high)
+
+    start, end = from_565(high), from_565(low)
+    palette = numpy.stack((start, end, (2 * start + end) / 3, (start + 2 * end) / 3), axis = 1)
+    distances = ((blocks[:, :, None, :] - palette[:, None, :, :]) ** 2).sum(axis = 3)
+    indices = distances.argmin(axis = 2).astype(numpy.uint32)
+    bits = (indices << (2 * numpy.arange(16, dtype = numpy.uint32))).sum(axis = 1, dtype = numpy.uint32)
+
+    result = numpy.empty(len(blocks), dtype = [('high', '<u2'), ('low', '<u2'), ('bits', '<u4')])
+    result['high'], result['low'], result['bits'] = high, low, bits
+    return result.tobytes()
+
+
+def write_dds(path, image, mipmaps = True, compress = True):
+    """ A DDS texture, DXT1 compressed or 32 bit BGRA, with an optional mip chain """
+    height, width = image.shape[:2]
+    levels = mip_chain(image) if mipmaps else [image]
+
+    if compress:
+        pitch_flag, pitch = 0x80000, max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * 8
+        pixel_format = struct.pack('<II4sIIIII', 32, 0x4, b'DXT1', 0, 0, 0, 0, 0)
+    else:
+        pitch_flag, pitch = 0x8, width * 4
+        pixel_format = struct.pack('<II4sIIIII', 32, 0x41, b'\0\0\0\0', 32,
+                                   0x00ff0000, 0x0000ff00, 0x000000ff, 0xff000000)
+
+    flags = 0x1 | 0x2 | 0x4 | 0x1000 | pitch_flag | (0x20000 if mipmaps else 0)
+    caps = 0x1000 | (0x400008 if mipmaps else 0)
+    header = (b'DDS ' + struct.pack('<7I', 124, flags, height, width, pitch, 0, len(levels)) +
+              b'\0' * 44 + pixel_format + struct.pack('<5I', caps, 0, 0, 0, 0))
+
+    with open(path, 'wb') as dds:
+        dds.write(header)
+        for level in levels:
+            if compress:
+                dds.write(compress_bc1(level))
+            else:
+                pixels = quantize(level, 8)
+                if pixels.shape[2] == 1:
+                    pixels = numpy.repeat(pixels, 3, axis = 2)
+                if pixels.shape[2] == 3:
+                    pixels = numpy.concatenate((pixels, numpy.full(pixels.shape[:2] + (1,), 255, numpy.uint8)), axis = 2)
+                dds.write(pixels[:, :, [2, 1, 0, 3]].tobytes())
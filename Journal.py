@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import uuid
+import threading
+
+# Every map or UDIM tile that is baked is written to an append-only
+# journal before it's queued, once xNormal baked it and once its output
+# has been processed. Entries that never ended were interrupted by a crash
+# and can be resumed, skipping whatever had been finished already.
+
+# States an entry can end in
+finished_states = ('done', 'failed', 'dropped')
+
+_lock = threading.RLock()
+
+# Entries queued in this session, they are not interrupted but running
+session = set()
+
+# The entries of the journal, cached until the file changes
+_cache = (None, None)
+
+
+def inputs(config):
+    """ The size and modification time of every mesh file a config reads """
+    files = {}
+    for mesh in config.getElementsByTagName("Mesh"):
+        for name in ("File", "CageFile"):
+            path = mesh.getAttribute(name)
+            if path and os.path.isfile(path):
+                stat = os.stat(path)
+                files[path] = [stat.st_size, int(stat.st_mtime)]
+    return files
+
+
+def append(path, event):
+    """ Write an event and make sure it's on disk before returning """
+    event.setdefault('time', time.time())
+    line = (json.dumps(event, sort_keys = True) + '\n').encode()
+    with _lock:
+        with open(path, 'ab+') as journal:
+            # Never continue a line cut short by a crash
+            journal.seek(0, os.SEEK_END)
+            if journal.tell() > 0:
+                journal.seek(-1, os.SEEK_END)
+                if journal.read(1) != b'\n':
+                    line = b'\n' + line
+            journal.write(line)
+            journal.flush()
+            os.fsync(journal.fileno())
+
+
+def add(path, config, output, tile, info, post):
+    """ Journal a bake about to be queued. `post` are the plain conversion
+        options. Returns the id of the new entry. """
+    entry = uuid.uuid4().hex
+    session.add(entry)
+    append(path, {'event': 'queued',
+                  'id': entry,
+                  'config': config.toxml(),
+                  'output': output,
+                  'tile': tile,
+                  'info': info,
+                  'post': post,
+                  'inputs': inputs(config),
+                  })
+    return entry
+
+
+def mark(path, entry, state, **values):
+    """ Journal that an entry reached `state` ('baked', 'done', 'failed' or
+        'dropped') """
+    values.update(event = state, id = entry)
+    append(path, values)
+
+
+def load(path):
+    """ All entries of the journal in the order they were queued, with the
+        state they reached. A line cut short by a crash is ignored. """
+    global _cache
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return []
+    key = (stat.st_size, stat.st_mtime)
+    if _cache[0] == key:
+        return _cache[1]
+
+    entries = {}
+    order = []
+    with _lock:
+        with open(path) as journal:
+            lines = journal.readlines()
+    for line in lines:
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if event['event'] == 'queued':
+            entries[event['id']] = dict(event, state = 'queued', events = [event])
+            order.append(event['id'])
+        elif event['id'] in entries:
+            entry = entries[event['id']]
+            entry['state'] = event['event']
+            entry['events'].append(event)
+            if 'image' in event:
+                entry['image'] = event['image']
+
+    result = [entries[entry] for entry in order]
+    _cache = (key, result)
+    return result
+
+
+def interrupted(path):
+    """ The entries that were neither finished nor queued in this session """
+    return [entry for entry in load(path) if entry['state'] not in finished_states and entry['id'] not in session]
+
+
+def changed_inputs(entry):
+    """ The mesh files of an entry that changed since it was queued """
+    changed = []
+    for path, (size, mtime) in entry['inputs'].items():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            changed.append(path)
+            continue
+        if stat.st_size != size or int(stat.st_mtime) != mtime:
+            changed.append(path)
+    return changed
+
+
+def compact(path):
+    """ Rewrite the journal without the entries that are finished """
+    if not os.path.isfile(path):
+        return
+    with _lock:
+        unfinished = [entry for entry in load(path) if entry['state'] not in finished_states]
+        temporary = path + '.part'
+        with open(temporary, 'w') as journal:
+            for entry in unfinished:
+                for event in entry['events']:
+                    journal.write(json.dumps(event, sort_keys = True) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temporary, path)
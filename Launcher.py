@@ -0,0 +1,280 @@
+import os
+import sys
+import time
+import threading
+import traceback
+import subprocess
+
+
+# Jobs started in this session, most recent last
+jobs = []
+
+# Windows process priority classes
+priority_classes = {'NORMAL': 0x0020,
+                    'BELOW_NORMAL': 0x4000,
+                    'IDLE': 0x0040,
+                    }
+
+# The matching POSIX niceness
+niceness = {'NORMAL': 0,
+            'BELOW_NORMAL': 10,
+            'IDLE': 19,
+            }
+
+
+def parse_cpu_list(text):
+    """ Parse a CPU list like '0-3,6' into [0, 1, 2, 3, 6] """
+    cpus = []
+    for part in text.replace(' ', '').split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return sorted(set(cpus))
+
+
+class Limits():
+    """ How much of the machine a bake may use """
+
+    def __init__(self, priority = 'NORMAL', cpus = None, max_threads = 0, max_memory = 0):
+        self.priority = priority
+        self.max_memory = max_memory
+
+        # xNormal has no thread count option, so threads are limited by
+        # restricting the process to that many CPUs
+        if max_threads:
+            available = cpus or list(range(os.cpu_count() if hasattr(os, 'cpu_count') else 1024))
+            cpus = available[:max_threads]
+        self.cpus = cpus
+        self.max_threads = max_threads
+
+    def popen_arguments(self):
+        arguments = {}
+
+        if self.max_threads:
+            environment = dict(os.environ)
+            environment['OMP_NUM_THREADS'] = str(self.max_threads)
+            arguments['env'] = environment
+
+        if sys.platform == 'win32':
+            arguments['creationflags'] = priority_classes[self.priority]
+
+        return arguments
+
+    def apply(self, process):
+        """ Restrictions that can only be applied once the process runs. On
+            POSIX this replaces a preexec_fn, which isn't safe to run in the
+            threaded Blender process between fork and exec. """
+
+        if sys.platform != 'win32':
+            try:
+                if niceness[self.priority] and hasattr(os, 'setpriority'):
+                    # Never try to raise the priority of the child
+                    current = os.getpriority(os.PRIO_PROCESS, process.pid)
+                    os.setpriority(os.PRIO_PROCESS, process.pid, max(current, niceness[self.priority]))
+                if self.cpus and hasattr(os, 'sched_setaffinity'):
+                    os.sched_setaffinity(process.pid, self.cpus)
+            except OSError:
+                # The process already ended
+                pass
+            return
+
+        if not self.cpus:
+            return
+
+        try:
+            import psutil
+            psutil.Process(process.pid).cpu_affinity(self.cpus)
+        except ImportError:
+            import ctypes
+            from ctypes import wintypes
+            mask = 0
+            for cpu in self.cpus:
+                mask |= 1 << cpu
+            ctypes.windll.kernel32.SetProcessAffinityMask(wintypes.HANDLE(int(process._handle)), ctypes.c_size_t(mask))
+
+
+def process_memory(process):
+    """ The current and peak resident memory of a running process in bytes,
+        or (0, 0) if it can't be determined on this platform. """
+
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+
+    try:
+        if psutil is not None:
+            info = psutil.Process(process.pid).memory_info()
+            return info.rss, max(info.rss, getattr(info, 'peak_wset', 0))
+
+        if sys.platform.startswith('linux'):
+            values = {}
+            with open('/proc/%d/status' % process.pid) as status:
+                for line in status:
+                    key, _, value = line.partition(':')
+                    if key in ('VmRSS', 'VmHWM'):
+                        values[key] = int(value.split()[0]) * 1024
+            return values.get('VmRSS', 0), values.get('VmHWM', 0)
+
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD),
+                            ('PageFaultCount', wintypes.DWORD),
+                            ('PeakWorkingSetSize', ctypes.c_size_t),
+                            ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                            ('PagefileUsage', ctypes.c_size_t),
+                            ('PeakPagefileUsage', ctypes.c_size_t),
+                            ]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            handle = wintypes.HANDLE(int(process._handle))
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize, counters.PeakWorkingSetSize
+    except Exception:
+        # The process is gone or we are not allowed to look at it
+        pass
+
+    return 0, 0
+
+
+class BakeJob():
+    """ A single xNormal run, watched from a background thread that keeps
+        track of its duration and peak memory """
+
+    poll_interval = 0.5
+
+    def __init__(self, command, info = None, limits = None):
+        self.command = command
+        self.info = info or {}
+        self.limits = limits or Limits()
+        self.temporary_files = []
+        self.callbacks = []
+
+        self.process = None
+        self.start_time = None
+        self.duration = None
+        self.peak_memory = 0
+        self.returncode = None
+        self.killed = None
+        self.finished = threading.Event()
+
+    def on_finish(self, callback):
+        """ Call `callback(job)` from the watcher thread once the job ended """
+        self.callbacks.append(callback)
+
+    def start(self):
+        self.start_time = time.time()
+        self.process = subprocess.Popen(self.command, **self.limits.popen_arguments())
+        self.limits.apply(self.process)
+
+        thread = threading.Thread(target = self._watch)
+        thread.daemon = True
+        thread.start()
+
+    def running(self):
+        return self.process is not None and not self.finished.is_set()
+
+    def kill(self, reason):
+        if self.process is None:
+            # Never started, the queue drops it
+            self.killed = reason
+            self._finish()
+        elif self.running():
+            self.killed = reason
+            self.process.kill()
+
+    def status(self):
+        """ A short human readable description of the job's state """
+        if self.process is None and not self.killed:
+            return 'Queued'
+        if self.running():
+            return 'Running for %ds' % (time.time() - self.start_time)
+        if self.killed:
+            return ('Killed: %s' if self.process else 'Cancelled: %s') % self.killed
+        if self.returncode:
+            return 'Failed with exit code %d' % self.returncode
+        return 'Finished in %ds' % self.duration
+
+    def _watch(self):
+        max_memory = self.limits.max_memory
+        while self.process.poll() is None:
+            rss, peak = process_memory(self.process)
+            self.peak_memory = max(self.peak_memory, rss, peak)
+            if max_memory and rss > max_memory:
+                self.kill('exceeded the memory limit of %d MB' % (max_memory / 1024 ** 2))
+            time.sleep(self.poll_interval)
+
+        self.returncode = self.process.returncode
+        self.duration = time.time() - self.start_time
+        self._finish()
+
+    def _finish(self):
+        """ Clean up and call the callbacks, whether the job ran or not """
+        for path in self.temporary_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        for callback in self.callbacks:
+            try:
+                callback(self)
+            except Exception:
+                traceback.print_exc()
+
+        self.finished.set()
+
+
+class JobQueue():
+    """ Runs jobs in submission order, at most `limit` at a time """
+
+    def __init__(self, limit = 1):
+        self.limit = limit
+        self.pending = []
+        self.running = []
+        self.lock = threading.Lock()
+
+    def submit(self, job):
+        jobs.append(job)
+        job.on_finish(self._finished)
+        with self.lock:
+            self.pending.append(job)
+        self._dispatch()
+
+    def _finished(self, job):
+        with self.lock:
+            if job in self.running:
+                self.running.remove(job)
+        self._dispatch()
+
+    def _dispatch(self):
+        while True:
+            with self.lock:
+                self.pending = [job for job in self.pending if not job.killed]
+                if not self.pending or len(self.running) >= self.limit:
+                    return
+                job = self.pending.pop(0)
+                self.running.append(job)
+            try:
+                job.start()
+            except OSError as error:
+                with self.lock:
+                    self.running.remove(job)
+                job.killed = 'could not start: %s' % error
+                job._finish()
+
+    def summary(self):
+        with self.lock:
+            return '%d running, %d queued' % (len(self.running), len(self.pending))
+
+
+queue = JobQueue()
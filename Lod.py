@@ -0,0 +1,142 @@
+import os
+import numpy
+
+from . import ImageIO
+from . import UVRaster
+
+# Lower resolution copies of a bake for LODs. Every level halves the size
+# of the previous one with a Lanczos filter that only averages pixels
+# inside the UV triangles, so the background never bleeds into the map.
+# The padding is grown again around the UVs at the new size.
+
+# Maps holding unit vectors that are renormalized after filtering
+normal_maps = ('NORMAL', 'BENT_NORMAL')
+
+# Lanczos (a = 2) weights of the 8 source pixels around an output pixel
+# when halving, at distances of 0.5 to 3.5 source pixels
+_distances = numpy.arange(-3.5, 4)
+lanczos = numpy.sinc(_distances / 2) * numpy.sinc(_distances / 4)
+lanczos /= lanczos.sum()
+
+# A tent of the 4 closest pixels, used where too little of the Lanczos
+# footprint is covered for its negative lobes to be safe
+tent = numpy.array([0, 0, 1, 3, 3, 1, 0, 0], dtype = numpy.float64)
+tent /= tent.sum()
+
+# Fraction of the filter that has to be covered to use the Lanczos result
+lanczos_coverage = 0.9
+
+
+def options(settings, uvs):
+    """ The LOD settings as a plain dict for the background pipeline. `uvs`
+        are the low poly UV triangles in the 0-1 range. """
+    return {'levels': settings.lod_levels,
+            'padding': settings.padding,
+            'renormalize': settings.maptype in normal_maps,
+            'uvs': uvs,
+            }
+
+
+def supported(settings):
+    """ Whether LODs can be written next to the output """
+    return os.path.splitext(settings.output)[1].lower() in ImageIO.writers
+
+
+def lod_path(path, width):
+    """ The file the LOD of `path` at `width` pixels is written to """
+    base, extension = os.path.splitext(path)
+    return '%s_%d%s' % (base, width, extension)
+
+
+def _halve(array, taps, axis):
+    """ Filter `array` with `taps` and keep every other pixel along `axis` """
+    size = array.shape[axis]
+    padding = [(0, 0)] * array.ndim
+    padding[axis] = (3, 3 + size % 2)
+    array = numpy.pad(array, padding, mode = 'edge')
+
+    count = (size + 1) // 2
+    result = 0
+    for offset, weight in enumerate(taps):
+        if weight:
+            index = [slice(None)] * array.ndim
+            index[axis] = slice(offset, offset + 2 * count, 2)
+            result = result + weight * array[tuple(index)]
+    return result
+
+
+def _filter(array, taps):
+    if array.shape[0] > 1:
+        array = _halve(array, taps, 0)
+    if array.shape[1] > 1:
+        array = _halve(array, taps, 1)
+    return array
+
+
+def halve(image, covered):
+    """ Half the size of a float image, averaging only covered pixels where
+        any are. Returns the image and the covered fraction of each pixel. """
+
+    weighted = numpy.concatenate((image * covered[:, :, None], covered[:, :, None]), axis = 2)
+    sharp, smooth = _filter(weighted, lanczos), _filter(weighted, tent)
+    coverage = numpy.clip(smooth[:, :, -1], 0, 1)
+
+    use_sharp = sharp[:, :, -1] >= lanczos_coverage
+    total = numpy.where(use_sharp[:, :, None], sharp, smooth)
+    result = total[:, :, :-1] / numpy.maximum(total[:, :, -1:], 1e-8)
+
+    # Uncovered pixels keep the plain downsampled background
+    background = _filter(image, tent)
+    return numpy.where(coverage[:, :, None] > 0, result, background), coverage
+
+
+def dilate(image, covered, steps):
+    """ Grow the covered pixels of an image `steps` pixels outwards, each new
+        pixel averaging its covered neighbours. Returns the image and the
+        pixels that are covered now. """
+
+    image, covered = image.copy(), covered.copy()
+    height, width = covered.shape
+    for step in range(steps):
+        total = numpy.zeros_like(image)
+        count = numpy.zeros(covered.shape)
+        padded = numpy.pad(image * covered[:, :, None], ((1, 1), (1, 1), (0, 0)), mode = 'constant')
+        padded_covered = numpy.pad(covered.astype(numpy.float64), 1, mode = 'constant')
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                total += padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+                count += padded_covered[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+
+        grown = ~covered & (count > 0)
+        if not grown.any():
+            break
+        image[grown] = total[grown] / count[grown][:, None]
+        covered = covered | grown
+    return image, covered
+
+
+def renormalize(image, covered):
+    vectors = image[:, :, :3] * 2 - 1
+    length = numpy.sqrt((vectors ** 2).sum(axis = 2, keepdims = True))
+    normalized = numpy.where(length > 1e-6, vectors / numpy.maximum(length, 1e-6), vectors) * 0.5 + 0.5
+    image[:, :, :3] = numpy.where(covered[:, :, None], normalized, image[:, :, :3])
+    return image
+
+
+def levels(image, options):
+    """ Yield each LOD of a baked image as a float image, largest first """
+
+    image = ImageIO.to_float(image).astype(numpy.float64)
+    height, width = image.shape[:2]
+    covered = (UVRaster.coverage(options['uvs'], width, height) > 0)[::-1].astype(numpy.float64)
+
+    for level in range(1, options['levels'] + 1):
+        if image.shape[0] == 1 and image.shape[1] == 1:
+            break
+        image, covered = halve(image, covered)
+
+        # The padding shrinks with the map
+        lod, filled = dilate(image, covered > 0, max(options['padding'] >> level, 1))
+        if options['renormalize']:
+            lod = renormalize(lod, filled)
+        yield lod.astype(numpy.float32)
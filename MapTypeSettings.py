@@ -140,6 +140,10 @@ class WIREFRAME_RAY_FAILS(MapType):
     render_ray_fails = BoolProperty(name = 'Render ray fails', description = '', default = True)
     color_rayfail = MapType.propHelper.color(name = 'Ray fail', default  = (1, 0, 0))
     
+    analyze = BoolProperty(name = 'Analyze ray fails', description = 'Count the ray fails per UV island after baking', default = True)
+    cage_growth = FloatProperty(name = 'Cage growth', description = 'How much further the auto cage is pushed out around faces with ray fails, relative to the largest ray distance',
+                                default = 0.5, min = 0.01, max = 10, precision = 2)
+    
 class DIRECTION(MapType):
     bgcolor = MapType.propHelper.color(default  = (0, 0, 0))
     
@@ -0,0 +1,146 @@
+import re
+from mathutils import Vector
+
+
+# Blender appends '.001', '.002', ... to duplicated names
+duplicate_suffix = re.compile(r'\.\d{3}$')
+
+
+class Pair():
+    """ A set of objects that are baked against each other """
+
+    def __init__(self, name):
+        self.name = name
+        self.lows = []
+        self.highs = []
+        self.cages = []
+
+    def objects(self):
+        return self.lows + self.highs + self.cages
+
+    def is_complete(self):
+        return len(self.lows) > 0 and len(self.highs) > 0
+
+
+def split_name(name, suffixes):
+    """ Split an object name into its base name and role using the given
+        {role: suffix} mapping. Returns (name, None) if no suffix matches. """
+
+    stripped = duplicate_suffix.sub('', name)
+    for role, suffix in suffixes.items():
+        if suffix and stripped.lower().endswith(suffix.lower()):
+            return stripped[:-len(suffix)], role
+    return stripped, None
+
+
+def find_pairs(objects, settings, active = None):
+    """ Group the given objects into low/high/cage pairs, either by name
+        suffix or by the groups they belong to. """
+
+    suffixes = {'LOW': settings.low_suffix,
+                'HIGH': settings.high_suffix,
+                'CAGE': settings.cage_suffix,
+                }
+
+    pairs = {}
+    def add(key, role, obj):
+        pair = pairs.setdefault(key, Pair(key))
+        if role == 'LOW':
+            pair.lows.append(obj)
+        elif role == 'CAGE':
+            pair.cages.append(obj)
+        else:
+            pair.highs.append(obj)
+
+    for obj in objects:
+        if obj.type != 'MESH':
+            continue
+        base, role = split_name(obj.name, suffixes)
+
+        if settings.pairing == 'GROUP':
+            # Objects without a suffix are part of the high poly
+            for group in obj.users_group:
+                add(group.name, role, obj)
+        elif role is not None:
+            add(base, role, obj)
+
+    result = [pairs[key] for key in sorted(pairs) if pairs[key].is_complete()]
+
+    # Fall back to the active object being the low poly model
+    if not result and settings.selected_to_active and active is not None:
+        pair = Pair(active.name)
+        pair.lows.append(active)
+        pair.highs.extend([obj for obj in objects if obj != active and obj.type == 'MESH'])
+        if pair.is_complete():
+            result.append(pair)
+
+    return result
+
+
+def find_cages(lows, candidates, settings):
+    """ The cage among `candidates` of each low poly object, by name """
+    suffixes = {'LOW': settings.low_suffix, 'CAGE': settings.cage_suffix}
+    cages = {}
+    for obj in candidates:
+        base, role = split_name(obj.name, suffixes)
+        if role == 'CAGE':
+            cages[base] = obj
+    result = {}
+    for low in lows:
+        base, role = split_name(low.name, suffixes)
+        if base in cages:
+            result[low.name] = cages[base]
+    return result
+
+
+def world_bounds(objects):
+    """ The world space bounding box (min, max) of the given objects """
+
+    corners = [obj.matrix_world * Vector(corner) for obj in objects for corner in obj.bound_box]
+    lo = Vector([min(c[i] for c in corners) for i in range(3)])
+    hi = Vector([max(c[i] for c in corners) for i in range(3)])
+    return lo, hi
+
+
+def explode_offsets(pairs, spacing):
+    """ Compute an offset per pair that lines the pairs up along the X axis
+        with `spacing` units between their bounding boxes, so rays cast for
+        one pair can never hit the geometry of another. """
+
+    offsets = []
+    cursor = None
+    for pair in pairs:
+        lo, hi = world_bounds(pair.objects())
+        if cursor is None:
+            cursor = lo.x
+        offsets.append(Vector((cursor - lo.x, 0, 0)))
+        cursor += (hi.x - lo.x) + spacing
+    return offsets
+
+
+def apply_offsets(pairs, offsets):
+    """ Move each pair by its offset. Returns a list of (object, matrix) to
+        hand to `restore_offsets` afterwards. """
+    return move_objects([(obj, offset) for pair, offset in zip(pairs, offsets) for obj in pair.objects()])
+
+
+def move_objects(offsets):
+    """ Move the objects of a list of (object, offset). Returns a list of
+        (object, matrix) to hand to `restore_offsets` afterwards. """
+
+    objects = [obj for obj, offset in offsets]
+    moved = []
+    for obj, offset in offsets:
+        # Children follow their parent, so don't move them twice
+        if obj.parent in objects or obj in [m[0] for m in moved]:
+            continue
+        matrix = obj.matrix_world.copy()
+        moved.append((obj, matrix.copy()))
+        matrix.translation += offset
+        obj.matrix_world = matrix
+    return moved
+
+
+def restore_offsets(moved):
+    for obj, matrix in moved:
+        obj.matrix_world = matrix
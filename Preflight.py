@@ -0,0 +1,129 @@
+import os
+import sys
+import bpy
+import numpy
+
+from . import UVRaster
+from . import History
+from . import Pairing
+from . import Export
+from . import Config
+
+
+# Overlap below this fraction of the covered UV area is ignored
+overlap_tolerance = 0.001
+
+# Resolution limit of the UV overlap test
+max_resolution = 2048
+
+
+def check_file(problems, label, path):
+    if not path or not os.path.isfile(path):
+        problems.append(('ERROR', '%s does not exist: %s' % (label, path)))
+    elif History.count_triangles(path) == 0:
+        problems.append(('ERROR', '%s contains no faces: %s' % (label, path)))
+
+
+def writable(path):
+    """ Whether a file could be created at `path`, creating missing directories """
+    directory = os.path.dirname(os.path.abspath(path))
+    while not os.path.isdir(directory):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return False
+        directory = parent
+    return os.access(directory, os.W_OK)
+
+
+def same_topology(low_data, cage_data):
+    return (low_data.vertex_count == cage_data.vertex_count and
+            numpy.array_equal(low_data.loop_total, cage_data.loop_total) and
+            numpy.array_equal(low_data.loop_vertices, cage_data.loop_vertices))
+
+
+def check(scene, settings, prefs):
+    """ Find everything that would make a bake fail or produce garbage.
+        Returns a list of (level, message) with level 'ERROR' or 'WARNING'. """
+
+    problems = []
+
+    # The baker itself
+    exe = prefs.path_to_xNormal
+    if not exe or not os.path.isfile(exe):
+        problems.append(('ERROR', 'xNormal executable not found: %s' % exe))
+    elif sys.platform != 'win32' and not os.access(exe, os.X_OK):
+        problems.append(('ERROR', 'xNormal executable is not executable: %s' % exe))
+
+    # The exported files
+    for path in [mesh.path for mesh in settings.low_meshes] or [settings.low_path]:
+        check_file(problems, 'Low poly mesh', path)
+    for path in [mesh.path for mesh in settings.high_meshes] or [settings.high_path]:
+        check_file(problems, 'High poly mesh', path)
+    if settings.low_meshes:
+        for mesh in settings.low_meshes:
+            if Config.cage_file(settings, mesh):
+                check_file(problems, 'Cage mesh of %s' % mesh.name, Config.cage_file(settings, mesh))
+    elif Config.cage_file(settings):
+        check_file(problems, 'Cage mesh', Config.cage_file(settings))
+
+    if not writable(settings.output):
+        problems.append(('ERROR', 'Cannot write the output: %s' % settings.output))
+
+    # The low poly objects, if we know them
+    lows = Export.low_poly_objects(settings)
+    data = {}
+    for obj in lows:
+        data[obj.name] = Export.MeshData(obj, scene)
+        if data[obj.name].uvs is None:
+            problems.append(('ERROR', '%s has no UVs' % obj.name))
+
+    uvs = [data[obj.name].uv_triangles() for obj in lows if data[obj.name].uvs is not None]
+    if uvs:
+        uvs = numpy.concatenate(uvs)
+        if settings.udim:
+            # Every tile is baked separately, so only check within tiles
+            uvs = uvs + (settings.low_offset_u, settings.low_offset_v)
+            triangle_tiles = UVRaster.triangle_tiles(uvs)
+            tiles = numpy.unique(triangle_tiles, axis = 0)
+            outside = UVRaster.out_of_range(uvs - triangle_tiles[:, None, :])
+        else:
+            tiles = [numpy.array((-settings.low_offset_u, -settings.low_offset_v))]
+            outside = UVRaster.out_of_range(uvs, *tiles[0])
+        
+        if len(outside):
+            problems.append(('WARNING', '%d faces are outside of the baked UV tile' % len(outside)))
+        
+        resolution = min(max_resolution, int(settings.width)), min(max_resolution, int(settings.height))
+        for tile in tiles:
+            in_tile = uvs[(triangle_tiles == tile).all(axis = 1)] if settings.udim else uvs
+            overlapping, covered, triangles = UVRaster.overlaps(in_tile - tile, *resolution)
+            if covered and overlapping > covered * overlap_tolerance:
+                problems.append(('WARNING', '%.1f%% of the UV area of tile %d overlaps (%d faces)' %
+                                 (100.0 * overlapping / covered, UVRaster.udim(*tile), len(triangles))))
+
+    # The cage has to match the low poly vertex for vertex
+    if settings.low_meshes:
+        for mesh in settings.low_meshes:
+            low, cage = bpy.data.objects.get(mesh.name), bpy.data.objects.get(mesh.cage)
+            if low is not None and cage is not None and not same_topology(data[low.name], Export.MeshData(cage, scene)):
+                problems.append(('ERROR', 'The topology of cage %s differs from %s' % (cage.name, low.name)))
+        cages = []
+    else:
+        cages = Export.find_objects(settings.cage_objects) if settings.use_cage else []
+    if cages and lows:
+        suffixes = {'LOW': settings.low_suffix, 'CAGE': settings.cage_suffix}
+        cages_by_name = dict((Pairing.split_name(cage.name, suffixes)[0], cage) for cage in cages)
+        by_name = all(Pairing.split_name(low.name, suffixes)[0] in cages_by_name for low in lows)
+
+        if not by_name and len(cages) != len(lows):
+            problems.append(('ERROR', 'There are %d cage objects for %d low poly objects' % (len(cages), len(lows))))
+        else:
+            for index, low in enumerate(lows):
+                cage = cages_by_name[Pairing.split_name(low.name, suffixes)[0]] if by_name else cages[index]
+                if not same_topology(data[low.name], Export.MeshData(cage, scene)):
+                    problems.append(('ERROR', 'The topology of cage %s differs from %s' % (cage.name, low.name)))
+
+    if settings.preflight_strict:
+        problems = [('ERROR', message) for level, message in problems]
+
+    return problems
@@ -0,0 +1,140 @@
+import os
+import hashlib
+import numpy
+
+from . import ImageIO
+
+# Maps whose look only depends on how traced values are turned into colors
+# are baked once with neutral colors and no normalization, and recolored
+# from that raw bake for as long as nothing that changes the tracing does.
+
+# The background is baked in a color no raw value can have
+marker = (255, 0, 255)
+
+# Per map: the settings that are applied afterwards, the attributes they
+# neutralize in the raw bake and the color elements that become neutral
+maptypes = {
+    'AMBIENT_OCCLUSION': (('color_occluded', 'color_unoccluded', 'bgcolor'),
+                          {},
+                          {'AOOccludedColor': (0, 0, 0), 'AOUnoccludedColor': (255, 255, 255),
+                           'AOBackgroundColor': marker}),
+    'HEIGHT': (('normalization', 'min', 'max', 'bgcolor'),
+               {'HeightTonemap': 'Raw', 'HeightMinVal': '0', 'HeightMaxVal': '0'},
+               {'HMBackgroundColor': marker}),
+    'DIRECTION': (('normalization', 'min', 'max', 'bgcolor'),
+                  {'DirectionsTonemap': 'Raw', 'DirectionsMinVal': '0', 'DirectionsMaxVal': '0'},
+                  {'VDMBackgroundColor': marker}),
+    'CURVATURE': (('tone_mapping', 'bgcolor'),
+                  {'CurvTonemap': 'Monocrome'},
+                  {'CurvBackgroundColor': marker}),
+    }
+
+# Raw bakes kept per output directory
+keep = 32
+
+
+def cacheable(settings):
+    """ Whether the bake can be made from a cached raw bake """
+    if settings.maptype not in maptypes:
+        return False
+    if settings.maptype == 'CURVATURE' and settings.CURVATURE_settings.tone_mapping == '2Col':
+        # Two color curvature isn't a function of the monochrome one
+        return False
+    return os.path.splitext(settings.output)[1].lower() in ImageIO.writers
+
+
+def directory(output):
+    return os.path.join(os.path.dirname(os.path.abspath(output)), 'xnormal_raw_cache')
+
+
+def raw_config(config, maptype, extra = ''):
+    """ A copy of `config` that bakes raw values into the cache. Its output
+        file name is a hash of everything that affects the tracing, so an
+        existing file is an up to date raw bake. `extra` is added to the
+        hash. """
+
+    attributes, colors = maptypes[maptype][1:]
+    raw = config.cloneNode(True)
+    xml_genmaps = raw.getElementsByTagName("GenerateMaps")[0]
+    output = xml_genmaps.getAttribute("File")
+
+    for name, value in attributes.items():
+        xml_genmaps.setAttribute(name, value)
+    for child in xml_genmaps.childNodes:
+        if child.nodeType == child.ELEMENT_NODE and child.tagName in colors:
+            for channel, value in zip('RGB', colors[child.tagName]):
+                child.setAttribute(channel, str(value))
+
+    # The meshes count with their contents, not just their names
+    key = hashlib.sha1()
+    xml_genmaps.removeAttribute("File")
+    key.update(raw.toxml().encode())
+    key.update(extra.encode())
+    for mesh in raw.getElementsByTagName("Mesh"):
+        for name in ("File", "CageFile"):
+            path = mesh.getAttribute(name)
+            if path and os.path.isfile(path):
+                stat = os.stat(path)
+                key.update(('%s %d %d' % (path, stat.st_size, stat.st_mtime)).encode())
+
+    xml_genmaps.setAttribute("File", os.path.join(directory(output), key.hexdigest()[:20] + '.exr'))
+    return raw
+
+
+def remap_options(settings, output):
+    """ The settings applied to the raw bake as a plain dict """
+    maptype_settings = getattr(settings, settings.maptype + '_settings')
+    options = dict((name, getattr(maptype_settings, name)) for name in maptypes[settings.maptype][0])
+    for name in ('color_occluded', 'color_unoccluded', 'bgcolor'):
+        if name in options:
+            options[name] = tuple(options[name])
+    options.update(maptype = settings.maptype, output = output)
+    return options
+
+
+def prune(path):
+    """ Forget all but the most recent raw bakes next to `path` """
+    folder = os.path.dirname(path)
+    files = [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith('.exr')]
+    for old in sorted(files, key = os.path.getmtime)[:-keep]:
+        os.remove(old)
+
+
+def _normalize(values, covered, normalization, low, high):
+    if normalization == 'Raw':
+        return values
+    if normalization == 'Interactive':
+        # Stretch the range that is actually used
+        used = values[covered] if covered.any() else values
+        low, high = float(used.min()), float(used.max())
+    return (values - low) / max(high - low, 1e-8)
+
+
+def remap(raw, options):
+    """ Turn a raw bake into the colors the settings ask for """
+
+    raw = ImageIO.to_float(raw)[:, :, :3]
+    background = numpy.all(numpy.abs(raw - numpy.array(marker) / 255.0) < 1e-3, axis = 2)
+    covered = ~background
+    maptype = options['maptype']
+
+    if maptype == 'AMBIENT_OCCLUSION':
+        occluded, unoccluded = numpy.array(options['color_occluded']), numpy.array(options['color_unoccluded'])
+        result = occluded + raw[:, :, 1:2] * (unoccluded - occluded)
+    elif maptype == 'HEIGHT':
+        result = numpy.repeat(_normalize(raw[:, :, :1], covered, options['normalization'],
+                                         options['min'], options['max']), 3, axis = 2)
+    elif maptype == 'DIRECTION':
+        result = _normalize(raw, covered, options['normalization'], options['min'], options['max'])
+    elif maptype == 'CURVATURE':
+        value = raw[:, :, 1:2]
+        if options['tone_mapping'] == '3Col':
+            # Convex red, concave blue, flat black
+            result = numpy.concatenate((numpy.clip(value * 2 - 1, 0, 1), numpy.zeros_like(value),
+                                        numpy.clip(1 - value * 2, 0, 1)), axis = 2)
+        else:
+            result = numpy.repeat(value, 3, axis = 2)
+
+    result = result.astype(numpy.float32)
+    result[background] = options['bgcolor']
+    return result
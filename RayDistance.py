@@ -0,0 +1,202 @@
+import bpy
+import bmesh
+import numpy
+from mathutils import Vector
+
+from . import Export
+
+# How far rays have to travel from each low poly vertex to find the high
+# poly surface. Rays are cast from the vertices and the polygon centers
+# along the smoothed normal, in front (outside) and at the rear (inside).
+
+# Samples handled between progress updates
+batch_size = 10000
+
+# Absolute margin relative to the size of the high poly objects, so rays
+# never start exactly on the surface
+epsilon = 1e-4
+
+
+def high_tree(objects, scene):
+    """ A BVH tree of the high poly objects in world space """
+    from mathutils.bvhtree import BVHTree
+
+    bm = bmesh.new()
+    for obj in objects:
+        mesh = obj.to_mesh(scene, True, 'PREVIEW')
+        try:
+            mesh.transform(obj.matrix_world)
+            bm.from_mesh(mesh)
+        finally:
+            bpy.data.meshes.remove(mesh)
+    tree = BVHTree.FromBMesh(bm)
+
+    corners = numpy.array([vertex.co[:] for vertex in bm.verts]) if bm.verts else numpy.zeros((1, 3))
+    size = float(numpy.linalg.norm(corners.max(axis = 0) - corners.min(axis = 0)))
+    bm.free()
+    return tree, size
+
+
+def world_samples(obj, scene):
+    """ The vertices and polygon centers of an object with their smoothed
+        normals in world space, and the vertices every sample belongs to """
+
+    mesh = obj.to_mesh(scene, True, 'PREVIEW')
+    try:
+        count = len(mesh.vertices)
+        positions = numpy.empty(count * 3, dtype = numpy.float64)
+        normals = numpy.empty(count * 3, dtype = numpy.float64)
+        mesh.vertices.foreach_get('co', positions)
+        mesh.vertices.foreach_get('normal', normals)
+        loop_vertices = numpy.empty(len(mesh.loops), dtype = numpy.int64)
+        mesh.loops.foreach_get('vertex_index', loop_vertices)
+        loop_start = numpy.empty(len(mesh.polygons), dtype = numpy.int64)
+        mesh.polygons.foreach_get('loop_start', loop_start)
+        loop_total = numpy.empty(len(mesh.polygons), dtype = numpy.int64)
+        mesh.polygons.foreach_get('loop_total', loop_total)
+    finally:
+        bpy.data.meshes.remove(mesh)
+
+    matrix = numpy.array([list(row) for row in obj.matrix_world])
+    normal_matrix = numpy.linalg.inv(matrix[:3, :3]).T
+    positions = numpy.dot(positions.reshape(-1, 3), matrix[:3, :3].T) + matrix[:3, 3]
+    normals = numpy.dot(normals.reshape(-1, 3), normal_matrix.T)
+    normals /= numpy.maximum(numpy.linalg.norm(normals, axis = 1), 1e-12)[:, None]
+
+    # Polygon centers with the average normal of their corners
+    polygons = numpy.repeat(numpy.arange(len(loop_start)), loop_total)
+    centers = numpy.zeros((len(loop_start), 3))
+    center_normals = numpy.zeros((len(loop_start), 3))
+    numpy.add.at(centers, polygons, positions[loop_vertices])
+    numpy.add.at(center_normals, polygons, normals[loop_vertices])
+    centers /= numpy.maximum(loop_total, 1)[:, None]
+    center_normals /= numpy.maximum(numpy.linalg.norm(center_normals, axis = 1), 1e-12)[:, None]
+
+    return positions, normals, centers, center_normals, polygons, loop_vertices
+
+
+def cast(tree, points, directions, limit, progress = None):
+    """ The distance to the first hit along each direction, or -1. Calls
+        progress(done, total) after every batch. """
+    distances = numpy.full(len(points), -1.0)
+    for start in range(0, len(points), batch_size):
+        for index in range(start, min(start + batch_size, len(points))):
+            location, normal, face, distance = tree.ray_cast(Vector(points[index]), Vector(directions[index]), limit)
+            if location is not None:
+                distances[index] = distance
+        if progress is not None:
+            progress(min(start + batch_size, len(points)), len(points))
+    return distances
+
+
+def nearest(tree, points):
+    distances = numpy.zeros(len(points))
+    for index, point in enumerate(points):
+        location, normal, face, distance = tree.find_nearest(Vector(point))
+        if location is not None:
+            distances[index] = distance
+    return distances
+
+
+def vertex_distances(obj, scene, tree, size, margin, progress = None):
+    """ The front and rear ray distance of each vertex of `obj`, with the
+        margin (a fraction) added, and the world space vertex normals """
+
+    positions, normals, centers, center_normals, polygons, loop_vertices = world_samples(obj, scene)
+    points = numpy.concatenate((positions, centers))
+    directions = numpy.concatenate((normals, center_normals))
+
+    front = cast(tree, points, directions, size, progress)
+    rear = cast(tree, points, -directions, size, progress)
+
+    # Where no ray hits, the nearest surface is the best guess
+    missed = (front < 0) & (rear < 0)
+    front[missed] = nearest(tree, points[missed])
+    front, rear = numpy.maximum(front, 0), numpy.maximum(rear, 0)
+
+    # Polygon centers count for all of their vertices
+    vertex_front, vertex_rear = front[:len(positions)].copy(), rear[:len(positions)].copy()
+    center_front, center_rear = front[len(positions):], rear[len(positions):]
+    numpy.maximum.at(vertex_front, loop_vertices, center_front[polygons])
+    numpy.maximum.at(vertex_rear, loop_vertices, center_rear[polygons])
+
+    padding = epsilon * size
+    return vertex_front * (1 + margin) + padding, vertex_rear * (1 + margin) + padding, normals
+
+
+def cage_objects(objects, scene, fronts, normals, triangulate):
+    """ Temporary copies of `objects` with every vertex pushed out by its
+        front distance. Remove them with remove_objects(). """
+
+    cages = []
+    for obj, front, normal in zip(objects, fronts, normals):
+        mesh = obj.to_mesh(scene, True, 'PREVIEW')
+        if triangulate:
+            # Triangulate now, the displaced shape could triangulate differently
+            bm = bmesh.new()
+            bm.from_mesh(mesh)
+            bmesh.ops.triangulate(bm, faces = bm.faces)
+            bm.to_mesh(mesh)
+            bm.free()
+
+        matrix = numpy.array([list(row) for row in obj.matrix_world])
+        offsets = numpy.dot(normal * front[:, None], numpy.linalg.inv(matrix[:3, :3]).T)
+        positions = numpy.empty(len(mesh.vertices) * 3, dtype = numpy.float32)
+        mesh.vertices.foreach_get('co', positions)
+        mesh.vertices.foreach_set('co', (positions.reshape(-1, 3) + offsets).astype(numpy.float32).ravel())
+        mesh.update()
+
+        cage = bpy.data.objects.new(obj.name + '_autocage', mesh)
+        cage.matrix_world = obj.matrix_world
+        scene.objects.link(cage)
+        cages.append(cage)
+    return cages
+
+
+def remove_objects(objects, scene):
+    for obj in objects:
+        mesh = obj.data
+        scene.objects.unlink(obj)
+        bpy.data.objects.remove(obj)
+        bpy.data.meshes.remove(mesh)
+
+
+def compute(lows, highs, scene, margin, progress = None):
+    """ Compute the ray distances of the low poly objects to the high poly
+        objects. Returns lists of the front and rear distance and the world
+        space normal of every vertex, per low poly object. """
+
+    tree, size = high_tree(highs, scene)
+
+    fronts, rears, normals = [], [], []
+    for obj in lows:
+        front, rear, normal = vertex_distances(obj, scene, tree, size, margin, progress)
+        fronts.append(front)
+        rears.append(rear)
+        normals.append(normal)
+    return fronts, rears, normals
+
+
+def largest(distances):
+    """ The largest of the per vertex distances of all objects, or None if
+        the objects have no vertices """
+    values = [float(per_vertex.max()) for per_vertex in distances if len(per_vertex)]
+    return max(values) if values else None
+
+
+def write_cage(path, lows, scene, fronts, normals, triangulate = False):
+    """ Export the low poly objects pushed out by their front distances """
+    cages = cage_objects(lows, scene, fronts, normals, triangulate)
+    try:
+        Export.export_obj(path, cages, triangulate)
+    finally:
+        remove_objects(cages, scene)
+
+
+def face_vertices(obj, scene, polygons):
+    """ The vertices of the given polygons of an object's evaluated mesh """
+    data = Export.MeshData(obj, scene)
+    selected = numpy.zeros(len(data.loop_start), dtype = bool)
+    selected[numpy.asarray(polygons, dtype = numpy.int64)] = True
+    loop_polygons = numpy.repeat(numpy.arange(len(data.loop_start)), data.loop_total)
+    return numpy.unique(data.loop_vertices[selected[loop_polygons]])
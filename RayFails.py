@@ -0,0 +1,143 @@
+import os
+import threading
+import numpy
+
+from . import ImageIO
+from . import UVRaster
+
+# Ray fails are counted from a baked wireframe and ray fails map. Failed
+# pixels are traced back to the low poly faces through their UVs and the
+# UV islands with the most failures are reported as hotspots.
+
+# How far (0-1 per channel) a pixel may be from the ray fail color
+tolerance = 2.0 / 255
+
+# Hotspots reported per bake
+hotspot_count = 5
+
+# The analysis of each output of the last analyzed bake
+_lock = threading.Lock()
+results = {}
+
+# How much further out than its ray distance each vertex of the auto cage
+# has been pushed, per low poly object. Growth adds up over repeated fixes.
+growth = {}
+
+# Cages grow by a fraction of the largest ray distance, which is at least
+# this fraction of the object's size
+min_reach = 0.01
+
+def options(settings, uvs, islands, faces, names, output):
+    """ The analysis settings as a plain dict for the background pipeline.
+        `faces` holds the low poly object (an index into `names`) and
+        polygon of each UV triangle. """
+    return {'color': tuple(settings.WIREFRAME_RAY_FAILS_settings.color_rayfail),
+            'uvs': uvs,
+            'islands': islands,
+            'faces': faces,
+            'names': names,
+            'output': output,
+            }
+
+
+def failures(image, color):
+    """ The pixels in the ray fail color as a (height, width) array with the
+        top row first """
+    image = ImageIO.to_float(image)[:, :, :3]
+    return numpy.all(numpy.abs(image - numpy.array(color)) <= tolerance, axis = 2)
+
+
+def analyze(image, options):
+    """ Count the ray fails of a baked map within the UV triangles. Returns
+        a dict with the failed and covered pixel counts, the percentage,
+        the hotspots and the polygons with ray fails of each object. """
+
+    failed = failures(image, options['color'])
+    height, width = failed.shape
+    failed = failed[::-1].reshape(-1)
+
+    uvs, islands, faces = options['uvs'], options['islands'], options['faces']
+    covered = numpy.zeros(width * height, dtype = bool)
+    triangle_failures = numpy.zeros(len(uvs), dtype = numpy.int64)
+    triangle_pixels = numpy.zeros(len(uvs), dtype = numpy.int64)
+    for pixels, triangles in UVRaster.rasterize(uvs, width, height):
+        covered[pixels] = True
+        triangle_pixels += numpy.bincount(triangles, minlength = len(uvs))
+        triangle_failures += numpy.bincount(triangles[failed[pixels]], minlength = len(uvs))
+
+    failed_count, covered_count = int((failed & covered).sum()), int(covered.sum())
+
+    # Islands with the most failures first
+    hotspots = []
+    if len(islands):
+        island_failures = numpy.bincount(islands, triangle_failures, minlength = islands.max() + 1)
+        island_pixels = numpy.bincount(islands, triangle_pixels, minlength = islands.max() + 1)
+        for island in numpy.argsort(-island_failures, kind = 'stable')[:hotspot_count]:
+            if island_failures[island] == 0:
+                break
+            in_island = (islands == island) & (triangle_failures > 0)
+            hotspots.append({'name': options['names'][faces[in_island][0, 0]],
+                             'island': int(island),
+                             'failed': int(island_failures[island]),
+                             'percent': 100.0 * island_failures[island] / max(island_pixels[island], 1),
+                             'faces': len(numpy.unique(faces[in_island], axis = 0)),
+                             })
+
+    # Every (object, polygon) with ray fails
+    failing = triangle_failures > 0
+    keys = numpy.unique(faces[failing], axis = 0)
+
+    return {'output': options['output'],
+            'failed': failed_count,
+            'covered': covered_count,
+            'percent': 100.0 * failed_count / max(covered_count, 1),
+            'hotspots': hotspots,
+            'faces': dict((name, keys[keys[:, 0] == index, 1]) for index, name in enumerate(options['names'])
+                          if (keys[:, 0] == index).any()),
+            }
+
+
+def store(result):
+    with _lock:
+        results[result['output']] = result
+
+
+def clear():
+    with _lock:
+        results.clear()
+
+
+def summary():
+    """ The results of the last bake combined: failed and covered pixels,
+        the percentage and the worst hotspots. None before any analysis. """
+    with _lock:
+        if not results:
+            return None
+        failed = sum(result['failed'] for result in results.values())
+        covered = sum(result['covered'] for result in results.values())
+        hotspots = [dict(hotspot, output = os.path.basename(result['output']))
+                    for result in results.values() for hotspot in result['hotspots']]
+    hotspots.sort(key = lambda hotspot: -hotspot['failed'])
+    return failed, covered, 100.0 * failed / max(covered, 1), hotspots[:hotspot_count]
+
+
+def failing_faces():
+    """ The polygons with ray fails of each low poly object, by name """
+    with _lock:
+        faces = {}
+        for result in results.values():
+            for name, polygons in result['faces'].items():
+                faces[name] = numpy.union1d(faces.get(name, numpy.zeros(0, dtype = numpy.int64)), polygons)
+    return faces
+
+
+def grow(name, vertex_count, vertices, distance):
+    """ Push the given vertices of an object's auto cage `distance` further
+        out. Returns the accumulated growth of all of its vertices. """
+    offsets = growth.get(name)
+    if offsets is None or len(offsets) != vertex_count:
+        offsets = numpy.zeros(vertex_count)
+    offsets = offsets.copy()
+    offsets[numpy.unique(vertices)] += distance
+    growth[name] = offsets
+    return offsets
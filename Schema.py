@@ -0,0 +1,85 @@
+import os
+
+# What the generated xNormal settings may contain. This module must not
+# depend on Blender, the stand-in baker uses it too.
+
+mesh_attributes = {
+    'HighPolyModel': set(('File', 'IgnorePerVertexColor', 'AverageNormals', 'Scale')),
+    'LowPolyModel': set(('File', 'AverageNormals', 'MatchUVs', 'UOffset', 'VOffset', 'Scale', 'CageFile', 'UseCage',
+                         'MaxRayDistanceFront', 'MaxRayDistanceBack')),
+    }
+
+common_attributes = set(('Width', 'Height', 'EdgePadding', 'BucketSize', 'AA', 'ClosestIfFails',
+                         'DiscardRayBackFacesHits', 'File', 'GenNormals'))
+
+# The flag that enables each map, the attributes and color elements that
+# belong to it and the suffix xNormal appends to the output file name
+maps = {
+    'NORMAL': ('GenNormals', '_normals',
+               set(('SwizzleX', 'SwizzleY', 'SwizzleZ', 'TangentSpace')),
+               set(('NMBackgroundColor',))),
+    'HEIGHT': ('GenHeights', '_heights',
+               set(('HeightTonemap', 'HeightMinVal', 'HeightMaxVal')),
+               set(('HMBackgroundColor',))),
+    'AMBIENT_OCCLUSION': ('GenAO', '_occlusion',
+                          set(('AORaysPerSample', 'AODistribution', 'AOConeAngle', 'AOBias', 'AOAllowPureOccluded',
+                               'AOLimitRayDistance', 'AOAttenConstant', 'AOAttenLinear', 'AOAttenCuadratic',
+                               'AOJitter', 'AOIgnoreBackfaceHits')),
+                          set(('AOBackgroundColor', 'AOOccludedColor', 'AOUnoccludedColor'))),
+    'BENT_NORMAL': ('GenBent', '_bentNormals',
+                    set(('BentRaysPerSample', 'BentConeAngle', 'BentBias', 'BentTangentSpace', 'BentLimitRayDistance',
+                         'BentJitter', 'BentDistribution', 'BentSwizzleX', 'BentSwizzleY', 'BentSwizzleZ')),
+                    set(('BentBackgroundColor',))),
+    'PRTPN': ('GenPRT', '_prtpn',
+              set(('PRTRaysPerSample', 'PRTConeAngle', 'PRTBias', 'PRTLimitRayDistance', 'PRTJitter',
+                   'PRTNormalize', 'PRTThreshold')),
+              set(('PRTBackgroundColor',))),
+    'CONVEXITY': ('GenConvexity', '_convexity',
+                  set(('ConvexityScale',)),
+                  set(('ConvexityBackgroundColor',))),
+    'THICKNESS': ('GenThickness', '_thickness',
+                  set(),
+                  set()),
+    'PROXIMITY': ('GenProximity', '_proximity',
+                  set(('ProximityRaysPerSample', 'ProximityConeAngle', 'ProximityLimitRayDistance')),
+                  set(('ProximityBackgroundColor',))),
+    'CAVITY': ('GenCavity', '_cavity',
+               set(('CavityRaysPerSample', 'CavityJitter', 'CavitySearchRadius', 'CavityContrast', 'CavitySteps')),
+               set(('CavityBackgroundColor',))),
+    'WIREFRAME_RAY_FAILS': ('GenWireRays', '_wirerays',
+                            set(('RenderRayFails', 'RenderWireframe')),
+                            set(('RenderWireframeCol', 'RenderCWCol', 'RenderSeamCol', 'RenderRayFailsCol',
+                                 'RenderWireframeBackgroundColor'))),
+    'DIRECTION': ('GenDirections', '_directions',
+                  set(('DirectionsTS', 'DirectionsSwizzleX', 'DirectionsSwizzleY', 'DirectionsSwizzleZ',
+                       'DirectionsTonemap', 'DirectionsMinVal', 'DirectionsMaxVal')),
+                  set(('VDMBackgroundColor',))),
+    'RADIOSITY_NORMAL': ('GenRadiosityNormals', '_radiosityNormals',
+                         set(('RadiosityNormalsRaysPerSample', 'RadiosityNormalsDistribution',
+                              'RadiosityNormalsConeAngle', 'RadiosityNormalsBias', 'RadiosityNormalsLimitRayDistance',
+                              'RadiosityNormalsAttenConstant', 'RadiosityNormalsAttenLinear',
+                              'RadiosityNormalsAttenCuadratic', 'RadiosityNormalsJitter', 'RadiosityNormalsContrast',
+                              'RadiosityNormalsEncodeAO', 'RadiosityNormalsCoordSys',
+                              'RadiosityNormalsAllowPureOcclusion')),
+                         set(('RadNMBackgroundColor',))),
+    'VERTEX_COLOR': ('BakeHighpolyVCols', '_vcols',
+                     set(),
+                     set(('BakeHighpolyVColsBackgroundCol',))),
+    'CURVATURE': ('GenCurv', '_curvature',
+                  set(('CurvRaysPerSample', 'CurvBias', 'CurvConeAngle', 'CurvJitter', 'CurvSearchDistance',
+                       'CurvTonemap', 'CurvDistribution', 'CurvAlgorithm', 'CurvSmoothing')),
+                  set(('CurvBackgroundColor',))),
+    'DERIVATIVE': ('GenDerivNM', '_derivative',
+                   set(),
+                   set(('DerivNMBackgroundColor',))),
+    }
+
+
+def flag(maptype):
+    return maps[maptype][0]
+
+
+def output_path(output, maptype):
+    """ The file xNormal writes a map to, given the configured output """
+    base, extension = os.path.splitext(output)
+    return base + maps[maptype][1] + extension
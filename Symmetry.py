@@ -0,0 +1,213 @@
+import os
+import numpy
+import hashlib
+
+from . import ImageIO
+from . import UVRaster
+
+# Objects that are mirrored along a world axis are baked with one half
+# only. Where the other half's UVs overlap the baked half there's nothing
+# left to do; where they are mirrored too the image is mirrored to fill
+# them in, flipping the normal channel that changes sign.
+
+# Maps that can be mirrored: scalars and colors as they are, normals with
+# one channel flipped
+maptypes = ('NORMAL', 'HEIGHT', 'BAKE_BASE_TEXTURE', 'AMBIENT_OCCLUSION', 'BENT_NORMAL', 'CONVEXITY',
+            'THICKNESS', 'PROXIMITY', 'CAVITY', 'VERTEX_COLOR', 'CURVATURE')
+
+# Distances within this fraction of the object size count as equal
+tolerance = 1e-4
+
+# UV distances within this count as equal
+uv_tolerance = 1e-4
+
+# Only bake halves if at least this fraction of all triangles is saved
+min_saving = 0.2
+
+# The axis of the obj files each world axis is written as, Z up becomes Y up
+obj_axes = (0, 2, 1)
+
+
+def supported(settings):
+    """ Whether the output of a bake can be mirrored """
+    return settings.maptype in maptypes and os.path.splitext(settings.output)[1].lower() in ImageIO.writers
+
+
+def _match(points, targets, spacing):
+    """ The index of the point at each target, or -1 """
+    keys = numpy.round(numpy.concatenate((points, targets)) / spacing).astype(numpy.int64)
+    ids = numpy.unique(keys, axis = 0, return_inverse = True)[1].reshape(-1)
+    lookup = numpy.full(ids.max() + 1, -1, dtype = numpy.int64)
+    lookup[ids[:len(points)]] = numpy.arange(len(points))
+    return lookup[ids[len(points):]]
+
+
+def _pairs(centers, axis):
+    """ Match every polygon on the negative side of the plane through the
+        middle of `axis` with its mirror image. Returns the plane, the
+        matched polygons and their partners. """
+
+    size = max(float((centers.max(axis = 0) - centers.min(axis = 0)).max()), 1e-8)
+    plane = (centers[:, axis].min() + centers[:, axis].max()) / 2
+
+    mirrored = centers.copy()
+    mirrored[:, axis] = 2 * plane - mirrored[:, axis]
+    partners = _match(centers, mirrored, size * tolerance)
+
+    negative = (centers[:, axis] < plane - size * tolerance) & (partners >= 0)
+    polygons = numpy.nonzero(negative)[0]
+    return plane, polygons, partners[polygons]
+
+
+def detect(centers, uv_centers):
+    """ Find the mirror symmetry that saves the most polygons. `centers`
+        (P, 3) are the world space centers of the low poly polygons and
+        `uv_centers` (P, 2) the centers of their UVs. Returns None or a dict
+        with the mirror 'axis' and 'plane' in world space, the 'uv_axis' (0
+        for U, 1 for V) and 'center' the UVs are mirrored across or None if
+        they overlap, the 'side' of the center the UVs are mirrored to and
+        the polygons to 'discard'. """
+
+    centers, uv_centers = numpy.asarray(centers, numpy.float64), numpy.asarray(uv_centers, numpy.float64)
+    if not len(centers):
+        return None
+
+    best = None
+    for axis in range(3):
+        plane, polygons, partners = _pairs(centers, axis)
+        if not len(polygons):
+            continue
+        own, other = uv_centers[polygons], uv_centers[partners]
+
+        # Overlapping UVs, or UVs mirrored across a line in U or V
+        candidates = [(None, None, 0, numpy.all(numpy.abs(own - other) < uv_tolerance, axis = 1))]
+        for uv_axis in (0, 1):
+            across = 1 - uv_axis
+            middles = (own[:, uv_axis] + other[:, uv_axis]) / 2
+            aligned = numpy.abs(own[:, across] - other[:, across]) < uv_tolerance
+            aligned &= numpy.abs(own[:, uv_axis] - other[:, uv_axis]) > uv_tolerance
+            if not aligned.any():
+                continue
+            center = float(numpy.median(middles[aligned]))
+            mirrored = aligned & (numpy.abs(middles - center) < uv_tolerance)
+
+            # All of the discarded half has to be on one side of the center
+            side = 1 if (own[mirrored, uv_axis] > center).sum() * 2 > mirrored.sum() else -1
+            mirrored &= (own[:, uv_axis] - center) * side > 0
+            candidates.append((uv_axis, center, side, mirrored))
+
+        for uv_axis, center, side, discard in candidates:
+            if best is None or discard.sum() > len(best['discard']):
+                best = {'axis': axis, 'plane': plane, 'uv_axis': uv_axis, 'center': center, 'side': side,
+                        'discard': polygons[discard]}
+
+    if best is None or len(best['discard']) < min_saving * len(centers):
+        return None
+    return best
+
+
+def flip_channel(symmetry, swizzle, tangent_space):
+    """ The channel of a normal map that changes sign on the mirrored half,
+        given the 'X+'... swizzle of each channel. Tangent space normals
+        flip along the mirrored UV axis, object space ones along the world
+        axis as it is named in the Y up obj files. """
+    if tangent_space:
+        if symmetry['center'] is None:
+            return None
+        letter = 'XY'[symmetry['uv_axis']]
+    else:
+        letter = 'XYZ'[obj_axes[symmetry['axis']]]
+    for channel, axis in enumerate(swizzle):
+        if axis[0] == letter:
+            return channel
+    return None
+
+
+def save_protect(triangles, prefix):
+    """ Save UV triangles to a file named `prefix` and a hash of them, so
+        journal entries only hold the path. Files of other triangles with
+        the same prefix are removed. Returns the path. """
+    triangles = numpy.ascontiguousarray(triangles, dtype = numpy.float64)
+    digest = hashlib.sha1(triangles.tobytes()).hexdigest()[:12]
+    path = '%s%s.npy' % (prefix, digest)
+    if not os.path.isfile(path):
+        numpy.save(path, triangles)
+    
+    directory, name = os.path.split(prefix)
+    for other in os.listdir(directory or '.'):
+        if other.startswith(name) and other != os.path.basename(path):
+            os.remove(os.path.join(directory, other))
+    return path
+
+
+def options(symmetry, uvs, polygons, offset, padding, background, flip = None, guide_flip = None, prefix = 'protect_'):
+    """ The mirror settings as a plain dict, to be journaled and used by the
+        background pipeline. `uvs` are the UVs of all triangles, `polygons`
+        the polygon of each and `offset` the UV offset of the bake. Pixels
+        in the `background` color aren't flipped. The triangles that keep
+        their pixels are saved with save_protect(). None if there's nothing
+        to mirror. """
+    if symmetry['center'] is None:
+        return None
+
+    # Triangles that are baked on the mirrored side keep their pixels
+    uv_axis, center, side = symmetry['uv_axis'], symmetry['center'], symmetry['side']
+    discarded = numpy.zeros(polygons.max() + 1 if len(polygons) else 0, dtype = bool)
+    discarded[symmetry['discard']] = True
+    kept = ~discarded[polygons]
+    kept &= ((numpy.asarray(uvs)[:, :, uv_axis] - center) * side > 0).any(axis = 1)
+
+    return {'uv_axis': uv_axis,
+            'center': center + offset[uv_axis],
+            'side': side,
+            'protect': save_protect(numpy.asarray(uvs)[kept] + offset, prefix),
+            'padding': padding,
+            'background': tuple(background) if background is not None else None,
+            'flip': flip,
+            'guide_flip': guide_flip,
+            }
+
+
+def mirror(image, options, flip = None, background = None):
+    """ Fill the mirrored side of an image with the other side, flipping
+        channel `flip` of everything but the `background` color. Returns a
+        float image. """
+
+    image = ImageIO.to_float(image).copy()
+    height, width = image.shape[:2]
+
+    # Protected pixels and their padding stay as baked
+    protect = numpy.load(options['protect']).reshape(-1, 3, 2)
+    kept = (UVRaster.coverage(protect, width, height) > 0)[::-1]
+    for step in range(options['padding']):
+        grown = kept.copy()
+        grown[1:] |= kept[:-1]
+        grown[:-1] |= kept[1:]
+        grown[:, 1:] |= kept[:, :-1]
+        grown[:, :-1] |= kept[:, 1:]
+        kept = grown
+
+    # Work with V going up and the mirrored axis first
+    view = image[::-1]
+    kept = kept[::-1]
+    if options['uv_axis'] == 0:
+        view, kept = view.swapaxes(0, 1), kept.swapaxes(0, 1)
+    size = view.shape[0]
+
+    line = int(round(2 * options['center'] * size))
+    index = numpy.arange(size)
+    source = line - 1 - index
+    filled = ((index + 0.5 - options['center'] * size) * options['side'] > 0) & (source >= 0) & (source < size)
+
+    targets = numpy.nonzero(filled)[0]
+    values = view[source[targets]]
+    if flip is not None:
+        flipped = values.copy()
+        flipped[:, :, flip] = 1 - flipped[:, :, flip]
+        if background is not None:
+            empty = numpy.all(numpy.abs(values[:, :, :len(background)] - background) < 1e-3, axis = 2)
+            flipped[empty] = values[empty]
+        values = flipped
+    keep = kept[targets]
+    view[targets] = numpy.where(keep[:, :, None], view[targets], values)
+    return image
@@ -0,0 +1,229 @@
+import numpy
+
+
+# Maximum number of candidate pixels tested at once, to bound memory use
+chunk_size = 1 << 22
+
+# Sub-pixel steps of the fixed point UVs
+subpixels = 256
+
+# UVs are clamped to this many tiles around the image, keeping fixed point
+# coordinates within 32 and edge functions within 64 bits
+uv_limit = 16
+
+# Bounding boxes up to this size are binned exactly, larger ones by the
+# power of two they fit in
+exact_size = 8
+
+# Triangles are visited in cells of 2 ** cell_shift pixels
+cell_shift = 6
+
+
+def triangulate(loop_start, loop_total):
+    """ Fan-triangulate polygons given by their first loop and loop count.
+        Returns a (T, 3) array of loop indices and the polygon of each. """
+
+    loop_start = numpy.asarray(loop_start, dtype = numpy.int64)
+    loop_total = numpy.asarray(loop_total, dtype = numpy.int64)
+
+    counts = numpy.maximum(loop_total - 2, 0)
+    polygons = numpy.repeat(numpy.arange(len(loop_start)), counts)
+    first = numpy.repeat(loop_start, counts)
+
+    # The index of each triangle within its polygon
+    offsets = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+
+    triangles = numpy.empty((len(polygons), 3), dtype = numpy.int64)
+    triangles[:, 0] = first
+    triangles[:, 1] = first + offsets + 1
+    triangles[:, 2] = first + offsets + 2
+    return triangles, polygons
+
+
+def rasterize(uvs, width, height):
+    """ Find the pixels whose centers lie inside each UV triangle.
+
+        `uvs` is a (T, 3, 2) array of triangle UVs, the 0-1 range covers the
+        image. Yields (pixels, triangles) array pairs, where pixels are flat
+        indices (y * width + x) with y going up like V. Pixels on an edge
+        shared by two triangles belong to exactly one of them. """
+
+    # Snap to fixed point so the edge functions are exact integers and two
+    # triangles sharing an edge always agree on who owns a pixel on it
+    uvs = numpy.asarray(uvs, dtype = numpy.float64).reshape(-1, 6)
+    scale = numpy.tile((width * subpixels, height * subpixels), 3)
+    points = numpy.rint(numpy.clip(uvs, -uv_limit, uv_limit) * scale).astype(numpy.int32).T
+    coordinates = [numpy.ascontiguousarray(column) for column in points]
+
+    # Spatial hash: triangles are binned by the cell of the image their
+    # bounding box starts in, and by its size, rounded up to a power of two
+    # for large ones. Every size is tested against one grid of candidate
+    # pixels placed at each bounding box, going through the image cell by
+    # cell.
+    low_x, low_y, high_x, high_y = _bounds(coordinates, width, height)
+    columns, rows = _bin_size(high_x - low_x + 1), _bin_size(high_y - low_y + 1)
+    shift = cell_shift
+    while ((width >> shift) + 1) * ((height >> shift) + 1) >= 1 << 15:
+        shift += 1
+    cells = (low_y >> shift) * ((width >> shift) + 1) + (low_x >> shift)
+    order = numpy.nonzero((high_x >= low_x) & (high_y >= low_y))[0]
+    order = order[numpy.argsort(cells[order].astype(numpy.int16), kind = 'stable')]
+    keys = _bin_index(columns[order]) * 32 + _bin_index(rows[order])
+    order = order[numpy.argsort(keys.astype(numpy.int16), kind = 'stable')]
+    if not len(order):
+        return
+
+    # Everything per triangle in bin order
+    a_x, a_y, b_x, b_y, c_x, c_y = [column[order].astype(numpy.int64) for column in coordinates]
+    low_x, low_y, high_x, high_y = _bounds((a_x, a_y, b_x, b_y, c_x, c_y), width, height)
+    columns, rows = _bin_size(high_x - low_x + 1), _bin_size(high_y - low_y + 1)
+    bounds = numpy.nonzero((numpy.diff(columns) != 0) | (numpy.diff(rows) != 0))[0] + 1
+    bounds = numpy.concatenate(([0], bounds, [len(order)]))
+
+    # Make all triangles counter-clockwise
+    area = (b_x - a_x) * (c_y - a_y) - (b_y - a_y) * (c_x - a_x)
+    clockwise = area < 0
+    b_x, c_x = numpy.where(clockwise, c_x, b_x), numpy.where(clockwise, b_x, c_x)
+    b_y, c_y = numpy.where(clockwise, c_y, b_y), numpy.where(clockwise, b_y, c_y)
+
+    # Edge functions w = step_x * x + step_y * y + offset at pixel (x, y)
+    # of the bounding box, positive inside. With the top-left rule only one
+    # of two triangles sharing an edge owns it, which is folded into the
+    # offset.
+    half = subpixels // 2
+    edges = []
+    for start_x, start_y, end_x, end_y in ((a_x, a_y, b_x, b_y), (b_x, b_y, c_x, c_y), (c_x, c_y, a_x, a_y)):
+        dx, dy = end_x - start_x, end_y - start_y
+        owner = (dy > 0) | ((dy == 0) & (dx < 0))
+        step_x, step_y = -dy * subpixels, dx * subpixels
+        offset = dx * (half - start_y) - dy * (half - start_x) + owner + step_x * low_x + step_y * low_y
+        edges.append((step_x, step_y, offset))
+
+    # Triangles without area never pass the first edge
+    for value in edges[0]:
+        value[area == 0] = 0
+
+    origins = low_y * width + low_x
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        grid_x, grid_y = numpy.arange(columns[first]), numpy.arange(rows[first])
+        pattern = (grid_y[:, None] * width + grid_x).reshape(-1)
+        partial = columns[first] > exact_size or rows[first] > exact_size
+
+        step = max(chunk_size // len(pattern), 1)
+        for chunk in range(first, last, step):
+            part = slice(chunk, min(chunk + step, last))
+            inside = None
+            for step_x, step_y, offset in edges:
+                along_x = offset[part, None] + step_x[part, None] * grid_x
+                along_y = step_y[part, None] * grid_y
+                test = along_x[:, None, :] + along_y[:, :, None] > 0
+                inside = test if inside is None else inside & test
+            if partial:
+                inside &= (grid_x <= (high_x[part] - low_x[part])[:, None])[:, None, :]
+                inside &= (grid_y <= (high_y[part] - low_y[part])[:, None])[:, :, None]
+
+            hits, candidates = numpy.divmod(numpy.flatnonzero(inside), len(pattern))
+            hits += chunk
+            yield origins[hits] + pattern[candidates], order[hits]
+
+
+def _bounds(coordinates, width, height):
+    """ The first and last pixel whose center is within the bounding box of
+        each triangle, given the fixed point coordinates of its corners """
+    a_x, a_y, b_x, b_y, c_x, c_y = coordinates
+    half = subpixels // 2
+    low_x = numpy.maximum(-((half - numpy.minimum(numpy.minimum(a_x, b_x), c_x)) // subpixels), 0)
+    low_y = numpy.maximum(-((half - numpy.minimum(numpy.minimum(a_y, b_y), c_y)) // subpixels), 0)
+    high_x = numpy.minimum((numpy.maximum(numpy.maximum(a_x, b_x), c_x) - half) // subpixels, width - 1)
+    high_y = numpy.minimum((numpy.maximum(numpy.maximum(a_y, b_y), c_y) - half) // subpixels, height - 1)
+    return low_x, low_y, high_x, high_y
+
+
+def _bin_index(size):
+    """ A small index for each bin size """
+    return numpy.where(size > exact_size, exact_size + numpy.log2(size).astype(numpy.int64), size)
+
+
+def _bin_size(size):
+    """ The bounding box size a triangle is binned with """
+    rounded = 1 << numpy.ceil(numpy.log2(numpy.maximum(size, 1))).astype(numpy.int64)
+    return numpy.where(size > exact_size, rounded, numpy.maximum(size, 1))
+
+
+def _collect(uvs, width, height):
+    pixels, triangles = [], []
+    for chunk_pixels, chunk_triangles in rasterize(uvs, width, height):
+        pixels.append(chunk_pixels)
+        triangles.append(chunk_triangles)
+    if not pixels:
+        return numpy.zeros(0, dtype = numpy.int64), numpy.zeros(0, dtype = numpy.int64)
+    return numpy.concatenate(pixels), numpy.concatenate(triangles)
+
+
+def coverage(uvs, width, height):
+    """ The number of triangles covering each pixel, as a (height, width) array """
+
+    pixels, triangles = _collect(uvs, width, height)
+    return numpy.bincount(pixels, minlength = width * height).reshape(height, width)
+
+
+def overlaps(uvs, width, height):
+    """ Find overlapping UV triangles. Returns the number of pixels covered
+        more than once, the number of covered pixels and the indices of the
+        overlapping triangles. """
+
+    pixels, triangles = _collect(uvs, width, height)
+    counts = numpy.bincount(pixels, minlength = width * height)
+    overlapping = counts > 1
+
+    return int(overlapping.sum()), int((counts > 0).sum()), numpy.unique(triangles[overlapping[pixels]])
+
+
+def out_of_range(uvs, u = 0, v = 0):
+    """ Indices of triangles that are not completely inside the UV tile (u, v) """
+
+    uvs = numpy.asarray(uvs)
+    inside = ((uvs >= (u, v)) & (uvs <= (u + 1, v + 1))).all(axis = (1, 2))
+    return numpy.nonzero(~inside)[0]
+
+
+def triangle_tiles(uvs):
+    """ The UDIM tile (u, v) the center of each triangle lies in """
+    return numpy.floor(numpy.asarray(uvs).mean(axis = 1)).astype(numpy.int64)
+
+
+def udim(u, v):
+    """ The UDIM number of the tile (u, v) """
+    return 1001 + u + 10 * v
+
+
+def islands(loop_vertices, uvs, triangles):
+    """ The UV island of each triangle. Triangles are connected where they
+        share a vertex with the same UVs. `triangles` holds loop indices. """
+
+    # Loops sharing a vertex and its UVs are one point of the island
+    keys = numpy.column_stack((loop_vertices, numpy.round(numpy.asarray(uvs) * 1e5)))
+    points = numpy.unique(keys, axis = 0, return_inverse = True)[1].reshape(-1)[triangles]
+
+    # Spread the smallest point of every triangle until nothing changes
+    labels = numpy.arange(points.max() + 1 if len(points) else 0)
+    while True:
+        lowest = labels[points].min(axis = 1)
+        spread = labels.copy()
+        numpy.minimum.at(spread, points.reshape(-1), numpy.repeat(lowest, 3))
+        spread = spread[spread]
+        if numpy.array_equal(spread, labels):
+            break
+        labels = spread
+
+    return numpy.unique(labels[points[:, 0]], return_inverse = True)[1].reshape(-1)
+
+
+def island_map(uvs, islands, width, height):
+    """ The island of each pixel as a (height, width) array with the top row
+        first, -1 where there is none """
+
+    image = numpy.full(width * height, -1, dtype = numpy.int64)
+    for pixels, triangles in rasterize(uvs, width, height):
+        image[pixels] = islands[triangles]
+    return image.reshape(height, width)[::-1]
@@ -0,0 +1,51 @@
+import bpy
+import time
+
+
+# Names of the objects being watched
+watched = set()
+
+# Time of the last edit to a watched object that hasn't been baked yet
+last_edit = 0
+dirty = False
+
+# Ignore updates we cause ourselves while exporting
+suspended = False
+
+
+def scene_update(scene):
+    global last_edit, dirty
+
+    if suspended or not bpy.data.objects.is_updated:
+        return
+
+    for name in watched:
+        obj = bpy.data.objects.get(name)
+        if obj is not None and (obj.is_updated or obj.is_updated_data):
+            last_edit = time.time()
+            dirty = True
+            return
+
+
+def active():
+    return scene_update in bpy.app.handlers.scene_update_post
+
+
+def start(names):
+    global dirty
+    watched.clear()
+    watched.update(names)
+    dirty = False
+    if not active():
+        bpy.app.handlers.scene_update_post.append(scene_update)
+
+
+def stop():
+    watched.clear()
+    if active():
+        bpy.app.handlers.scene_update_post.remove(scene_update)
+
+
+def settled(debounce):
+    """ True once there are edits and none came in for `debounce` seconds """
+    return dirty and time.time() - last_edit >= debounce
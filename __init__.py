@@ -13,35 +13,105 @@ bl_info = {
 if "bpy" in locals():
     import imp
     imp.reload(MapTypeSettings)
+    imp.reload(Pairing)
+    imp.reload(Export)
+    imp.reload(Config)
+    imp.reload(History)
+    imp.reload(Launcher)
+    imp.reload(Watch)
+    imp.reload(UVRaster)
+    imp.reload(Preflight)
+    imp.reload(ImageIO)
+    imp.reload(Denoise)
+    imp.reload(RawCache)
+    imp.reload(Convert)
+    imp.reload(RayDistance)
+    imp.reload(RayFails)
+    imp.reload(Lod)
+    imp.reload(Journal)
+    imp.reload(Symmetry)
 else:
     from . import MapTypeSettings
+    from . import Pairing
+    from . import Export
+    from . import Config
+    from . import History
+    from . import Launcher
+    from . import Watch
+    from . import UVRaster
+    from . import Preflight
+    from . import ImageIO
+    from . import Denoise
+    from . import RawCache
+    from . import Convert
+    from . import RayDistance
+    from . import RayFails
+    from . import Lod
+    from . import Journal
+    from . import Symmetry
 
 import bpy
 from bpy.props import *
 from bpy.types import Panel, Operator, AddonPreferences
 from bpy.utils import register_class, unregister_class
 import os
-import math
+import threading
 
 
 def getPrefs(ctx):
     return ctx.user_preferences.addons[__name__].preferences
 
 
-def bool2str(boolean):
-    if boolean:
-        return "true"
-    else:
-        return "false"
-    
+def history_path():
+    directory = bpy.utils.user_resource('CONFIG', path = 'xnormal', create = True)
+    return os.path.join(directory, 'bake_history.sqlite')
+
+
+def journal_path():
+    directory = bpy.utils.user_resource('CONFIG', path = 'xnormal', create = True)
+    return os.path.join(directory, 'bake_journal.jsonl')
+
 
-def ensure_dir(directory):
-    if not os.path.exists(directory):
+# What the panel shows about earlier bakes, updated in the background so
+# drawing never reads the history, the journal or mesh files
+panel_status = {'key': None, 'estimate': None, 'interrupted': 0, 'journal': 0}
+_status_thread = None
+
+
+def refresh_status(settings):
+    """ Update panel_status in the background once the bake settings or
+        the history changed. Count up its 'journal' after changing the
+        journal. """
+    global _status_thread
+    
+    info = History.job_info(settings, count = False)
+    key = (tuple(sorted(info.items())), History._revision, panel_status['journal'])
+    if key == panel_status['key'] or (_status_thread is not None and _status_thread.is_alive()):
+        return
+    
+    def refresh(history, journal):
+        estimate, interrupted = None, 0
         try:
-            os.makedirs(directory)
-            return True
-        except:
-            return False
+            estimate = History.estimate(history, History.count_info(info))
+            interrupted = len(Journal.interrupted(journal))
+        finally:
+            panel_status.update(key = key, estimate = estimate, interrupted = interrupted)
+    
+    _status_thread = threading.Thread(target = refresh, args = (history_path(), journal_path()))
+    _status_thread.daemon = True
+    _status_thread.start()
+
+
+def over_budget(prefs, estimate):
+    """ The ways in which an estimated bake exceeds the configured budget """
+    problems = []
+    if estimate is not None:
+        seconds, memory = estimate
+        if prefs.budget_minutes and seconds > prefs.budget_minutes * 60:
+            problems.append('Bake is estimated to take %s' % History.format_duration(seconds))
+        if prefs.budget_memory and memory > prefs.budget_memory * 1024 ** 2:
+            problems.append('Bake is estimated to use %s' % History.format_memory(memory))
+    return problems
 
 
 class BakeXNormalPreferences(AddonPreferences):
@@ -51,10 +121,92 @@ class BakeXNormalPreferences(AddonPreferences):
                                      default = '',
                                      subtype = 'FILE_PATH'
                                      )
+    budget_minutes = IntProperty(name = 'Time budget (minutes)',
+                                 description = 'Warn about bakes estimated to take longer than this, 0 for no limit',
+                                 default = 0,
+                                 min = 0
+                                 )
+    budget_memory = IntProperty(name = 'Memory budget (MB)',
+                                description = 'Warn about bakes estimated to use more memory than this, 0 for no limit',
+                                default = 0,
+                                min = 0
+                                )
+
+    
+    # Resources the baker may use
+    priority = EnumProperty(name = 'Priority',
+                            description = 'Process priority of the baker',
+                            default = 'NORMAL',
+                            items = (('NORMAL', 'Normal', ''),
+                                     ('BELOW_NORMAL', 'Below normal', 'Keep the workstation responsive during bakes'),
+                                     ('IDLE', 'Idle', 'Only bake when nothing else wants the CPU'),
+                                     )
+                            )
+    cpu_affinity = StringProperty(name = 'CPUs',
+                                  description = 'CPUs the baker may run on, e.g. 0-3,6. Empty for all',
+                                  default = ''
+                                  )
+    max_threads = IntProperty(name = 'Max threads',
+                              description = 'Maximum number of CPUs the baker may use, 0 for no limit',
+                              default = 0,
+                              min = 0
+                              )
+    max_memory = IntProperty(name = 'Max memory (MB)',
+                             description = 'Kill bakes that use more memory than this, 0 for no limit',
+                             default = 0,
+                             min = 0
+                             )
+    max_parallel_bakes = IntProperty(name = 'Parallel bakes',
+                                     description = 'How many bakes, e.g. UDIM tiles, may run at the same time',
+                                     default = 1,
+                                     min = 1
+                                     )
 
     def draw(self, ctx):
         l = self.layout
         l.prop(self, "path_to_xNormal")
+        row = l.row()
+        row.prop(self, "budget_minutes")
+        row.prop(self, "budget_memory")
+        row = l.row()
+        row.prop(self, "priority")
+        row.prop(self, "cpu_affinity")
+        row = l.row()
+        row.prop(self, "max_threads")
+        row.prop(self, "max_memory")
+        l.prop(self, "max_parallel_bakes")
+
+
+class XNormalMesh(bpy.types.PropertyGroup):
+    # The name is the name of the exported object
+    path = StringProperty(name = 'Path', description = 'The file the object was exported to', subtype = 'FILE_PATH')
+    fingerprint = StringProperty(name = 'Fingerprint', description = 'Hash of the object as it was exported')
+    triangles = IntProperty(name = 'Triangles', description = 'Number of triangles in the exported file', default = 0)
+    offset = FloatVectorProperty(name = 'Offset', description = 'How far the object was moved when exploding the pairs', size = 3)
+
+register_class(XNormalMesh)
+
+
+class XNormalLowMesh(bpy.types.PropertyGroup):
+    # The name is the name of the exported low poly object
+    path = StringProperty(name = 'Path', description = 'The file the object was exported to', subtype = 'FILE_PATH')
+    fingerprint = StringProperty(name = 'Fingerprint', description = 'Hash of the object as it was exported')
+    triangles = IntProperty(name = 'Triangles', description = 'Number of triangles in the exported file', default = 0)
+    
+    cage = StringProperty(name = 'Cage', description = 'The name of the cage object of this low poly object')
+    cage_path = StringProperty(name = 'Cage path', description = 'The file the cage was exported to', subtype = 'FILE_PATH')
+    cage_fingerprint = StringProperty(name = 'Cage fingerprint', description = 'Hash of the cage as it was exported')
+    auto_cage_path = StringProperty(name = 'Auto cage path', description = 'The cage written from the ray distances, used if there is no cage object', subtype = 'FILE_PATH')
+    offset = FloatVectorProperty(name = 'Offset', description = 'How far the object and its cage were moved when exploding the pairs', size = 3)
+    
+    scale = FloatProperty(name = 'Scale', description = '', default = 1, min = 1, precision = 1)
+    normals = EnumProperty(name = 'Smooth normals', description = '', default = 'UseExportedNormals',
+                           items = (('UseExportedNormals', 'Exported normals', ''),
+                                    ('AverageNormals', 'Average normals', ''),
+                                    ('HardenNormals', 'Harden normals', ''),
+                                    ))
+
+register_class(XNormalLowMesh)
 
 
 class BakeXNormalSettings(bpy.types.PropertyGroup):
@@ -81,10 +233,48 @@ class BakeXNormalSettings(bpy.types.PropertyGroup):
                                     ),
                            )
 
+    exported_as = EnumProperty(name = 'Exported as',
+                               description = 'How the objects were last exported, used to export them again',
+                               default = 'SELECTION',
+                               items = (('SELECTION', 'Selection', ''),
+                                        ('PAIRS', 'Pairs', ''),
+                                        )
+                               )
+    
     selected_to_active = BoolProperty(name = 'Selected to active',
                                       description = 'Last selected object is the low poly model',
                                       default = True)
     
+    # Let Blender triangulate and compute the normals instead of xNormal
+    def use_exported_normals(self, context):
+        if self.export_triangulated:
+            self.low_normals = 'UseExportedNormals'
+            self.high_normals = 'UseExportedNormals'
+    
+    export_triangulated = BoolProperty(name = 'Triangulate',
+                                       description = 'Export triangulated meshes with the split normals Blender shades with',
+                                       default = False,
+                                       update = use_exported_normals)
+    
+    # Automatic pairing
+    pairing = EnumProperty(name = 'Pair by',
+                           description = 'How to find the low, high and cage objects that belong together',
+                           default = 'SUFFIX',
+                           items = (('SUFFIX', 'Name suffix', 'Pair objects by their name suffix, e.g. bolt_low and bolt_high'),
+                                    ('GROUP', 'Group', 'Pair the objects of each group, objects without a suffix are high poly'),
+                                    )
+                           )
+    low_suffix = StringProperty(name = 'Low suffix', description = 'Name suffix of low poly objects', default = '_low')
+    high_suffix = StringProperty(name = 'High suffix', description = 'Name suffix of high poly objects', default = '_high')
+    cage_suffix = StringProperty(name = 'Cage suffix', description = 'Name suffix of cage objects', default = '_cage')
+    explode = BoolProperty(name = 'Explode',
+                           description = 'Move the pairs apart while exporting so they can be baked in one run without hitting each other',
+                           default = True)
+    explode_spacing = FloatProperty(name = 'Spacing',
+                                    description = 'Distance between the bounding boxes of exploded pairs',
+                                    default = 100,
+                                    min = 0)
+    
     # Constant size options
     sizes = (('16',     '16', ''),
              ('32',     '32', ''),
@@ -172,6 +362,11 @@ class BakeXNormalSettings(bpy.types.PropertyGroup):
     low_match_uvs = BoolProperty(name = 'Match UVs', description = '', default = False)
     low_offset_u = IntProperty(name = 'U Offset', description = '', default = 0)
     low_offset_v = IntProperty(name = 'V Offset', description = '', default = 0)
+    udim = BoolProperty(name = 'UDIM tiles',
+                        description = 'Bake every UV tile used by the low poly objects into its own map. '
+                                      'The output path may contain a <UDIM> token for the tile number, '
+                                      'the UV offset moves the UVs across tiles',
+                        default = False)
     low_normals = EnumProperty(name = 'Smooth normals', description = '', default = 'UseExportedNormals', items = (('UseExportedNormals', 'Exported normals', ''),
                                                                                                          ('AverageNormals', 'Average normals', ''),
                                                                                                          ('HardenNormals', 'Harden normals', ''),
@@ -179,8 +374,39 @@ class BakeXNormalSettings(bpy.types.PropertyGroup):
                                )
     low_scale = FloatProperty(name = 'Scale', description = '', default = 1, min = 1, precision = 1)
     
-    # @todo: max ray distance front
-    # @todo: max ray distance rear
+    # Objects exported into the low and cage mesh files
+    low_objects = CollectionProperty(type = XNormalMesh)
+    cage_objects = CollectionProperty(type = XNormalMesh)
+    
+    # Low poly objects exported one file each, with their own cage and options
+    separate_lows = BoolProperty(name = 'Separate files',
+                                 description = 'Export every low poly object and its cage to its own file. '
+                                               'All of them bake into the same map',
+                                 default = False)
+    low_meshes = CollectionProperty(type = XNormalLowMesh)
+    
+    # Mirrored objects
+    symmetry = BoolProperty(name = 'Bake symmetric half',
+                            description = 'Bake only one half of low poly objects that are mirrored along an axis '
+                                          'and mirror the map to fill in the other half if its UVs are mirrored too',
+                            default = False)
+    
+    # Ray distances, computed by object.xnormal_ray_distances or set by hand
+    ray_distance_front = FloatProperty(name = 'Front distance',
+                                       description = 'How far outside the low poly mesh rays start, 0 for no limit',
+                                       default = 0,
+                                       min = 0,
+                                       precision = 4)
+    ray_distance_rear = FloatProperty(name = 'Rear distance',
+                                      description = 'How far inside the low poly mesh rays may go, 0 for no limit',
+                                      default = 0,
+                                      min = 0,
+                                      precision = 4)
+    ray_distance_margin = FloatProperty(name = 'Margin',
+                                        description = 'Safety margin added to computed ray distances, as a fraction of them',
+                                        default = 0.1,
+                                        min = 0,
+                                        max = 2)
     low_path = StringProperty(name = 'Path to low mesh',
                               description = 'The full path to the low mesh',
                               default = lowdir,
@@ -194,6 +420,15 @@ class BakeXNormalSettings(bpy.types.PropertyGroup):
                               subtype = 'FILE_PATH'
                               )
     
+    # Cages written from the ray distances, never replacing the cage above
+    use_auto_cage = BoolProperty(name = 'Use the auto cage',
+                                 description = 'Bake with the cage written from the ray distances where there is no other cage',
+                                 default = False)
+    auto_cage_path = StringProperty(name = 'Path to auto cage mesh',
+                                    description = 'The cage written from the ray distances',
+                                    subtype = 'FILE_PATH'
+                                    )
+    
     
     # High-specific options
     high_ignore_per_vertex_color = BoolProperty(name = 'Ignore per-vertex-color', description = '', default = True)
@@ -208,6 +443,72 @@ class BakeXNormalSettings(bpy.types.PropertyGroup):
                                                                                                         )
                                 )
     high_scale = FloatProperty(name = 'Scale', description = '', default = 1, min = 1, precision = 1)
+    
+    # High poly objects exported one file per object. If empty, high_path is used
+    high_meshes = CollectionProperty(type = XNormalMesh)
+    
+    # Checks before baking
+    preflight_strict = BoolProperty(name = 'Strict checks',
+                                    description = 'Refuse to bake on warnings like overlapping UVs too',
+                                    default = False)
+    
+    # Watch mode
+    watch_debounce = FloatProperty(name = 'Debounce',
+                                   description = 'Seconds without edits before re-baking',
+                                   default = 1,
+                                   min = 0.1,
+                                   subtype = 'TIME'
+                                   )
+    preview_size = EnumProperty(name = 'Preview size',
+                                description = 'Maximum size of maps baked while watching',
+                                default = '256',
+                                items = sizes
+                                )
+    convert_formats = EnumProperty(name = 'Convert to',
+                                   description = 'Formats to convert the baked image to in the background',
+                                   options = {'ENUM_FLAG'},
+                                   items = (('PNG', 'PNG', 'Lossless, 8 or 16 bit'),
+                                            ('EXR', 'EXR', 'Half or full float OpenEXR'),
+                                            ('DDS', 'DDS', 'DirectDraw Surface, optionally DXT1 compressed')),
+                                   default = set())
+    convert_bits = EnumProperty(name = 'Bit depth',
+                                description = 'Bits per channel of converted PNG and EXR images',
+                                items = (('8', '8 bit', ''),
+                                         ('16', '16 bit', ''),
+                                         ('32', '32 bit float', 'Only EXR, PNG is written with 16 bits')),
+                                default = '8')
+    convert_mipmaps = BoolProperty(name = 'Mipmaps',
+                                   description = 'Store the mip chain in DDS images',
+                                   default = True)
+    convert_compress = BoolProperty(name = 'Compress DDS',
+                                    description = 'DXT1 compress DDS images',
+                                    default = True)
+    convert_keep_original = BoolProperty(name = 'Keep original',
+                                         description = 'Keep the image xNormal wrote after converting it',
+                                         default = True)
+    lod_levels = IntProperty(name = 'LOD levels',
+                             description = 'Derive this many lower resolution maps from the bake, each half the size '
+                                           'of the previous one',
+                             default = 0,
+                             min = 0,
+                             max = 6
+                             )
+    denoise = EnumProperty(name = 'Denoise',
+                           description = 'Bake ray traced maps with few rays and filter the noise away afterwards',
+                           items = (('OFF', 'Off', 'Bake with the configured number of rays'),
+                                    ('FAST', 'Fast', '32 rays and a strong filter'),
+                                    ('BALANCED', 'Balanced', '64 rays and a medium filter'),
+                                    ('QUALITY', 'Quality', '128 rays and a light filter')),
+                           default = 'OFF')
+    raw_cache = BoolProperty(name = 'Recolor raw bakes',
+                             description = 'Keep a raw bake of the traced values and only recolor it when nothing but '
+                                           'colors, normalization or tone mapping changed',
+                             default = False)
+    preview_rays = IntProperty(name = 'Preview rays',
+                               description = 'Maximum number of rays for maps baked while watching',
+                               default = 16,
+                               min = 1
+                               )
                                   
     # MapType specific settings
     NORMAL_settings = PointerProperty(type = MapTypeSettings.NORMAL)
@@ -247,27 +548,14 @@ class Export_for_xnormal(Operator):
     bl_description = 'Exports selected objects for use in xNormal baker'
     
     filepath = ''
+    objects = ''
     
     def execute(self, context):
-        
-        # Make sure the target directory exists
-        directory, filename = os.path.split(self.filepath)
-        ensure_dir(directory)
-            
-        bpy.ops.export_scene.obj(
-                                 filepath = self.filepath,
-                                 use_selection = True,
-                                 use_mesh_modifiers = True,
-                                 use_edges = True,
-                                 use_normals = True,
-                                 use_uvs = True,
-                                 use_materials = False,
-                                 use_triangles = False,
-                                 use_nurbs = False,
-                                 use_vertex_groups = False,
-                                 group_by_object = True,
-                                 keep_vertex_order = True,
-                                 )
+        settings = context.scene.xnormal_settings
+        objects = Export.exportable(context.selected_objects)
+        Export.export_merged(getattr(settings, self.objects), self.filepath, objects, context.scene,
+                             settings.export_triangulated)
+        settings.exported_as = 'SELECTION'
         return {'FINISHED'}
 
 
@@ -278,6 +566,22 @@ class OBJECT_OT_export_for_xnormal_low(Export_for_xnormal):
     def __init__(self):
         settings = bpy.context.scene.xnormal_settings
         self.filepath = settings.low_path
+        self.objects = 'low_objects'
+    
+    def execute(self, context):
+        settings = context.scene.xnormal_settings
+        if not settings.separate_lows:
+            settings.low_meshes.clear()
+            return Export_for_xnormal.execute(self, context)
+        
+        # Cages are found by name, among all objects
+        suffixes = {'LOW': settings.low_suffix, 'HIGH': settings.high_suffix, 'CAGE': settings.cage_suffix}
+        lows = [obj for obj in Export.exportable(context.selected_objects)
+                if Pairing.split_name(obj.name, suffixes)[1] not in ('HIGH', 'CAGE')]
+        written = export_low_meshes(context.scene, lows, Pairing.find_cages(lows, context.scene.objects, settings))
+        settings.exported_as = 'SELECTION'
+        self.report({'INFO'}, 'Exported %d files for %d low poly objects' % (written, len(lows)))
+        return {'FINISHED'}
 
 
 class OBJECT_OT_export_for_xnormal_cage(Export_for_xnormal):
@@ -287,292 +591,819 @@ class OBJECT_OT_export_for_xnormal_cage(Export_for_xnormal):
     def __init__(self):
         settings = bpy.context.scene.xnormal_settings
         self.filepath = settings.cage_path
+        self.objects = 'cage_objects'
+
+
+def low_dir(settings):
+    """ The directory low poly objects and their cages are exported to when
+        exporting them separately """
+    return os.path.splitext(settings.low_path)[0]
+
+
+def export_low_meshes(scene, lows, cages):
+    """ Export each low poly object and its cage from the {low name: cage}
+        mapping to their own files. Returns the number of files written. """
+    
+    settings = scene.xnormal_settings
+    triangulate = settings.export_triangulated
+    written = Export.export_per_object(settings.low_meshes, low_dir(settings), lows, scene, triangulate)
+    for mesh in settings.low_meshes:
+        if mesh.name in cages:
+            mesh.cage = cages[mesh.name].name
+    written += Export.export_cages(settings.low_meshes, low_dir(settings), scene, triangulate)
+    return written
+
+
+def high_dir(settings):
+    """ The directory high poly objects are exported to, one file each """
+    return os.path.splitext(settings.high_path)[0]
 
 
-class OBJECT_OT_export_for_xnormal_high(Export_for_xnormal):
+class OBJECT_OT_export_for_xnormal_high(Operator):
     bl_idname = 'export_scene.obj_for_xnormal_high'
     bl_label = 'Export selected for xNormal (highpoly)'
+    bl_description = 'Exports each selected object to its own file, skipping objects that did not change'
     
-    def __init__(self):
-        settings = bpy.context.scene.xnormal_settings
-        self.filepath = settings.high_path
+    def execute(self, context):
+        settings = context.scene.xnormal_settings
+        objects = Export.exportable(context.selected_objects)
+        written = Export.export_per_object(settings.high_meshes, high_dir(settings), objects, context.scene,
+                                           settings.export_triangulated)
+        settings.exported_as = 'SELECTION'
+        self.report({'INFO'}, 'Exported %d of %d high poly objects' % (written, len(objects)))
+        return {'FINISHED'}
 
 
-class OBJECT_OT_bake_with_xnormal(Operator):
-    """ Bake using the external xNormal normal map baking tool """
-    bl_idname = 'object.bake_with_xnormal'
-    bl_label = 'Bake'
+class OBJECT_OT_clear_xnormal_low_meshes(Operator):
+    bl_idname = 'object.clear_xnormal_low_meshes'
+    bl_label = 'Use low mesh file'
+    bl_description = 'Forget the per-object low poly exports and bake the low mesh file instead'
     
     def execute(self, context):
+        settings = context.scene.xnormal_settings
+        settings.low_meshes.clear()
+        settings.separate_lows = False
+        return {'FINISHED'}
+
+
+class OBJECT_OT_clear_xnormal_high_meshes(Operator):
+    bl_idname = 'object.clear_xnormal_high_meshes'
+    bl_label = 'Use high mesh file'
+    bl_description = 'Forget the per-object high poly exports and bake the high mesh file instead'
+    
+    def execute(self, context):
+        context.scene.xnormal_settings.high_meshes.clear()
+        return {'FINISHED'}
+
+
+def export_pairs(context, pairs):
+    """ Export the low, high and cage objects of all pairs, exploded if
+        enabled. Returns the number of files written. """
+    
+    settings = context.scene.xnormal_settings
+    
+    # A cage has to cover the whole low poly or none of it
+    use_cage = all(pair.cages for pair in pairs)
+    
+    moved = []
+    offsets = []
+    written = 0
+    try:
+        if settings.explode:
+            offsets = Pairing.explode_offsets(pairs, settings.explode_spacing)
+            moved = Pairing.apply_offsets(pairs, offsets)
+            context.scene.update()
         
-        settings = bpy.context.scene.xnormal_settings
-        #import xml.dom.minidom as minidom
-        from xml.dom.minidom import Document
+        triangulate = settings.export_triangulated
+        lows = [obj for pair in pairs for obj in pair.lows]
+        if settings.separate_lows:
+            # Every pair's cage goes with its low poly objects
+            cages = dict((low.name, pair.cages[0]) for pair in pairs if len(pair.cages) == 1 for low in pair.lows)
+            cages.update(Pairing.find_cages(lows, [obj for pair in pairs for obj in pair.cages], settings))
+            written += export_low_meshes(context.scene, lows, cages)
+            use_cage = False
+        else:
+            settings.low_meshes.clear()
+            written += Export.export_merged(settings.low_objects, settings.low_path, lows, context.scene, triangulate)
+        written += Export.export_per_object(settings.high_meshes, high_dir(settings),
+                                            [obj for pair in pairs for obj in pair.highs], context.scene, triangulate)
+        if use_cage:
+            written += Export.export_merged(settings.cage_objects, settings.cage_path,
+                                            [obj for pair in pairs for obj in pair.cages], context.scene, triangulate)
+    finally:
+        Pairing.restore_offsets(moved)
+        context.scene.update()
+    
+    # Remember where every file was exploded to for what is derived from
+    # the exported meshes later
+    exploded = dict((obj.name, offset) for pair, offset in zip(pairs, offsets) for obj in pair.objects())
+    for entries in (settings.low_objects, settings.low_meshes, settings.high_meshes, settings.cage_objects):
+        for entry in entries:
+            entry.offset = exploded.get(entry.name, (0, 0, 0))
+    
+    settings.use_cage = use_cage
+    settings.exported_as = 'PAIRS'
+    return written
+
+
+def move_to_export(scene, objects):
+    """ Move exported objects to where the last export of exploded pairs
+        put them. Returns what Pairing.restore_offsets() needs to move them
+        back. """
+    from mathutils import Vector
+    
+    settings = scene.xnormal_settings
+    offsets = {}
+    for entries in (settings.low_objects, settings.low_meshes, settings.high_meshes, settings.cage_objects):
+        for entry in entries:
+            if any(entry.offset):
+                offsets[entry.name] = Vector(entry.offset)
+    moved = Pairing.move_objects([(obj, offsets[obj.name]) for obj in objects if obj.name in offsets])
+    if moved:
+        scene.update()
+    return moved
+
+
+class OBJECT_OT_export_pairs_for_xnormal(Operator):
+    """ Find low/high/cage pairs among the selected objects and export them
+        all at once, so a multi-part asset bakes in a single run """
+    bl_idname = 'export_scene.obj_for_xnormal_pairs'
+    bl_label = 'Export pairs for xNormal'
+    
+    def execute(self, context):
+        settings = context.scene.xnormal_settings
         
-        config = Document()
-        xml_settings = config.createElement("Settings") 
-        config.appendChild(xml_settings)
+        objects = context.selected_objects
+        pairs = Pairing.find_pairs(objects, settings, active = context.active_object)
+        if not pairs:
+            self.report({'ERROR'}, 'No low/high pairs found in the selection')
+            return {'CANCELLED'}
         
-        #
-        # High Poly Mesh
-        #
+        if any(pair.cages for pair in pairs) and not all(pair.cages for pair in pairs):
+            self.report({'WARNING'}, 'Only some pairs have a cage, not using cages')
         
-        xml_highpoly = config.createElement("HighPolyModel")
-        xml_settings.appendChild(xml_highpoly)
+        export_pairs(context, pairs)
         
-        xml_highpolymesh = config.createElement("Mesh")
-        xml_highpoly.appendChild(xml_highpolymesh)
+        self.report({'INFO'}, 'Exported %d pairs' % len(pairs))
+        return {'FINISHED'}
+
+
+def exported_objects(settings):
+    """ The objects that went into the last export, by their names """
+    names = [entry.name for entries in (settings.low_objects, settings.high_meshes, settings.cage_objects) for entry in entries]
+    names += [name for mesh in settings.low_meshes for name in (mesh.name, mesh.cage) if name]
+    return [bpy.data.objects[name] for name in names if name in bpy.data.objects]
+
+
+def export_again(context):
+    """ Repeat the last export, only writing what changed.
+        Returns the number of files written. """
+    
+    settings = context.scene.xnormal_settings
+    scene = context.scene
+    
+    if settings.exported_as == 'PAIRS':
+        lows = Export.low_poly_objects(settings)
+        active = lows[0] if len(lows) == 1 else None
+        return export_pairs(context, Pairing.find_pairs(exported_objects(settings), settings, active = active))
+    
+    def objects(entries):
+        return [bpy.data.objects[entry.name] for entry in entries if entry.name in bpy.data.objects]
+    
+    triangulate = settings.export_triangulated
+    if settings.low_meshes:
+        cages = dict((mesh.name, bpy.data.objects[mesh.cage]) for mesh in settings.low_meshes if mesh.cage in bpy.data.objects)
+        written = export_low_meshes(scene, objects(settings.low_meshes), cages)
+    else:
+        written = Export.export_merged(settings.low_objects, settings.low_path, objects(settings.low_objects), scene, triangulate)
+    written += Export.export_per_object(settings.high_meshes, high_dir(settings), objects(settings.high_meshes), scene, triangulate)
+    if settings.cage_objects:
+        written += Export.export_merged(settings.cage_objects, settings.cage_path, objects(settings.cage_objects), scene, triangulate)
+    return written
+
+
+class OBJECT_OT_xnormal_watch(Operator):
+    """ Re-export and re-bake at preview quality whenever the exported
+        objects are edited """
+    bl_idname = 'object.xnormal_watch'
+    bl_label = 'Watch'
+    
+    _timer = None
+    
+    def execute(self, context):
+        if Watch.active():
+            Watch.stop()
+            return {'FINISHED'}
         
-        # Variables
-        xml_highpolymesh.setAttribute("IgnorePerVertexColor", bool2str(settings.high_ignore_per_vertex_color))
-        xml_highpolymesh.setAttribute("AverageNormals", str(settings.high_normals))
-        xml_highpolymesh.setAttribute("File", str(settings.high_path))
-        xml_highpolymesh.setAttribute("Scale", str(settings.high_scale))
+        objects = exported_objects(context.scene.xnormal_settings)
+        if not objects:
+            self.report({'ERROR'}, 'Export the objects to watch first')
+            return {'CANCELLED'}
         
-        #
-        # Low Poly Mesh
-        #
+        Watch.start([obj.name for obj in objects])
+        self._timer = context.window_manager.event_timer_add(0.25, context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+    
+    def modal(self, context, event):
+        if not Watch.active():
+            context.window_manager.event_timer_remove(self._timer)
+            return {'CANCELLED'}
         
-        xml_lowpoly = config.createElement("LowPolyModel")
-        xml_settings.appendChild(xml_lowpoly)
+        if event.type == 'TIMER' and Watch.dirty:
+            # A newer edit makes every preview still running or queued stale
+            for job in Launcher.jobs:
+                if job.info.get('preview') and not job.finished.is_set():
+                    job.kill('superseded by a newer edit')
+            
+            # Edit mode changes only reach the mesh when leaving edit mode
+            if context.mode == 'OBJECT' and Watch.settled(context.scene.xnormal_settings.watch_debounce):
+                # The bake moves the objects to their exploded positions and
+                # back, which mustn't count as an edit
+                Watch.dirty = False
+                Watch.suspended = True
+                try:
+                    if export_again(context):
+                        bpy.ops.object.bake_with_xnormal(preview = True)
+                finally:
+                    Watch.suspended = False
+                    Watch.dirty = False
         
-        xml_lowpolymesh = config.createElement("Mesh")
-        xml_lowpoly.appendChild(xml_lowpolymesh)
+        return {'PASS_THROUGH'}
 
-        # Variables
-        xml_lowpolymesh.setAttribute("File", str(settings.low_path))
-        xml_lowpolymesh.setAttribute("AverageNormals", str(settings.low_normals))
-        xml_lowpolymesh.setAttribute("MatchUVs", str(settings.low_match_uvs))
-        xml_lowpolymesh.setAttribute("UOffset", str(settings.low_offset_u))
-        xml_lowpolymesh.setAttribute("VOffset", str(settings.low_offset_v))
-        xml_lowpolymesh.setAttribute("Scale", str(settings.low_scale))
-        
-        # If cagefile
-        if (settings.use_cage):
-            xml_lowpolymesh.setAttribute("CageFile", settings.cage_path)
-            xml_lowpolymesh.setAttribute("UseCage", bool2str(settings.use_cage))
+
+def low_uvs(scene, settings):
+    """ The UV triangles of the low poly objects, the UV island of each and
+        the object (an index into Export.low_poly_objects()) and polygon
+        each belongs to """
+    import numpy
+    uvs, islands, count = [numpy.zeros((0, 3, 2))], [numpy.zeros(0, dtype = numpy.int64)], 0
+    faces = [numpy.zeros((0, 2), dtype = numpy.int64)]
+    for index, obj in enumerate(Export.low_poly_objects(settings)):
+        data = Export.MeshData(obj, scene)
+        if data.uvs is not None:
+            ids = data.uv_islands()
+            uvs.append(data.uv_triangles())
+            islands.append(ids + count)
+            count += ids.max() + 1 if len(ids) else 0
+            polygons = data.triangle_polygons()
+            faces.append(numpy.column_stack((numpy.full(len(polygons), index, dtype = numpy.int64), polygons)))
+    return numpy.concatenate(uvs), numpy.concatenate(islands), numpy.concatenate(faces)
+
+
+def udim_tiles(uvs):
+    """ The UDIM tiles (u, v) used by the UV triangles """
+    import numpy
+    tiles = numpy.unique(UVRaster.triangle_tiles(uvs), axis = 0).tolist()
+    return sorted((tuple(tile) for tile in tiles), key = lambda tile: UVRaster.udim(*tile))
+
+
+def convert_output(output, options, entry = None):
+    """ A job callback denoising and converting the output of successful
+        bakes, journaling how far the bake of journal `entry` got """
+    def convert(job):
+        if job.returncode == 0 and not job.killed:
+            if entry is not None:
+                Journal.mark(journal_path(), entry, 'baked', image = output)
+            submit_output(output, options, entry)
+        elif entry is not None:
+            Journal.mark(journal_path(), entry, 'failed', reason = job.status())
+    return convert
+
+
+def submit_output(output, options, entry = None):
+    """ Convert.submit() that journals when journal `entry` is done """
+    future = Convert.submit(output, options)
+    if entry is None:
+        return
+    if future is None:
+        Journal.mark(journal_path(), entry, 'done')
+    else:
+        def done(future):
+            state = 'failed' if future.exception() is not None else 'done'
+            Journal.mark(journal_path(), entry, state)
+        future.add_done_callback(done)
+
+
+def bake_limits(prefs):
+    """ The Launcher.Limits the preferences ask for. Raises ValueError for
+        an invalid CPU list. """
+    return Launcher.Limits(priority = prefs.priority,
+                           cpus = Launcher.parse_cpu_list(prefs.cpu_affinity),
+                           max_threads = prefs.max_threads,
+                           max_memory = prefs.max_memory * 1024 ** 2)
+
+
+def bake_steps(settings, preview = False):
+    """ Which of denoising, ray fail analysis and LODs apply to a bake """
+    ray_fails = settings.WIREFRAME_RAY_FAILS_settings
+    denoising = settings.denoise != 'OFF' and settings.maptype in Denoise.maptypes
+    analyzing = settings.maptype == 'WIREFRAME_RAY_FAILS' and ray_fails.analyze and ray_fails.render_ray_fails
+    lods = settings.lod_levels > 0 and not preview and Lod.supported(settings)
+    return denoising, analyzing, lods
+
+
+def tile_uvs(settings, uv_data, tile):
+    """ The UV triangles, islands and faces of the low poly objects baked
+        into UDIM `tile` (u, v) or, without a tile, into the output """
+    uvs, islands, faces = uv_data
+    uvs = uvs + (settings.low_offset_u, settings.low_offset_v)
+    if tile is None:
+        return uvs, islands, faces
+    in_tile = (UVRaster.triangle_tiles(uvs) == tile).all(axis = 1)
+    return uvs[in_tile] - tile, islands[in_tile], faces[in_tile]
+
+
+def symmetry_problem(settings):
+    """ Why a bake can't be split into symmetric halves, or None """
+    if not Symmetry.supported(settings):
+        return 'Only scalar, color and normal maps written as TGA, BMP, PNG or EXR can be mirrored'
+    if settings.udim:
+        return 'UDIM bakes can\'t be mirrored'
+    if any(Config.cage_file(settings, mesh) for mesh in settings.low_meshes) or (Config.cage_file(settings) and not settings.low_meshes):
+        return 'Bakes with a cage can\'t be mirrored, the cage would have to be split too'
+    return None
+
+
+def export_halves(scene, settings):
+    """ Find mirror symmetry of the low poly objects and export the half of
+        them that is baked. Returns None or the {low poly file: half file}
+        mapping and the mirror options for the background pipeline. """
+    import numpy
+    import hashlib
+    
+    lows = Export.low_poly_objects(settings)
+    data = [Export.MeshData(obj, scene) for obj in lows]
+    if not lows or any(mesh.uvs is None for mesh in data):
+        return None
+    
+    centers, uv_centers = zip(*[mesh.polygon_centers() for mesh in data])
+    symmetry = Symmetry.detect(numpy.concatenate(centers), numpy.concatenate(uv_centers))
+    if symmetry is None:
+        return None
+    
+    # The polygons of each object that are baked
+    first = numpy.cumsum([0] + [len(mesh.loop_start) for mesh in data])
+    discarded = numpy.zeros(first[-1], dtype = bool)
+    discarded[symmetry['discard']] = True
+    keep = [numpy.nonzero(~discarded[start:end])[0] for start, end in zip(first[:-1], first[1:])]
+    
+    # Halves are named after what's in them, so unchanged ones aren't
+    # written again and raw bakes of them stay cached
+    triangulate = settings.export_triangulated
+    if settings.low_meshes:
+        parts = [(settings.low_meshes[obj.name].path, [obj], [polygons]) for obj, polygons in zip(lows, keep)]
+    else:
+        parts = [(settings.low_path, lows, keep)]
+    halves = {}
+    
+    # The halves have to line up with the exploded high poly files
+    moved = move_to_export(scene, lows)
+    try:
+        for path, objects, polygons in parts:
+            key = hashlib.sha1(str(triangulate).encode())
+            for obj, indices in zip(objects, polygons):
+                key.update(Export.fingerprint(obj, scene, triangulate)[0].encode())
+                key.update(indices.astype(numpy.int64).tobytes())
+            half = '%s_half_%s.obj' % (os.path.splitext(path)[0], key.hexdigest()[:12])
+            if not os.path.isfile(half):
+                Export.export_part(half, objects, polygons, scene, triangulate)
+            halves[path] = half
             
-        #
-        # The Maps
-        #
+            # Forget halves of earlier versions of the objects
+            directory, prefix = os.path.split(os.path.splitext(path)[0] + '_half_')
+            for name in os.listdir(directory or '.'):
+                if name.startswith(prefix) and not name.startswith(os.path.basename(half)):
+                    os.remove(os.path.join(directory, name))
+    finally:
+        Pairing.restore_offsets(moved)
+        scene.update()
+    
+    # Normal channels flip across the mirror
+    maptype_settings = getattr(settings, settings.maptype + '_settings')
+    flip = None
+    if hasattr(maptype_settings, 'swizzle_x'):
+        swizzle = (maptype_settings.swizzle_x, maptype_settings.swizzle_y, maptype_settings.swizzle_z)
+        flip = Symmetry.flip_channel(symmetry, swizzle, maptype_settings.tangentspace)
+    guide_flip = Symmetry.flip_channel(symmetry, ('X+', 'Y+', 'Z+'), False)
+    
+    uvs = numpy.concatenate([mesh.uv_triangles() for mesh in data])
+    polygons = numpy.concatenate([mesh.triangle_polygons() + start for mesh, start in zip(data, first)])
+    mirror = Symmetry.options(symmetry, uvs, polygons, (settings.low_offset_u, settings.low_offset_v),
+                              settings.padding, getattr(maptype_settings, 'bgcolor', None), flip, guide_flip,
+                              os.path.splitext(parts[0][0])[0] + '_protect_')
+    return halves, mirror
+
+
+def queue_map(scene, prefs, limits, info, config, uv_data = None, tile = None, preview = False, entry = None, mirror = None):
+    """ Queue the bake of one map or UDIM tile and everything that happens
+        to its output afterwards. `uv_data` is what low_uvs() returns, it's
+        needed for denoising, ray fail analysis and LODs. Bakes other than
+        previews are journaled; `entry` resumes a journaled bake, skipping
+        the bake if xNormal already finished it. `mirror` are the
+        Symmetry.options() of a bake of symmetric halves. """
+    
+    settings = scene.xnormal_settings
+    denoising, analyzing, lods = bake_steps(settings, preview)
+    uvs, islands, faces = tile_uvs(settings, uv_data, tile) if uv_data is not None else (None, None, None)
+    
+    post = Convert.options(settings)
+    if preview:
+        post['formats'] = []
+    if mirror:
+        post['mirror'] = mirror
+    if denoising:
+        Config.limit_rays(config, Denoise.presets[settings.denoise][0])
+    
+    output = Config.output_file(config, settings.maptype)
+    if tile is not None:
+        # xNormal puts the map suffix after the tile number, the map is
+        # moved to a name that ends with it
+        output = Config.tile_image(settings.output, settings.maptype, UVRaster.udim(*tile))
+        post['rename'] = output
+    baked = None
+    if entry is None and not preview:
+        entry = Journal.add(journal_path(), config, output, tile, info, post)
+    elif entry is not None:
+        Journal.session.add(entry['id'])
+        post = dict(entry['post'])
+        baked = entry.get('image') if entry['state'] == 'baked' else None
+        entry = entry['id']
+    
+    if lods:
+        post['lod'] = Lod.options(settings, uvs)
+    if analyzing:
+        names = [obj.name for obj in Export.low_poly_objects(settings)]
+        post['analyze'] = RayFails.options(settings, uvs, islands, faces, names, output)
+    
+    def queue_bake(config, info, callbacks = ()):
+        config_path = Config.write_config(config)
         
-        xml_genmaps = config.createElement("GenerateMaps")
-        xml_settings.appendChild(xml_genmaps)
-        
-        #common settings
-        xml_genmaps.setAttribute("Width", str(settings.width))
-        xml_genmaps.setAttribute("Height", str(settings.height))
-        xml_genmaps.setAttribute("EdgePadding", str(settings.padding))
-        xml_genmaps.setAttribute("BucketSize", str(settings.bucket_size))
-        xml_genmaps.setAttribute("AA", str(settings.anti_aliasing))
-        xml_genmaps.setAttribute("ClosestIfFails", bool2str(settings.use_closest_hit))
-        xml_genmaps.setAttribute("DiscardRayBackFacesHits", bool2str(settings.discard_back_faces))
-        xml_genmaps.setAttribute("File", str(settings.output))
-        
-        def denormalize(float):
-            return math.ceil(float * 255.0)
-        
-        def generateColorXML(name, vector):
-            xml_col = config.createElement(name)
-            xml_col.setAttribute("R", str(denormalize(vector[0])))
-            xml_col.setAttribute("G", str(denormalize(vector[1])))
-            xml_col.setAttribute("B", str(denormalize(vector[2])))
-            return xml_col
-        
-        # Set GenNormals false or else xNormal will assume it's true
-        xml_genmaps.setAttribute("GenNormals", "false")
-        
-        # Which map do we bake?
-        if settings.maptype == 'NORMAL':
-            s = settings.NORMAL_settings
-            xml_genmaps.setAttribute("GenNormals", "true")
-            xml_genmaps.setAttribute("SwizzleX", str(s.swizzle_x))
-            xml_genmaps.setAttribute("SwizzleY", str(s.swizzle_y))
-            xml_genmaps.setAttribute("SwizzleZ", str(s.swizzle_z))
-            xml_genmaps.setAttribute("TangentSpace", bool2str(s.tangentspace))
-            
-            xml_genmaps.appendChild(generateColorXML(name = 'NMBackgroundColor', vector = s.bgcolor)) 
-            
-        elif settings.maptype == 'HEIGHT':
-            s = settings.HEIGHT_settings
-            xml_genmaps.setAttribute("GenHeights", "true")
-            xml_genmaps.setAttribute("HeightTonemap", str(s.normalization))
-            xml_genmaps.setAttribute("HeightMinVal", str(s.min))
-            xml_genmaps.setAttribute("HeightMaxVal", str(s.max))
-            
-            xml_genmaps.appendChild(generateColorXML(name = 'HMBackgroundColor', vector = s.bgcolor))
-            
-        elif settings.maptype == 'AMBIENT_OCCLUSION':
-            s = settings.AMBIENT_OCCLUSION_settings
-            xml_genmaps.setAttribute("GenAO", "true")
-            xml_genmaps.setAttribute("AORaysPerSample", str(s.rays))
-            xml_genmaps.setAttribute("AODistribution", str(s.distribution))
-            xml_genmaps.setAttribute("AOConeAngle", str(s.spread_angle))
-            xml_genmaps.setAttribute("AOBias", str(s.bias))
-            xml_genmaps.setAttribute("AOAllowPureOccluded", bool2str(s.allow_full_occlusion))
-            xml_genmaps.setAttribute("AOLimitRayDistance", bool2str(s.limit_ray_distance))
-            xml_genmaps.setAttribute("AOAttenConstant", str(s.atten1))
-            xml_genmaps.setAttribute("AOAttenLinear", str(s.atten2))
-            xml_genmaps.setAttribute("AOAttenCuadratic", str(s.atten3))
-            xml_genmaps.setAttribute("AOJitter", bool2str(s.jitter))
-            xml_genmaps.setAttribute("AOIgnoreBackfaceHits", bool2str(s.ignore_backfaces))
-            
-            xml_genmaps.appendChild(generateColorXML(name = 'AOBackgroundColor', vector = s.bgcolor))
-            xml_genmaps.appendChild(generateColorXML(name = 'AOOccludedColor', vector = s.color_occluded))
-            xml_genmaps.appendChild(generateColorXML(name = 'AOUnoccludedColor', vector = s.color_unoccluded))
-         
-        elif settings.maptype == 'BENT_NORMAL':
-            s = settings.BENT_NORMAL_settings
-            xml_genmaps.setAttribute("GenBent", "true")
-            xml_genmaps.setAttribute("BentRaysPerSample", str(s.rays))
-            xml_genmaps.setAttribute("BentConeAngle", str(s.spread_angle))
-            xml_genmaps.setAttribute("BentBias", str(s.bias))
-            xml_genmaps.setAttribute("BentTangentSpace", bool2str(s.tangentspace))
-            xml_genmaps.setAttribute("BentLimitRayDistance", bool2str(s.limit_ray_distance))
-            xml_genmaps.setAttribute("BentJitter", bool2str(s.jitter))
-            xml_genmaps.setAttribute("BentDistribution", str(s.distribution))
-            xml_genmaps.setAttribute("BentSwizzleX", str(s.swizzle_x))
-            xml_genmaps.setAttribute("BentSwizzleY", str(s.swizzle_y))
-            xml_genmaps.setAttribute("BentSwizzleZ", str(s.swizzle_z))
-            
-            xml_genmaps.appendChild(generateColorXML(name = 'BentBackgroundColor', vector = s.bgcolor))
+        # Callbacks go in before submitting, the job may end right away
+        job = Launcher.BakeJob([prefs.path_to_xNormal, config_path], info, limits)
+        job.temporary_files.append(config_path)
+        job.on_finish(lambda job, path = history_path(): History.record(path, job))
+        for callback in callbacks:
+            job.on_finish(callback)
+        Launcher.queue.submit(job)
+        return job
+    
+    # Recolor the raw bake if there is one, bake it otherwise
+    if RawCache.cacheable(settings) and settings.raw_cache:
+        raw = RawCache.raw_config(config, settings.maptype, settings.denoise if denoising else '')
+        raw_image = Config.output_file(raw, settings.maptype)
+        post['remap'] = RawCache.remap_options(settings, output)
+        post.pop('rename', None)
+        if os.path.isfile(raw_image):
+            os.utime(raw_image, None)
+            submit_output(raw_image, post, entry)
+            return
+        Export.ensure_dir(os.path.dirname(raw_image))
+        RawCache.prune(raw_image)
+        config = raw
+    
+    if denoising:
+        guide = Config.guide_config(config)
+        post['denoise'] = Denoise.options(settings, uvs, islands)
+        post['denoise'].update(guide = Config.output_file(guide, 'NORMAL'))
+    
+    # A resumed bake that xNormal finished only needs processing
+    image = Config.output_file(config, settings.maptype)
+    if entry is not None and baked == image and os.path.isfile(image):
+        if denoising:
+            post['denoise']['guide_finished'] = threading.Event()
+            post['denoise']['guide_finished'].set()
+        submit_output(image, post, entry)
+        return
+    
+    if denoising:
+        guide_job = queue_bake(guide, dict(info, maptype = 'NORMAL', rays = 0, anti_aliasing = 1))
+        post['denoise'].update(guide_finished = guide_job.finished)
+    
+    queue_bake(config, dict(info), [convert_output(image, post, entry)])
+
+
+def report_problems(operator, problems):
+    """ Report preflight problems, returns False if baking should be refused """
+    for level, message in problems:
+        operator.report({level}, message)
+    return not any(level == 'ERROR' for level, message in problems)
+
+
+class OBJECT_OT_xnormal_preflight(Operator):
+    """ Check the exported meshes and settings for problems without baking """
+    bl_idname = 'object.xnormal_preflight'
+    bl_label = 'Check'
+    
+    def execute(self, context):
+        problems = Preflight.check(context.scene, context.scene.xnormal_settings, getPrefs(context))
+        report_problems(self, problems)
+        if not problems:
+            self.report({'INFO'}, 'Ready to bake')
+        return {'FINISHED'}
+
+
+def compute_ray_distances(context, lows, highs):
+    """ RayDistance.compute() with a progress bar """
+    settings = context.scene.xnormal_settings
+    window_manager = context.window_manager
+    window_manager.progress_begin(0, 100)
+    
+    # Measure where the objects were exported, so rays never hit the high
+    # poly of another exploded pair
+    moved = move_to_export(context.scene, lows + highs)
+    try:
+        return RayDistance.compute(lows, highs, context.scene, settings.ray_distance_margin,
+                                   lambda done, total: window_manager.progress_update(100 * done // total))
+    finally:
+        Pairing.restore_offsets(moved)
+        context.scene.update()
+        window_manager.progress_end()
+
+
+def write_auto_cages(scene, lows, fronts, normals):
+    """ Write cages pushed out by the front distances and bake with them.
+        The cages follow the low poly objects, not any cage objects, and
+        are only used where there is no cage. Returns the names of the
+        objects that keep their cage. """
+    
+    settings = scene.xnormal_settings
+    triangulate = settings.export_triangulated
+    
+    # The cages have to sit on the exported low poly objects
+    moved = move_to_export(scene, lows)
+    try:
+        if settings.low_meshes:
+            caged = [obj.name for obj in lows if settings.low_meshes[obj.name].cage_path]
+            for obj, distances, normal in zip(lows, fronts, normals):
+                if obj.name not in caged:
+                    mesh = settings.low_meshes[obj.name]
+                    mesh.auto_cage_path = os.path.join(low_dir(settings), bpy.path.clean_name(obj.name) + '_autocage.obj')
+                    RayDistance.write_cage(mesh.auto_cage_path, [obj], scene, [distances], [normal], triangulate)
+        elif settings.use_cage:
+            caged = [obj.name for obj in lows]
+        else:
+            caged = []
+            settings.auto_cage_path = os.path.splitext(settings.low_path)[0] + '_autocage.obj'
+            RayDistance.write_cage(settings.auto_cage_path, lows, scene, fronts, normals, triangulate)
+    finally:
+        Pairing.restore_offsets(moved)
+        scene.update()
+    
+    if len(caged) < len(lows):
+        settings.use_auto_cage = True
+    return caged
+
+
+def report_caged(operator, caged):
+    if caged:
+        operator.report({'WARNING'}, 'Kept the cage of %s, the auto cage is only used without one' % ', '.join(caged))
+
+
+class OBJECT_OT_xnormal_ray_distances(Operator):
+    """ Compute how far rays have to travel from the low poly to the high
+        poly objects and write a cage following those distances """
+    bl_idname = 'object.xnormal_ray_distances'
+    bl_label = 'Compute ray distances'
+    
+    write_cage = BoolProperty(name = 'Write cage',
+                              description = 'Write a cage with a front distance per vertex',
+                              default = True)
+    
+    def execute(self, context):
+        settings = context.scene.xnormal_settings
+        lows, highs = Export.low_poly_objects(settings), Export.find_objects(settings.high_meshes)
+        if not lows or not highs:
+            self.report({'ERROR'}, 'Export the low and high poly objects from this scene first')
+            return {'CANCELLED'}
+        try:
+            from mathutils import bvhtree
+        except ImportError:
+            self.report({'ERROR'}, 'Computing ray distances needs Blender 2.76 or newer')
+            return {'CANCELLED'}
         
-        elif settings.maptype == 'PRTPN':
-            s = settings.PRTPN_settings
-            xml_genmaps.setAttribute("GenPRT", "true")
-            xml_genmaps.setAttribute("PRTRaysPerSample", str(s.rays))
-            xml_genmaps.setAttribute("PRTConeAngle", str(s.spread_angle))
-            xml_genmaps.setAttribute("PRTBias", str(s.bias))
-            xml_genmaps.setAttribute("PRTLimitRayDistance", bool2str(s.limit_ray_distance))
-            xml_genmaps.setAttribute("PRTJitter", bool2str(s.jitter))
-            xml_genmaps.setAttribute("PRTNormalize", bool2str(s.prt_color_normalize))
-            xml_genmaps.setAttribute("PRTThreshold", str(s.threshold))
-        
-            xml_genmaps.appendChild(generateColorXML(name = 'PRTBackgroundColor', vector = s.bgcolor))
+        fronts, rears, normals = compute_ray_distances(context, lows, highs)
         
-        elif settings.maptype == 'CONVEXITY':
-            s = settings.CONVEXITY_settings
-            xml_genmaps.setAttribute("GenConvexity", "true")
-            xml_genmaps.setAttribute("ConvexityScale", str(s.convexity_scale))
-            
-            xml_genmaps.appendChild(generateColorXML(name = 'ConvexityBackgroundColor', vector = s.bgcolor))
+        front, rear = RayDistance.largest(fronts), RayDistance.largest(rears)
+        if not front:
+            self.report({'ERROR'}, 'No rays could be cast between the low and high poly objects')
+            return {'CANCELLED'}
+        settings.ray_distance_front = front
+        settings.ray_distance_rear = rear
         
-        elif settings.maptype == 'THICKNESS':
-            # Has no properties
-            xml_genmaps.setAttribute("GenThickness", "true")
-           
-        elif settings.maptype == 'PROXIMITY':
-            s = settings.PROXIMITY_settings
-            xml_genmaps.setAttribute("GenProximity", "true")
-            xml_genmaps.setAttribute("ProximityRaysPerSample", str(s.rays))
-            xml_genmaps.setAttribute("ProximityConeAngle", str(s.spread_angle))
-            xml_genmaps.setAttribute("ProximityLimitRayDistance", bool2str(s.limit_ray_distance))
-            
-            xml_genmaps.appendChild(generateColorXML(name = 'ProximityBackgroundColor', vector = s.bgcolor))
+        if self.write_cage:
+            RayFails.growth.clear()
+            report_caged(self, write_auto_cages(context.scene, lows, fronts, normals))
         
-        elif settings.maptype == 'CAVITY':
-            s = settings.CAVITY_settings
-            xml_genmaps.setAttribute("GenCavity", "true")
-            xml_genmaps.setAttribute("CavityRaysPerSample", str(s.rays))
-            xml_genmaps.setAttribute("CavityJitter", bool2str(s.jitter))
-            xml_genmaps.setAttribute("CavitySearchRadius", str(s.radius))
-            xml_genmaps.setAttribute("CavityContrast", str(s.contrast))
-            xml_genmaps.setAttribute("CavitySteps", str(s.steps))
+        self.report({'INFO'}, 'Rays travel up to %.4f in front and %.4f behind' % (front, rear))
+        return {'FINISHED'}
+
+
+class OBJECT_OT_xnormal_fix_ray_fails(Operator):
+    """ Push the auto cage further out around the faces with ray fails in
+        the last analyzed bake """
+    bl_idname = 'object.xnormal_fix_ray_fails'
+    bl_label = 'Grow cage at ray fails'
+    
+    rebake = BoolProperty(name = 'Bake again',
+                          description = 'Bake again with the grown cage',
+                          default = True)
+    
+    def execute(self, context):
+        settings = context.scene.xnormal_settings
+        failing = RayFails.failing_faces()
+        if not failing:
+            self.report({'INFO'}, 'The last analyzed bake has no ray fails')
+            return {'CANCELLED'}
         
-            xml_genmaps.appendChild(generateColorXML(name = 'CavityBackgroundColor', vector = s.bgcolor))
+        lows, highs = Export.low_poly_objects(settings), Export.find_objects(settings.high_meshes)
+        if not lows or not highs:
+            self.report({'ERROR'}, 'Export the low and high poly objects from this scene first')
+            return {'CANCELLED'}
+        try:
+            from mathutils import bvhtree
+        except ImportError:
+            self.report({'ERROR'}, 'Computing ray distances needs Blender 2.76 or newer')
+            return {'CANCELLED'}
         
-        elif settings.maptype == 'WIREFRAME_RAY_FAILS':
-            s = settings.WIREFRAME_RAY_FAILS_settings
-            xml_genmaps.setAttribute("GenWireRays", "true")
-            xml_genmaps.setAttribute("RenderRayFails", bool2str(s.render_ray_fails))
-            xml_genmaps.setAttribute("RenderWireframe", bool2str(s.render_wireframe))
-            
-            xml_genmaps.appendChild(generateColorXML(name = 'RenderWireframeCol', vector = s.color_wire))
-            xml_genmaps.appendChild(generateColorXML(name = 'RenderCWCol', vector = s.color_cw))
-            xml_genmaps.appendChild(generateColorXML(name = 'RenderSeamCol', vector = s.color_seam))
-            xml_genmaps.appendChild(generateColorXML(name = 'RenderRayFailsCol', vector = s.color_rayfail))
-            xml_genmaps.appendChild(generateColorXML(name = 'RenderWireframeBackgroundColor', vector = s.bgcolor))
-        
-        elif settings.maptype == 'DIRECTION':
-            s = settings.DIRECTION_settings
-            xml_genmaps.setAttribute("GenDirections", "true")
-            xml_genmaps.setAttribute("DirectionsTS", bool2str(s.tangentspace))
-            xml_genmaps.setAttribute("DirectionsSwizzleX", str(s.swizzle_x))
-            xml_genmaps.setAttribute("DirectionsSwizzleY", str(s.swizzle_y))
-            xml_genmaps.setAttribute("DirectionsSwizzleZ", str(s.swizzle_z))
-            xml_genmaps.setAttribute("DirectionsTonemap", str(s.normalization))
-            xml_genmaps.setAttribute("DirectionsMinVal", str(s.min))
-            xml_genmaps.setAttribute("DirectionsMaxVal", str(s.max))
-            
-            xml_genmaps.appendChild(generateColorXML(name = 'VDMBackgroundColor', vector = s.bgcolor))
+        fronts, rears, normals = compute_ray_distances(context, lows, highs)
+        reach = RayDistance.largest(fronts)
+        if not reach:
+            self.report({'ERROR'}, 'No rays could be cast between the low and high poly objects')
+            return {'CANCELLED'}
         
-        elif settings.maptype == 'RADIOSITY_NORMAL':
-            s = settings.RADIOSITY_NORMAL_settings
-            xml_genmaps.setAttribute("GenRadiosityNormals", "true")
-            xml_genmaps.setAttribute("RadiosityNormalsRaysPerSample", str(s.rays))
-            xml_genmaps.setAttribute("RadiosityNormalsDistribution", str(s.distribution))
-            xml_genmaps.setAttribute("RadiosityNormalsConeAngle", str(s.spread_angle))
-            xml_genmaps.setAttribute("RadiosityNormalsBias", str(s.bias))
-            xml_genmaps.setAttribute("RadiosityNormalsLimitRayDistance", bool2str(s.limit_ray_distance))
-            xml_genmaps.setAttribute("RadiosityNormalsAttenConstant", str(s.atten1))
-            xml_genmaps.setAttribute("RadiosityNormalsAttenLinear", str(s.atten2))
-            xml_genmaps.setAttribute("RadiosityNormalsAttenCuadratic", str(s.atten3))
-            xml_genmaps.setAttribute("RadiosityNormalsJitter", bool2str(s.jitter))
-            xml_genmaps.setAttribute("RadiosityNormalsContrast", str(s.contrast))
-            xml_genmaps.setAttribute("RadiosityNormalsEncodeAO", bool2str(s.encode_occlusion))
-            xml_genmaps.setAttribute("RadiosityNormalsCoordSys", str(s.coordinate_system))
-            xml_genmaps.setAttribute("RadiosityNormalsAllowPureOcclusion", bool2str(s.allow_full_occlusion))
-            
-            xml_genmaps.appendChild(generateColorXML(name = 'RadNMBackgroundColor', vector = s.bgcolor))
-            
-        elif settings.maptype == 'VERTEX_COLOR':
-            s = settings.VERTEX_COLOR_settings
-            # Has no further properties
-            xml_genmaps.setAttribute("BakeHighpolyVCols", "true")
-            
-            xml_genmaps.appendChild(generateColorXML(name = 'BakeHighpolyVColsBackgroundCol', vector = s.bgcolor))
+        # Only the vertices around failures move, by a step relative to the
+        # largest distance since their own front ray may have missed.
+        # Growth adds up over fixes.
+        growth = settings.WIREFRAME_RAY_FAILS_settings.cage_growth
+        grown = 0
+        for index, obj in enumerate(lows):
+            vertices = RayDistance.face_vertices(obj, context.scene, failing.get(obj.name, []))
+            step = growth * max(reach, RayFails.min_reach * obj.dimensions.length)
+            fronts[index] = fronts[index] + RayFails.grow(obj.name, len(fronts[index]), vertices, step)
+            grown += len(vertices)
         
-        elif settings.maptype == 'CURVATURE':
-            s = settings.CURVATURE_settings
-            xml_genmaps.setAttribute("GenCurv", "true")
-            xml_genmaps.setAttribute("CurvRaysPerSample", str(s.rays))
-            xml_genmaps.setAttribute("CurvBias", str(s.bias))
-            xml_genmaps.setAttribute("CurvConeAngle", str(s.spread_angle))
-            xml_genmaps.setAttribute("CurvJitter", bool2str(s.jitter))
-            xml_genmaps.setAttribute("CurvSearchDistance", str(s.search_distance))
-            xml_genmaps.setAttribute("CurvTonemap", str(s.tone_mapping))
-            xml_genmaps.setAttribute("CurvDistribution", str(s.distribution))
-            xml_genmaps.setAttribute("CurvAlgorithm", str(s.algorithm))
-            xml_genmaps.setAttribute("CurvSmoothing", bool2str(s.smoothing))
-            
-            xml_genmaps.appendChild(generateColorXML(name = 'CurvBackgroundColor', vector = s.bgcolor))
-            
-        elif settings.maptype == 'DERIVATIVE':
-            s = settings.DERIVATIVE_settings
-            # Has no further properties
-            xml_genmaps.setAttribute("GenDerivNM", "true")
-            
-            xml_genmaps.appendChild(generateColorXML(name = 'DerivNMBackgroundColor', vector = s.bgcolor))
-            
-        # Save XML to disk
-        import tempfile
-        tempdir = tempfile.gettempdir()
-        ensure_dir(tempdir)
-        temporary_xml_file = tempfile.NamedTemporaryFile(mode = 'w', dir = tempdir, delete = False)
-        config.writexml(temporary_xml_file, addindent = "\t", newl = "\n")
-        
-        # Launch xNormal
-        import subprocess
+        settings.ray_distance_front = RayDistance.largest(fronts)
+        settings.ray_distance_rear = RayDistance.largest(rears)
+        report_caged(self, write_auto_cages(context.scene, lows, fronts, normals))
+        
+        self.report({'INFO'}, 'Pushed %d cage vertices further out' % grown)
+        if self.rebake:
+            return bpy.ops.object.bake_with_xnormal()
+        return {'FINISHED'}
+
+
+class OBJECT_OT_bake_with_xnormal(Operator):
+    """ Bake using the external xNormal normal map baking tool """
+    bl_idname = 'object.bake_with_xnormal'
+    bl_label = 'Bake'
+    
+    preview = BoolProperty(name = 'Preview',
+                           description = 'Bake at preview size and ray count',
+                           default = False,
+                           options = {'HIDDEN'})
+    
+    def execute(self, context):
+        
+        settings = context.scene.xnormal_settings
         prefs = getPrefs(context)
-        exe = prefs.path_to_xNormal
-        command = exe + " " + os.path.join(tempdir, temporary_xml_file.name)
-        subprocess.Popen(command)
         
-        temporary_xml_file.close()
+        try:
+            limits = bake_limits(prefs)
+        except ValueError:
+            self.report({'ERROR'}, 'Invalid CPU list: %s' % prefs.cpu_affinity)
+            return {'CANCELLED'}
+        
+        if not report_problems(self, Preflight.check(context.scene, settings, prefs)):
+            return {'CANCELLED'}
+        
+        info = History.job_info(settings)
+        if self.preview:
+            size, rays = int(settings.preview_size), settings.preview_rays
+            info.update(width = min(info['width'], size), height = min(info['height'], size),
+                        anti_aliasing = 1, rays = min(info['rays'], rays), preview = True)
+        
+        # Noisy maps are baked with few rays and filtered afterwards, ray
+        # fails are traced back to their faces and LODs are derived
+        denoising, analyzing, lods = bake_steps(settings, self.preview)
+        if denoising:
+            info['rays'] = min(info['rays'], Denoise.presets[settings.denoise][0])
+        if settings.lod_levels > 0 and not self.preview and not lods:
+            self.report({'WARNING'}, 'LODs can only be derived from TGA, BMP, PNG and EXR output')
+        
+        uv_data = None
+        if settings.udim or denoising or analyzing or lods:
+            uv_data = low_uvs(context.scene, settings)
+            if not len(uv_data[0]):
+                self.report({'ERROR'}, 'Found no low poly UVs, export the low poly objects from this scene first')
+                return {'CANCELLED'}
+        
+        # One config per UDIM tile, or just the one
+        configs = []
+        if settings.udim:
+            for u, v in udim_tiles(uv_data[0] + (settings.low_offset_u, settings.low_offset_v)):
+                config = Config.build_config(settings)
+                Config.apply_tile(config, u, v, Config.tile_output(settings.output, UVRaster.udim(u, v)))
+                configs.append((config, (u, v)))
+        else:
+            configs.append((Config.build_config(settings), None))
+        
+        # Warn about bakes that are likely to blow the budget
+        for problem in over_budget(prefs, History.estimate(history_path(), info)):
+            self.report({'WARNING'}, problem)
+        
+        # Symmetric objects are baked one half at a time
+        halves = mirror = None
+        if settings.symmetry:
+            problem = symmetry_problem(settings)
+            found = export_halves(context.scene, settings) if problem is None else None
+            if problem is not None:
+                self.report({'WARNING'}, problem)
+            elif found is None:
+                self.report({'INFO'}, 'Found no mirror symmetry, baking everything')
+            else:
+                halves, mirror = found
+        
+        # Queue the bakes
+        Launcher.queue.limit = prefs.max_parallel_bakes
+        if analyzing:
+            RayFails.clear()
+        if not self.preview:
+            Journal.compact(journal_path())
+        for config, tile in configs:
+            if self.preview:
+                Config.apply_preview(config, size, rays)
+            if halves:
+                Config.apply_halves(config, halves)
+            queue_map(context.scene, prefs, limits, info, config, uv_data, tile, self.preview, mirror = mirror)
         
         return {'FINISHED'}
 
 
+class OBJECT_OT_xnormal_resume(Operator):
+    """ Bake what was left unfinished when Blender quit or crashed """
+    bl_idname = 'object.xnormal_resume'
+    bl_label = 'Resume bakes'
+    
+    def execute(self, context):
+        settings = context.scene.xnormal_settings
+        prefs = getPrefs(context)
+        path = journal_path()
+        
+        try:
+            limits = bake_limits(prefs)
+        except ValueError:
+            self.report({'ERROR'}, 'Invalid CPU list: %s' % prefs.cpu_affinity)
+            return {'CANCELLED'}
+        
+        import xml.dom.minidom
+        
+        # Bakes of meshes that changed since are out of date. What happens
+        # after baking depends on the map type, so only bakes of the current
+        # one are resumed.
+        entries, dropped, waiting = [], 0, 0
+        for entry in Journal.interrupted(path):
+            if entry['info']['maptype'] != settings.maptype:
+                waiting += 1
+            elif Journal.changed_inputs(entry):
+                Journal.mark(path, entry['id'], 'dropped', reason = 'meshes changed')
+                dropped += 1
+            else:
+                entries.append(entry)
+        
+        uv_data = None
+        if any(bake_steps(settings)) or any(entry['tile'] is not None for entry in entries):
+            uv_data = low_uvs(context.scene, settings)
+        
+        Launcher.queue.limit = prefs.max_parallel_bakes
+        for entry in entries:
+            config = xml.dom.minidom.parseString(entry['config'])
+            tile = tuple(entry['tile']) if entry['tile'] is not None else None
+            queue_map(context.scene, prefs, limits, entry['info'], config, uv_data, tile, entry = entry)
+        
+        if dropped:
+            self.report({'WARNING'}, 'Dropped %d bakes of meshes that changed since' % dropped)
+        if waiting:
+            self.report({'WARNING'}, '%d bakes of other map types are left, select their map type to resume them' % waiting)
+        self.report({'INFO'}, 'Resumed %d bakes' % len(entries))
+        panel_status['journal'] += 1
+        return {'FINISHED'}
+
+
+class OBJECT_OT_xnormal_discard(Operator):
+    """ Forget the bakes that were left unfinished """
+    bl_idname = 'object.xnormal_discard'
+    bl_label = 'Discard'
+    
+    def execute(self, context):
+        path = journal_path()
+        for entry in Journal.interrupted(path):
+            Journal.mark(path, entry['id'], 'dropped', reason = 'discarded')
+        Journal.compact(path)
+        panel_status['journal'] += 1
+        return {'FINISHED'}
+
+
 class OBJECT_PT_xnormal(Panel):
     bl_space_type = 'PROPERTIES'
     bl_region_type = 'WINDOW'
@@ -592,10 +1423,54 @@ class OBJECT_PT_xnormal(Panel):
         row.operator('export_scene.obj_for_xnormal_high', text = 'Export High')
         row.operator('export_scene.obj_for_xnormal_cage', text = 'Export Cage')
         
+        row = col_all.row(align = True)
+        row.operator('export_scene.obj_for_xnormal_pairs', text = 'Export Pairs')
+        row.prop(settings, 'explode')
+        row.prop(settings, 'export_triangulated')
+        
+        row = col_all.row(align = True)
+        if Watch.active():
+            row.operator('object.xnormal_watch', text = 'Stop watching', icon = 'PAUSE')
+        else:
+            row.operator('object.xnormal_watch', text = 'Watch', icon = 'PLAY')
+        row.prop(settings, 'watch_debounce')
+        row.prop(settings, 'preview_size', text = '')
+        
         row = col_all.row(align = True)
         row.prop(settings, 'use_cage')
         
-        col_all.operator('object.bake_with_xnormal', icon = 'RENDER_STILL')
+        row = col_all.row(align = True)
+        row.operator('object.bake_with_xnormal', icon = 'RENDER_STILL')
+        row.operator('object.xnormal_preflight', icon = 'CHECKBOX_HLT')
+        row.prop(settings, 'preflight_strict')
+        
+        # Estimate from previous bakes
+        refresh_status(settings)
+        estimate = panel_status['estimate']
+        if estimate is not None:
+            seconds, memory = estimate
+            col_all.label(text = 'Estimated %s, %s' % (History.format_duration(seconds), History.format_memory(memory)), icon = 'TIME')
+            for problem in over_budget(getPrefs(context), estimate):
+                col_all.label(text = problem, icon = 'ERROR')
+        
+        if Launcher.queue.running or Launcher.queue.pending:
+            col_all.label(text = 'Bakes: %s' % Launcher.queue.summary(), icon = 'TIME')
+        elif Launcher.jobs:
+            job = Launcher.jobs[-1]
+            col_all.label(text = 'Last bake: %s' % job.status(), icon = 'ERROR' if job.killed or job.returncode else 'INFO')
+        
+        conversion = Convert.status()
+        if conversion is not None:
+            level, message = conversion
+            col_all.label(text = message, icon = 'ERROR' if level == 'ERROR' else 'INFO')
+        
+        interrupted = panel_status['interrupted']
+        if interrupted:
+            row = col_all.row(align = True)
+            row.label(text = '%d bakes were interrupted' % interrupted, icon = 'ERROR')
+            row.operator('object.xnormal_resume', icon = 'PLAY')
+            row.operator('object.xnormal_discard', icon = 'CANCEL')
+        
         col_all.operator('object.open_bake_dir', icon = 'FILESEL')
         
         col_all.separator()
@@ -626,6 +1501,19 @@ class OBJECT_PT_xnormal(Panel):
         # Output
         box_general.prop(settings, 'output', text = 'Output')
         
+        # Conversion of the output
+        row = box_general.row(align = True)
+        row.prop(settings, 'convert_formats')
+        if settings.convert_formats:
+            row = box_general.row()
+            row.prop(settings, 'convert_bits', text = '')
+            row.prop(settings, 'convert_keep_original')
+            if 'DDS' in settings.convert_formats:
+                row = box_general.row()
+                row.prop(settings, 'convert_mipmaps')
+                row.prop(settings, 'convert_compress')
+        box_general.prop(settings, 'lod_levels')
+        
         # Show specific options
         col_all.separator()
         box = col_all.box()
@@ -747,6 +1635,20 @@ class OBJECT_PT_xnormal(Panel):
             box.prop(settings.WIREFRAME_RAY_FAILS_settings, 'color_rayfail')
             box.prop(settings.WIREFRAME_RAY_FAILS_settings, 'bgcolor')
             
+            row = box.row()
+            row.prop(settings.WIREFRAME_RAY_FAILS_settings, 'analyze')
+            row.prop(settings.WIREFRAME_RAY_FAILS_settings, 'cage_growth')
+            summary = RayFails.summary()
+            if summary is not None:
+                failed, covered, percent, hotspots = summary
+                box.label(text = 'Ray fails: %d of %d pixels (%.2f%%)' % (failed, covered, percent),
+                          icon = 'ERROR' if failed else 'FILE_TICK')
+                for hotspot in hotspots:
+                    box.label(text = '%s, island %d: %d pixels (%.1f%%) on %d faces' %
+                              (hotspot['name'], hotspot['island'], hotspot['failed'], hotspot['percent'], hotspot['faces']))
+                if failed:
+                    box.operator('object.xnormal_fix_ray_fails')
+            
         elif settings.maptype == 'DIRECTION':    
             row = box.row(align = True)
             row.label(text = 'Swizzle Coordinates')
@@ -814,6 +1716,13 @@ class OBJECT_PT_xnormal(Panel):
         elif settings.maptype == 'DERIVATIVE':   
             box.prop(settings.DERIVATIVE_settings, 'bgcolor')
         
+        if settings.maptype in Denoise.maptypes:
+            box.prop(settings, 'denoise')
+        if settings.maptype in RawCache.maptypes:
+            row = box.row()
+            row.active = RawCache.cacheable(settings)
+            row.prop(settings, 'raw_cache')
+        
         box.operator('object.bake_with_xnormal', icon = 'RENDER_STILL')
         
         #
@@ -826,13 +1735,36 @@ class OBJECT_PT_xnormal(Panel):
         box.prop(settings, 'low_scale')
         box.prop(settings, 'low_match_uvs')
         box.prop(settings, 'low_normals') 
+        box.prop(settings, 'udim')
         row = box.row(align = True)
         row.prop(settings, 'low_offset_u')
         row.prop(settings, 'low_offset_v')
-        box.prop(settings, 'low_path')
+        box.prop(settings, 'separate_lows')
+        box.prop(settings, 'symmetry')
+        if settings.low_meshes:
+            col = box.column(align = True)
+            for mesh in settings.low_meshes:
+                row = col.row()
+                row.label(text = mesh.name, icon = 'MESH_DATA')
+                cage_path = Config.cage_file(settings, mesh)
+                row.label(text = os.path.basename(cage_path) if cage_path else 'No cage')
+                row.prop(mesh, 'scale')
+                row.prop(mesh, 'normals', text = '')
+            box.operator('object.clear_xnormal_low_meshes')
+        else:
+            box.prop(settings, 'low_path')
+            
+            box.prop(settings, 'use_cage')
+            box.prop(settings, 'cage_path')
+        if settings.auto_cage_path or any(mesh.auto_cage_path for mesh in settings.low_meshes):
+            box.prop(settings, 'use_auto_cage')
         
-        box.prop(settings, 'use_cage')
-        box.prop(settings, 'cage_path')
+        row = box.row(align = True)
+        row.prop(settings, 'ray_distance_front')
+        row.prop(settings, 'ray_distance_rear')
+        row = box.row(align = True)
+        row.operator('object.xnormal_ray_distances')
+        row.prop(settings, 'ray_distance_margin')
         
         row = box.row(align = True)
         row.operator('export_scene.obj_for_xnormal_low')
@@ -847,8 +1779,34 @@ class OBJECT_PT_xnormal(Panel):
         box.prop(settings, 'high_scale')
         box.prop(settings, 'high_ignore_per_vertex_color')
         box.prop(settings, 'high_normals')
-        box.prop(settings, 'high_path')
+        if settings.high_meshes:
+            col = box.column(align = True)
+            for mesh in settings.high_meshes:
+                row = col.row()
+                row.label(text = mesh.name, icon = 'MESH_DATA')
+                row.label(text = '%d tris' % mesh.triangles)
+            box.operator('object.clear_xnormal_high_meshes')
+        else:
+            box.prop(settings, 'high_path')
         box.operator('export_scene.obj_for_xnormal_high')
+        
+        #
+        # Show options for automatic pairing
+        #
+        
+        col_all.separator()
+        box = col_all.box()
+        box.label(text = 'Automatic pairing:')
+        box.prop(settings, 'pairing')
+        row = box.row(align = True)
+        row.prop(settings, 'low_suffix', text = '')
+        row.prop(settings, 'high_suffix', text = '')
+        row.prop(settings, 'cage_suffix', text = '')
+        box.prop(settings, 'selected_to_active')
+        row = box.row()
+        row.prop(settings, 'explode')
+        row.prop(settings, 'explode_spacing')
+        box.operator('export_scene.obj_for_xnormal_pairs')
 
 
 def register():
@@ -857,7 +1815,16 @@ def register():
     register_class(OBJECT_OT_export_for_xnormal_low)
     register_class(OBJECT_OT_export_for_xnormal_cage)
     register_class(OBJECT_OT_export_for_xnormal_high)
+    register_class(OBJECT_OT_clear_xnormal_low_meshes)
+    register_class(OBJECT_OT_clear_xnormal_high_meshes)
+    register_class(OBJECT_OT_export_pairs_for_xnormal)
+    register_class(OBJECT_OT_xnormal_preflight)
+    register_class(OBJECT_OT_xnormal_ray_distances)
+    register_class(OBJECT_OT_xnormal_fix_ray_fails)
     register_class(OBJECT_OT_bake_with_xnormal)
+    register_class(OBJECT_OT_xnormal_resume)
+    register_class(OBJECT_OT_xnormal_discard)
+    register_class(OBJECT_OT_xnormal_watch)
     register_class(OBJECT_PT_xnormal)
     
 
@@ -865,10 +1832,21 @@ def unregister():
     unregister_class(BakeXNormalPreferences)
     unregister_class(OBJECT_PT_xnormal)
     unregister_class(OBJECT_OP_open_bake_dir)
+    unregister_class(OBJECT_OT_xnormal_preflight)
+    unregister_class(OBJECT_OT_xnormal_ray_distances)
+    unregister_class(OBJECT_OT_xnormal_fix_ray_fails)
     unregister_class(OBJECT_OT_bake_with_xnormal)
+    unregister_class(OBJECT_OT_xnormal_resume)
+    unregister_class(OBJECT_OT_xnormal_discard)
+    unregister_class(OBJECT_OT_xnormal_watch)
+    Watch.stop()
+    Convert.shutdown()
     unregister_class(OBJECT_OT_export_for_xnormal_low)
     unregister_class(OBJECT_OT_export_for_xnormal_cage)
     unregister_class(OBJECT_OT_export_for_xnormal_high)
+    unregister_class(OBJECT_OT_clear_xnormal_low_meshes)
+    unregister_class(OBJECT_OT_clear_xnormal_high_meshes)
+    unregister_class(OBJECT_OT_export_pairs_for_xnormal)
 
 if __name__ == '__main__':
     register()
\ No newline at end of file
@@ -0,0 +1,115 @@
+""" Bake configs built by Config with the stand-in baker, without Blender.
+    Run with `python -m pytest tests` from the repository root. """
+
+import os
+import sys
+import struct
+import types
+import importlib
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+simulator = os.path.join(root, 'xNormalSimulator.py')
+
+# Import Config as part of the add-on package without running its
+# __init__, which needs Blender
+package = types.ModuleType('blender_xnormal')
+package.__path__ = [root]
+sys.modules.setdefault('blender_xnormal', package)
+Config = importlib.import_module('blender_xnormal.Config')
+
+
+def bake_settings(directory, maptype, **values):
+    """ BakeXNormalSettings with their defaults, baking `maptype` into a TGA
+        in `directory` """
+    for name in ('low.obj', 'high.obj'):
+        with open(os.path.join(directory, name), 'w') as obj:
+            obj.write('v 0 0 0\nv 1 0 0\nv 0 1 0\nvt 0 0\nvt 1 0\nvt 0 1\nf 1/1 2/2 3/3\n')
+
+    settings = SimpleNamespace(maptype = maptype,
+                               high_meshes = [], high_path = os.path.join(directory, 'high.obj'),
+                               high_ignore_per_vertex_color = True, high_normals = 'UseExportedNormals', high_scale = 1,
+                               low_meshes = [], low_path = os.path.join(directory, 'low.obj'),
+                               low_normals = 'UseExportedNormals', low_scale = 1, low_match_uvs = False,
+                               low_offset_u = 0, low_offset_v = 0,
+                               use_cage = False, cage_path = '', use_auto_cage = False, auto_cage_path = '',
+                               ray_distance_front = 0, ray_distance_rear = 0,
+                               width = '64', height = '32', padding = 4, bucket_size = '16', anti_aliasing = '1',
+                               use_closest_hit = True, discard_back_faces = True,
+                               output = os.path.join(directory, 'out.tga'),
+                               NORMAL_settings = SimpleNamespace(bgcolor = (0.5, 0.5, 1), swizzle_x = 'X+', swizzle_y = 'Y+',
+                                                                 swizzle_z = 'Z+', tangentspace = True),
+                               AMBIENT_OCCLUSION_settings = SimpleNamespace(bgcolor = (1, 1, 1), rays = 128, bias = 0.08,
+                                                                            spread_angle = 162, limit_ray_distance = False,
+                                                                            distribution = 'Uniform', jitter = False,
+                                                                            color_occluded = (0, 0, 0),
+                                                                            color_unoccluded = (1, 1, 1),
+                                                                            atten1 = 1, atten2 = 0, atten3 = 0,
+                                                                            ignore_backfaces = False,
+                                                                            allow_full_occlusion = True))
+    for name, value in values.items():
+        setattr(settings, name, value)
+    return settings
+
+
+def simulate(config, *options):
+    path = Config.write_config(config)
+    try:
+        return subprocess.run([sys.executable, simulator, path, '--duration', '0'] + list(options),
+                              stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+    finally:
+        os.remove(path)
+
+
+def tga_size(path):
+    with open(path, 'rb') as tga:
+        return struct.unpack('<HH', tga.read(18)[12:16])
+
+
+@pytest.mark.parametrize('maptype', ['NORMAL', 'AMBIENT_OCCLUSION'])
+def test_bake(tmpdir, maptype):
+    config = Config.build_config(bake_settings(str(tmpdir), maptype))
+    result = simulate(config)
+    assert result.returncode == 0, result.stderr
+
+    output = Config.output_file(config, maptype)
+    assert os.path.basename(output) == {'NORMAL': 'out_normals.tga', 'AMBIENT_OCCLUSION': 'out_occlusion.tga'}[maptype]
+    assert tga_size(output) == (64, 32)
+    assert 'bucket 8 of 8' in result.stdout
+
+
+def test_tile(tmpdir):
+    settings = bake_settings(str(tmpdir), 'NORMAL')
+    config = Config.build_config(settings)
+    Config.apply_tile(config, 1, 0, Config.tile_output(settings.output, 1002))
+    result = simulate(config)
+    assert result.returncode == 0, result.stderr
+
+    # xNormal adds the map suffix after the tile number, the add-on moves it
+    assert os.path.isfile(os.path.join(str(tmpdir), 'out.1002_normals.tga'))
+    assert os.path.basename(Config.tile_image(settings.output, 'NORMAL', 1002)) == 'out_normals.1002.tga'
+
+
+def test_preview(tmpdir):
+    config = Config.build_config(bake_settings(str(tmpdir), 'AMBIENT_OCCLUSION', width = '512', height = '512'))
+    Config.apply_preview(config, 128, 16)
+    assert simulate(config).returncode == 0
+    assert tga_size(Config.output_file(config, 'AMBIENT_OCCLUSION')) == (128, 128)
+
+
+def test_failure(tmpdir):
+    config = Config.build_config(bake_settings(str(tmpdir), 'NORMAL'))
+    result = simulate(config, '--failure-rate', '1', '--memory', '8')
+    assert result.returncode == 1
+    assert 'Simulated failure' in result.stderr
+    assert not os.path.exists(Config.output_file(config, 'NORMAL'))
+
+
+def test_invalid(tmpdir):
+    config = Config.build_config(bake_settings(str(tmpdir), 'NORMAL', width = '100'))
+    result = simulate(config)
+    assert result.returncode == 2
+    assert 'Width' in result.stderr
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+""" A stand-in for the xNormal executable, for testing and benchmarking the
+    add-on where xNormal isn't available. Point 'Path to xNormal' at this
+    file.
+
+    It validates the settings file the add-on generates, pretends to bake
+    and writes an output image of the configured size filled with the map's
+    background color. The add-on launches the baker with nothing but the
+    settings file, so the simulated behaviour is set through environment
+    variables (or the matching command line options):
+
+    XNORMAL_SIM_DURATION          seconds every bake takes (default 1)
+    XNORMAL_SIM_SECONDS_PER_MRAY  extra seconds per million samples * rays
+    XNORMAL_SIM_MEMORY            MB of memory to hold while baking
+    XNORMAL_SIM_FAILURE_RATE      probability of a bake failing halfway (0-1)
+"""
+
+import os
+import sys
+import time
+import zlib
+import random
+import struct
+import argparse
+from xml.dom.minidom import parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import Schema
+
+
+class InvalidSettings(Exception):
+    pass
+
+
+def is_bool(value):
+    return value in ('true', 'false')
+
+
+def check_int(errors, element, name, allowed = None):
+    value = element.getAttribute(name)
+    try:
+        number = int(value)
+    except ValueError:
+        errors.append('%s.%s is not an integer: %r' % (element.tagName, name, value))
+        return 0
+    if allowed is not None and number not in allowed:
+        errors.append('%s.%s must be one of %s, not %d' % (element.tagName, name, sorted(allowed), number))
+    return number
+
+
+def check_file(errors, element, name):
+    path = element.getAttribute(name)
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        errors.append('%s.%s is missing or empty: %s' % (element.tagName, name, path))
+
+
+def validate(document):
+    """ Check the settings against what the add-on may generate. Returns
+        (maptype, generate maps element) or raises InvalidSettings. """
+
+    errors = []
+    settings = document.documentElement
+    if settings.tagName != 'Settings':
+        raise InvalidSettings(['The root element must be Settings, not %s' % settings.tagName])
+
+    for model, allowed in Schema.mesh_attributes.items():
+        models = settings.getElementsByTagName(model)
+        meshes = models[0].getElementsByTagName('Mesh') if models else []
+        if not meshes:
+            errors.append('%s has no Mesh' % model)
+        for mesh in meshes:
+            unknown = set(mesh.attributes.keys()) - allowed
+            if unknown:
+                errors.append('Unknown %s Mesh attributes: %s' % (model, ', '.join(sorted(unknown))))
+            check_file(errors, mesh, 'File')
+            if mesh.getAttribute('UseCage') == 'true':
+                check_file(errors, mesh, 'CageFile')
+            for name, value in mesh.attributes.items():
+                if name in ('IgnorePerVertexColor', 'MatchUVs', 'UseCage') and not is_bool(value):
+                    errors.append('%s Mesh %s is not true or false: %r' % (model, name, value))
+
+    generate = settings.getElementsByTagName('GenerateMaps')
+    if not generate:
+        raise InvalidSettings(errors + ['There is no GenerateMaps element'])
+    generate = generate[0]
+
+    # Exactly one map is baked per run
+    enabled = [maptype for maptype in Schema.maps if generate.getAttribute(Schema.flag(maptype)) == 'true']
+    if len(enabled) != 1:
+        raise InvalidSettings(errors + ['Expected one map to generate, got %s' % (enabled or 'none')])
+    maptype = enabled[0]
+    flag, suffix, attributes, colors = Schema.maps[maptype]
+
+    unknown = set(generate.attributes.keys()) - Schema.common_attributes - attributes - set((flag,))
+    if unknown:
+        errors.append('Attributes not used by %s: %s' % (flag, ', '.join(sorted(unknown))))
+
+    sizes = set(2 ** n for n in range(4, 14))
+    check_int(errors, generate, 'Width', sizes)
+    check_int(errors, generate, 'Height', sizes)
+    check_int(errors, generate, 'AA', set((1, 2, 4)))
+    check_int(errors, generate, 'BucketSize', set((16, 32, 64, 128, 256, 512)))
+    check_int(errors, generate, 'EdgePadding')
+    for name, value in generate.attributes.items():
+        if value in ('True', 'False'):
+            errors.append('GenerateMaps.%s must be lowercase true or false: %r' % (name, value))
+
+    for child in generate.childNodes:
+        if child.nodeType != child.ELEMENT_NODE:
+            continue
+        if child.tagName not in colors:
+            errors.append('Color %s is not used by %s' % (child.tagName, flag))
+        for channel in 'RGB':
+            check_int(errors, child, channel, set(range(256)))
+
+    output = generate.getAttribute('File')
+    if not os.path.isdir(os.path.dirname(os.path.abspath(output))):
+        errors.append('The output directory does not exist: %s' % output)
+
+    if errors:
+        raise InvalidSettings(errors)
+    return maptype, generate
+
+
+def background_color(generate, maptype):
+    for child in generate.childNodes:
+        if child.nodeType == child.ELEMENT_NODE and 'Background' in child.tagName:
+            return tuple(int(child.getAttribute(channel)) for channel in 'RGB')
+    return (127, 127, 255) if maptype == 'NORMAL' else (0, 0, 0)
+
+
+def write_tga(path, width, height, color):
+    with open(path, 'wb') as tga:
+        tga.write(struct.pack('<BBBHHBHHHHBB', 0, 0, 2, 0, 0, 0, 0, 0, width, height, 24, 0))
+        tga.write(bytes(reversed(color)) * (width * height))
+
+
+def write_png(path, width, height, color):
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    row = b'\0' + bytes(color) * width
+    with open(path, 'wb') as png:
+        png.write(b'\x89PNG\r\n\x1a\n')
+        png.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        png.write(chunk(b'IDAT', zlib.compress(row * height)))
+        png.write(chunk(b'IEND', b''))
+
+
+def write_bmp(path, width, height, color):
+    row = bytes(reversed(color)) * width
+    row += b'\0' * (-len(row) % 4)
+    with open(path, 'wb') as bmp:
+        bmp.write(struct.pack('<2sIHHI', b'BM', 54 + len(row) * height, 0, 0, 54))
+        bmp.write(struct.pack('<IiiHHIIiiII', 40, width, height, 1, 24, 0, len(row) * height, 2835, 2835, 0, 0))
+        bmp.write(row * height)
+
+
+def write_exr(path, width, height, color):
+    def attribute(name, kind, value):
+        return name.encode() + b'\0' + kind.encode() + b'\0' + struct.pack('<i', len(value)) + value
+
+    channels = b''.join(name + b'\0' + struct.pack('<iBBBBii', 2, 0, 0, 0, 0, 1, 1) for name in (b'B', b'G', b'R'))
+    window = struct.pack('<iiii', 0, 0, width - 1, height - 1)
+    header = (b'\x76\x2f\x31\x01' + struct.pack('<i', 2) +
+              attribute('channels', 'chlist', channels + b'\0') +
+              attribute('compression', 'compression', b'\0') +
+              attribute('dataWindow', 'box2i', window) +
+              attribute('displayWindow', 'box2i', window) +
+              attribute('lineOrder', 'lineOrder', b'\0') +
+              attribute('pixelAspectRatio', 'float', struct.pack('<f', 1)) +
+              attribute('screenWindowCenter', 'v2f', struct.pack('<ff', 0, 0)) +
+              attribute('screenWindowWidth', 'float', struct.pack('<f', 1)) +
+              b'\0')
+
+    # Uncompressed, one scanline per block, blue, green and red floats
+    line = b''.join(struct.pack('<f', value / 255.0) * width for value in reversed(color))
+    block = 8 + len(line)
+    with open(path, 'wb') as exr:
+        exr.write(header)
+        for y in range(height):
+            exr.write(struct.pack('<Q', len(header) + 8 * height + y * block))
+        for y in range(height):
+            exr.write(struct.pack('<ii', y, len(line)) + line)
+
+
+writers = {'.tga': write_tga,
+           '.png': write_png,
+           '.bmp': write_bmp,
+           '.exr': write_exr,
+           }
+
+
+def simulate(settings_path, options):
+    try:
+        maptype, generate = validate(parse(settings_path))
+    except InvalidSettings as error:
+        for message in error.args[0]:
+            print('Invalid settings: %s' % message, file = sys.stderr)
+        return 2
+    except Exception as error:
+        print('Cannot read settings: %s' % error, file = sys.stderr)
+        return 2
+
+    width, height = int(generate.getAttribute('Width')), int(generate.getAttribute('Height'))
+    aa = int(generate.getAttribute('AA'))
+    bucket = int(generate.getAttribute('BucketSize'))
+    rays = max([int(value) for name, value in generate.attributes.items() if name.endswith('RaysPerSample')] or [1])
+
+    output = Schema.output_path(generate.getAttribute('File'), maptype)
+    writer = writers.get(os.path.splitext(output)[1].lower())
+    if writer is None:
+        print('Unsupported output format: %s' % output, file = sys.stderr)
+        return 2
+
+    duration = options.duration + options.seconds_per_mray * width * height * aa * aa * rays / 1e6
+    fail_at = random.random() < options.failure_rate and 0.5
+
+    # Touch every page so the memory really is resident
+    memory = bytearray(options.memory * 1024 * 1024)
+    memory[::4096] = b'\1' * len(range(0, len(memory), 4096))
+
+    buckets = max(1, ((width + bucket - 1) // bucket) * ((height + bucket - 1) // bucket))
+    for index in range(buckets):
+        progress = float(index + 1) / buckets
+        if fail_at and progress > fail_at:
+            print('Simulated failure at %d%%' % (progress * 100), file = sys.stderr)
+            return 1
+        time.sleep(duration / buckets)
+        print('Rendering %s: bucket %d of %d (%d%%)' % (Schema.flag(maptype), index + 1, buckets, progress * 100))
+        sys.stdout.flush()
+
+    writer(output, width, height, background_color(generate, maptype))
+    print('Wrote %s' % output)
+    return 0
+
+
+def main(argv):
+    environment = os.environ.get
+    parser = argparse.ArgumentParser(description = 'Pretend to be xNormal')
+    parser.add_argument('settings', help = 'The xNormal settings file')
+    parser.add_argument('--duration', type = float, default = float(environment('XNORMAL_SIM_DURATION', 1)))
+    parser.add_argument('--seconds-per-mray', type = float, default = float(environment('XNORMAL_SIM_SECONDS_PER_MRAY', 0)))
+    parser.add_argument('--memory', type = int, default = int(environment('XNORMAL_SIM_MEMORY', 0)))
+    parser.add_argument('--failure-rate', type = float, default = float(environment('XNORMAL_SIM_FAILURE_RATE', 0)))
+    options = parser.parse_args(argv)
+    return simulate(options.settings, options)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))